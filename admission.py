@@ -0,0 +1,124 @@
+# admission.py - Control de admisión de /chat (degradación por niveles bajo carga)
+"""
+Con cada turno se cuentan los /chat en curso y se guarda su latencia (p95 de los
+últimos ADMISION_VENTANA_SEC segundos). Según umbrales configurables se baja de nivel:
+  1 SIN_LLM    la respuesta va sin humanizar con Gemini (el borrador de reglas)
+  2 SOLO_CACHE las búsquedas se responden desde el catálogo en memoria, sin ir a MySQL
+  3 RECHAZO    /chat responde 503 con Retry-After sin ejecutar el turno
+El nivel es el mayor de los dos criterios (en curso, latencia). Se recupera solo: al
+bajar la carga o al envejecer las muestras lentas.
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Sequence, Tuple
+
+from config import ADMISION_EN_CURSO, ADMISION_LATENCIA_MS, ADMISION_VENTANA_SEC
+
+logger = logging.getLogger("chatbot-api")
+
+NORMAL, SIN_LLM, SOLO_CACHE, RECHAZO = 0, 1, 2, 3
+MODOS = ("normal", "sin_llm", "solo_cache", "rechazo")
+
+# Latencias recientes guardadas como máximo (el p95 se calcula sobre las de la ventana)
+_MUESTRAS = 200
+
+
+def _nivel(valor: float, umbrales: Sequence[float]) -> int:
+    """Mayor nivel cuyo umbral se alcanza (umbral 0 = ese paso desactivado)."""
+    n = NORMAL
+    for i, u in enumerate(umbrales[:RECHAZO]):
+        if u > 0 and valor >= u:
+            n = i + 1
+    return n
+
+
+class Admision:
+    def __init__(self, en_curso: Sequence[int], latencia_ms: Sequence[float], ventana: float) -> None:
+        self.umbral_en_curso = list(en_curso)
+        self.umbral_latencia = list(latencia_ms)
+        self.ventana = ventana
+        self._lock = threading.Lock()
+        self._en_curso = 0
+        # (instante, ms) de los turnos terminados
+        self._latencias: Deque[Tuple[float, float]] = deque(maxlen=_MUESTRAS)
+        self._nivel_latencia = NORMAL
+        self._p95 = None
+        self._ultimo = NORMAL
+        self._stats = {"admitidas": 0, "rechazadas": 0, "sin_llm": 0, "solo_cache": 0}
+
+    def _reciente(self) -> bool:
+        """Hay turnos terminados dentro de la ventana (si no, las muestras lentas ya no cuentan)."""
+        return bool(self._latencias) and self._latencias[-1][0] >= time.monotonic() - self.ventana
+
+    @property
+    def nivel(self) -> int:
+        """Nivel actual (0..3)."""
+        lat = self._nivel_latencia if self._reciente() else NORMAL
+        return max(_nivel(self._en_curso, self.umbral_en_curso), lat)
+
+    def entrar(self) -> int:
+        """Registra un /chat que llega. Devuelve el nivel; con RECHAZO no cuenta como en curso."""
+        with self._lock:
+            self._en_curso += 1
+            nivel = self.nivel
+            if nivel >= RECHAZO:
+                self._en_curso -= 1
+                self._stats["rechazadas"] += 1
+            else:
+                self._stats["admitidas"] += 1
+        self._aviso(nivel)
+        return nivel
+
+    def salir(self, ms: float) -> None:
+        """Un /chat admitido terminó en ms milisegundos."""
+        ahora = time.monotonic()
+        with self._lock:
+            self._en_curso -= 1
+            self._latencias.append((ahora, ms))
+            while self._latencias and self._latencias[0][0] < ahora - self.ventana:
+                self._latencias.popleft()
+            ms_ventana = sorted(m for _, m in self._latencias)
+            self._p95 = ms_ventana[min(len(ms_ventana) - 1, int(0.95 * len(ms_ventana)))]
+            self._nivel_latencia = _nivel(self._p95, self.umbral_latencia)
+
+    def permite_llm(self) -> bool:
+        with self._lock:
+            if self.nivel >= SIN_LLM:
+                self._stats["sin_llm"] += 1
+                return False
+        return True
+
+    def solo_cache(self) -> bool:
+        with self._lock:
+            if self.nivel >= SOLO_CACHE:
+                self._stats["solo_cache"] += 1
+                return True
+        return False
+
+    def _aviso(self, nivel: int) -> None:
+        if nivel != self._ultimo:
+            logger.warning(
+                "Admisión /chat: %s -> %s (%d en curso, p95 %s ms)",
+                MODOS[self._ultimo], MODOS[nivel], self._en_curso, self._p95,
+            )
+            self._ultimo = nivel
+
+    def estado(self) -> Dict[str, Any]:
+        nivel = self.nivel
+        return {
+            "nivel": nivel,
+            "modo": MODOS[nivel],
+            "en_curso": self._en_curso,
+            "latencia_p95_ms": round(self._p95, 1) if self._p95 is not None and self._reciente() else None,
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            contadores = dict(self._stats)
+        return {**contadores, **self.estado(), "umbral_en_curso": self.umbral_en_curso, "umbral_latencia_ms": self.umbral_latencia}
+
+
+controlador = Admision(ADMISION_EN_CURSO, ADMISION_LATENCIA_MS, ADMISION_VENTANA_SEC)
@@ -0,0 +1,184 @@
+# bulkheads.py - Ejecutores acotados por dependencia externa (BD, PHP, Gemini)
+"""
+Cada dependencia tiene su propio grupo de hilos y una cola con tope: si Gemini se pone
+lento solo se llenan los hilos "llm", y los saludos, /health o el agendamiento siguen
+teniendo los suyos. Con la cola llena, la tarea se rechaza enseguida (Saturado) en vez
+de esperar detrás de las demás. run() además puede dejar de esperar una tarea
+(timeout): el que llama sigue con su alternativa y la tarea termina sola en su hilo.
+Los turnos de /chat (reglas y consultas a la BD) corren en "db"; las llamadas al PHP en
+"php", la humanización con Gemini en "llm" y el entrenamiento del clasificador en
+"entrenamiento" (un solo hilo). Un turno no espera a Gemini desde un hilo de "db": suelta
+ese hilo y la espera la hace el endpoint en el event loop (main._turno).
+"""
+
+import asyncio
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+from config import (
+    BULKHEAD_DB_COLA,
+    BULKHEAD_DB_HILOS,
+    BULKHEAD_LLM_COLA,
+    BULKHEAD_LLM_HILOS,
+    BULKHEAD_PHP_COLA,
+    PHP_MAX_CONCURRENCY,
+)
+
+# Esperas en cola recientes (ms) por bulkhead para p50/p95
+_MUESTRAS = 200
+
+
+class Saturado(Exception):
+    """El bulkhead tiene todos sus hilos ocupados y la cola llena (o la tarea esperó demasiado)."""
+
+    def __init__(self, nombre: str, motivo: str) -> None:
+        super().__init__(f"{nombre}: {motivo}")
+        self.nombre = nombre
+
+
+def _percentil(ms: List[float], p: float) -> Optional[float]:
+    if not ms:
+        return None
+    ms = sorted(ms)
+    return round(ms[min(len(ms) - 1, int(p * len(ms)))], 1)
+
+
+class Bulkhead:
+    def __init__(self, nombre: str, hilos: int, cola: int) -> None:
+        self.nombre = nombre
+        self.hilos = max(hilos, 1)
+        self.cola = max(cola, 0)
+        self._pool = ThreadPoolExecutor(max_workers=self.hilos, thread_name_prefix=f"bulkhead-{nombre}")
+        self._lock = threading.Lock()
+        # Tareas aceptadas que no han terminado (en cola + en curso)
+        self._pendientes = 0
+        self._en_curso = 0
+        self._esperas: Deque[float] = deque(maxlen=_MUESTRAS)
+        self._stats = {"aceptadas": 0, "rechazadas": 0, "caducadas": 0, "abandonadas": 0, "errores": 0}
+
+    def submit(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Future:
+        """Encola fn(*args, **kwargs). Lanza Saturado si los hilos y la cola están llenos."""
+        with self._lock:
+            if self._pendientes >= self.hilos + self.cola:
+                self._stats["rechazadas"] += 1
+                raise Saturado(self.nombre, f"{self._en_curso} en curso y {self._pendientes - self._en_curso} en cola")
+            self._pendientes += 1
+            self._stats["aceptadas"] += 1
+        encolada = time.perf_counter()
+
+        def tarea() -> Any:
+            with self._lock:
+                self._en_curso += 1
+                self._esperas.append((time.perf_counter() - encolada) * 1000)
+            try:
+                return fn(*args, **kwargs)
+            except BaseException:
+                with self._lock:
+                    self._stats["errores"] += 1
+                raise
+            finally:
+                with self._lock:
+                    self._en_curso -= 1
+                    self._pendientes -= 1
+
+        try:
+            fut = self._pool.submit(tarea)
+        except RuntimeError:  # ejecutor cerrado (apagando)
+            with self._lock:
+                self._pendientes -= 1
+            raise Saturado(self.nombre, "cerrado")
+        fut.add_done_callback(self._cancelada)
+        return fut
+
+    def _cancelada(self, fut: Future) -> None:
+        # Una tarea cancelada antes de empezar nunca pasa por el finally de tarea()
+        if fut.cancelled():
+            with self._lock:
+                self._pendientes -= 1
+                self._stats["caducadas"] += 1
+
+    def run(
+        self,
+        fn: Callable[..., Any],
+        *args: Any,
+        espera: Optional[float] = None,
+        timeout: Optional[float] = None,
+        **kwargs: Any,
+    ) -> Any:
+        """
+        Ejecuta fn en el bulkhead y devuelve su resultado (o relanza su excepción).
+        espera: segundos máximos en cola; si no empezó, se cancela y lanza Saturado.
+        timeout: segundos máximos de espera total; lanza TimeoutError y la tarea sigue en su hilo.
+        """
+        fut = self.submit(fn, *args, **kwargs)
+        t0 = time.monotonic()
+        try:
+            if espera is not None:
+                try:
+                    return fut.result(timeout=espera if timeout is None else min(espera, timeout))
+                except FutureTimeout:
+                    if fut.cancel():
+                        raise Saturado(self.nombre, f"sin hilo libre en {espera:g}s")
+            return fut.result(timeout=None if timeout is None else max(timeout - (time.monotonic() - t0), 0.0))
+        except FutureTimeout:
+            if fut.done():  # el TimeoutError es de fn, no de la espera
+                raise
+            with self._lock:
+                self._stats["abandonadas"] += 1
+            raise TimeoutError(f"{self.nombre}: sin respuesta en {timeout:g}s")
+
+    async def ejecutar(self, fn: Callable[..., Any], *args: Any, timeout: Optional[float] = None, **kwargs: Any) -> Any:
+        """
+        Versión para endpoints async: el event loop no se bloquea mientras fn corre.
+        timeout: como en run(); si la tarea no llegó a empezar se cancela y lanza Saturado.
+        """
+        fut = self.submit(fn, *args, **kwargs)
+        if timeout is None:
+            return await asyncio.wrap_future(fut)
+        try:
+            return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(fut)), timeout)
+        except asyncio.TimeoutError:
+            if fut.done():  # terminó justo al vencer la espera (o el TimeoutError es de fn)
+                return fut.result()
+            if fut.cancel():
+                raise Saturado(self.nombre, f"sin hilo libre en {timeout:g}s")
+            with self._lock:
+                self._stats["abandonadas"] += 1
+            raise TimeoutError(f"{self.nombre}: sin respuesta en {timeout:g}s")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            esperas = list(self._esperas)
+            return {
+                **self._stats,
+                "hilos": self.hilos,
+                "cola_max": self.cola,
+                "en_curso": self._en_curso,
+                "en_cola": self._pendientes - self._en_curso,
+                "espera_p50_ms": _percentil(esperas, 0.5),
+                "espera_p95_ms": _percentil(esperas, 0.95),
+            }
+
+    def shutdown(self) -> None:
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+db = Bulkhead("db", BULKHEAD_DB_HILOS, BULKHEAD_DB_COLA)
+php = Bulkhead("php", PHP_MAX_CONCURRENCY, BULKHEAD_PHP_COLA)
+llm = Bulkhead("llm", BULKHEAD_LLM_HILOS, BULKHEAD_LLM_COLA)
+# Entrenamiento del clasificador (POST /entrenamiento/modelo): uno a la vez, sin cola
+entrenamiento = Bulkhead("entrenamiento", 1, 0)
+
+_TODOS = (db, php, llm, entrenamiento)
+
+
+def stats() -> Dict[str, Any]:
+    return {b.nombre: b.stats() for b in _TODOS}
+
+
+def shutdown() -> None:
+    for b in _TODOS:
+        b.shutdown()
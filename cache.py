@@ -0,0 +1,112 @@
+# cache.py - Caché de resultados de BD con invalidación explícita
+"""
+Resultados de búsquedas (propiedades, proyectos) guardados hasta que el panel PHP
+avisa de un cambio por POST /cache/invalidate (o el detector de cambios lo ve). Cada
+ámbito lleva un contador de generación: una consulta que empezó antes de invalidar no
+puede guardar su resultado (ya viejo) después. Solo se activa si hay token
+(CACHE_INVALIDATE_TOKEN): sin webhook no hay forma de vaciarla antes del siguiente turno.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Tuple
+
+SCOPES = ("propiedades", "proyectos")
+
+# Valor centinela: None es un resultado válido (ej. get_propiedad_by_id de un id inactivo)
+MISS = object()
+
+
+class ResultCache:
+    def __init__(self, enabled: bool, ttl: float = 0.0, max_items: int = 5000) -> None:
+        self.enabled = enabled
+        # Tope de vida por si se pierde un aviso del panel (0 = sin tope)
+        self.ttl = ttl
+        self.max_items = max_items
+        self._lock = threading.Lock()
+        self._items: "OrderedDict[Tuple[str, Hashable], Tuple[float, Any]]" = OrderedDict()
+        self._gen: Dict[str, int] = {s: 0 for s in SCOPES}
+        self._stats = {"hits": 0, "misses": 0, "stale_puts": 0, "invalidations": 0}
+
+    def generation(self, scope: str) -> int:
+        return self._gen[scope]
+
+    def get(self, scope: str, key: Hashable) -> Any:
+        if not self.enabled:
+            return MISS
+        with self._lock:
+            hit = self._items.get((scope, key))
+            if hit is None or (self.ttl > 0 and hit[0] < time.monotonic()):
+                self._stats["misses"] += 1
+                return MISS
+            self._items.move_to_end((scope, key))
+            self._stats["hits"] += 1
+            return hit[1]
+
+    def put(self, scope: str, key: Hashable, gen: int, value: Any) -> None:
+        """Guarda solo si el ámbito no se invalidó mientras se consultaba (gen sigue vigente)."""
+        if not self.enabled:
+            return
+        with self._lock:
+            if self._gen[scope] != gen:
+                self._stats["stale_puts"] += 1
+                return
+            self._items[(scope, key)] = (time.monotonic() + self.ttl, value)
+            self._items.move_to_end((scope, key))
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+    def invalidate(self, scopes: Iterable[str]) -> List[str]:
+        """Vacía los ámbitos indicados y sube su generación. Devuelve los ámbitos vaciados."""
+        scopes = [s for s in scopes if s in self._gen]
+        with self._lock:
+            for s in scopes:
+                self._gen[s] += 1
+            for k in [k for k in self._items if k[0] in scopes]:
+                del self._items[k]
+            self._stats["invalidations"] += 1
+        return scopes
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self._stats["hits"] + self._stats["misses"]
+            return {
+                **self._stats,
+                "enabled": self.enabled,
+                "items": len(self._items),
+                "hit_rate": round(self._stats["hits"] / total, 4) if total else None,
+                "generaciones": dict(self._gen),
+            }
+
+
+class Snapshot:
+    """
+    Copia en memoria de una tabla pequeña (FAQs, config, ejemplos aprobados). Se carga al
+    primer uso y se descarta cuando el detector de cambios avisa (changes.py).
+    """
+
+    def __init__(self, loader: Callable[[], Any]) -> None:
+        self._loader = loader
+        self._lock = threading.Lock()
+        self._value: Any = MISS
+        self._gen = 0
+        self.loads = 0
+
+    def get(self) -> Any:
+        value = self._value
+        if value is not MISS:
+            return value
+        gen = self._gen
+        value = self._loader()
+        with self._lock:
+            self.loads += 1
+            # Si llegó un aviso mientras se cargaba, se usa esta vez pero no se guarda
+            if gen == self._gen:
+                self._value = value
+        return value
+
+    def invalidate(self, *_: Any) -> None:
+        with self._lock:
+            self._gen += 1
+            self._value = MISS
@@ -0,0 +1,211 @@
+# cards.py - Cards de propiedades/proyectos pre-renderizadas
+"""
+Cada card (precio formateado, URLs, descripción limpia) y su línea de contexto para la
+IA se construyen una vez por fila y versión: la versión son los propios valores de la
+fila que usa la card, así un cambio en BD nunca devuelve una card vieja. Una respuesta
+de búsqueda solo junta fragmentos ya hechos.
+Modo compacto (opcional por petición): descripción recortada a CARD_DESC_MAX y, para
+cards que la sesión ya recibió, solo {type, id}.
+Las cards devueltas se comparten entre turnos: no deben modificarse.
+"""
+
+from typing import Any, Callable, Dict, List, Optional, Sequence, Set, Tuple
+
+import changes
+from config import CARD_DESC_MAX
+
+_CAMPOS = {
+    "propiedad": ("titulo", "slug", "tipo", "ubicacion", "precio", "habitaciones", "banos", "descripcion", "imagen_principal"),
+    "proyecto": ("nombre", "slug", "ubicacion", "precio_desde", "descripcion", "imagen_principal"),
+}
+
+# Tope de seguridad (el catálogo activo es mucho menor)
+MAX_ITEMS = 5000
+
+# (tipo, id, base_url) -> (última fila vista, versión, card)
+_cards: Dict[Tuple[str, int, str], Tuple[Dict[str, Any], tuple, Dict[str, Any]]] = {}
+# (tipo, id) -> (card, línea): la línea vale mientras la card sea el mismo objeto
+_lineas: Dict[Tuple[str, int], Tuple[Dict[str, Any], str]] = {}
+# (tipo, id) -> (card, versión compacta), igual que las líneas
+_compactas: Dict[Tuple[str, int], Tuple[Dict[str, Any], Dict[str, Any]]] = {}
+_stats = {"hits": 0, "renders": 0}
+
+
+def format_precio(v: Optional[float]) -> str:
+    if v is None:
+        return ""
+    if v >= 1_000_000:
+        return f"${v/1_000_000:.1f}M" if v % 1_000_000 == 0 else f"${v/1_000_000:.2f}M"
+    return f"${v:,.0f}"
+
+
+def _url_propiedad(slug: str, base: str) -> str:
+    return f"{base.rstrip('/')}/?page=propiedad&slug={slug}"
+
+
+def _url_proyecto(slug: str, base: str) -> str:
+    return f"{base.rstrip('/')}/?page=proyecto&slug={slug}"
+
+
+def _render_propiedad(p: Dict[str, Any], base_url: str) -> Dict[str, Any]:
+    return {
+        "type": "propiedad",
+        "id": p["id"],
+        "titulo": p["titulo"],
+        "tipo": p.get("tipo", "venta"),
+        "ubicacion": p.get("ubicacion") or "",
+        "precio": format_precio(float(p["precio"])) if p.get("precio") else "",
+        "habitaciones": p.get("habitaciones"),
+        "banos": p.get("banos"),
+        "descripcion": (p.get("descripcion") or "").strip(),
+        "url": _url_propiedad(p["slug"], base_url),
+        "imagen": f"{base_url.rstrip('/')}/uploads/propiedades/{p['imagen_principal']}" if p.get("imagen_principal") else None,
+    }
+
+
+def _render_proyecto(pr: Dict[str, Any], base_url: str) -> Dict[str, Any]:
+    return {
+        "type": "proyecto",
+        "id": pr["id"],
+        "titulo": pr["nombre"],
+        "ubicacion": pr.get("ubicacion") or "",
+        "precio_desde": format_precio(float(pr["precio_desde"])) if pr.get("precio_desde") else "",
+        "descripcion": (pr.get("descripcion") or "").strip(),
+        "url": _url_proyecto(pr["slug"], base_url),
+        "imagen": f"{base_url.rstrip('/')}/uploads/proyectos/{pr['imagen_principal']}" if pr.get("imagen_principal") else None,
+    }
+
+
+def _cached(tipo: str, row: Dict[str, Any], base_url: str, render: Callable[[Dict[str, Any], str], Dict[str, Any]]) -> Dict[str, Any]:
+    key = (tipo, int(row["id"]), base_url)
+    hit = _cards.get(key)
+    # Misma fila (caché de búsquedas): sin comparar; fila nueva de la BD: comparar valores
+    if hit is not None and hit[0] is row:
+        _stats["hits"] += 1
+        return hit[2]
+    version = tuple(row.get(k) for k in _CAMPOS[tipo])
+    if hit is not None and hit[1] == version:
+        _stats["hits"] += 1
+        _cards[key] = (row, version, hit[2])
+        return hit[2]
+    card = render(row, base_url)
+    _stats["renders"] += 1
+    if len(_cards) >= MAX_ITEMS:
+        _cards.clear()
+    _cards[key] = (row, version, card)
+    return card
+
+
+def card_propiedad(p: Dict[str, Any], base_url: str) -> Dict[str, Any]:
+    return _cached("propiedad", p, base_url, _render_propiedad)
+
+
+def card_proyecto(pr: Dict[str, Any], base_url: str) -> Dict[str, Any]:
+    return _cached("proyecto", pr, base_url, _render_proyecto)
+
+
+def _render_linea(c: Dict[str, Any]) -> str:
+    card_type = (c.get("type") or "propiedad").lower()
+    titulo = (c.get("titulo") or "").strip() or "Sin título"
+    ubicacion = (c.get("ubicacion") or "").strip()
+    desc = (c.get("descripcion") or "").strip()[:80]
+    if card_type == "proyecto":
+        precio = c.get("precio_desde") or ""
+        line = f"- Proyecto: {titulo}"
+        if ubicacion:
+            line += f", ubicación: {ubicacion}"
+        if precio:
+            line += f", desde {precio}"
+    else:
+        precio = c.get("precio") or ""
+        hab = c.get("habitaciones")
+        banos = c.get("banos")
+        tipo = c.get("tipo") or "venta"
+        line = f"- Propiedad: {titulo}, {tipo}"
+        if ubicacion:
+            line += f", ubicación: {ubicacion}"
+        if precio:
+            line += f", precio: {precio}"
+        if hab is not None:
+            line += f", {hab} hab"
+        if banos is not None:
+            line += f", {banos} baños"
+    if desc:
+        line += f". {desc}"
+    return line
+
+
+def context_line(c: Dict[str, Any]) -> str:
+    """Línea de contexto para la IA (título, ubicación, precio, características) de una card."""
+    key = (c.get("type") or "propiedad", c.get("id"))
+    hit = _lineas.get(key)
+    if hit is not None and hit[0] is c:
+        return hit[1]
+    line = _render_linea(c)
+    if c.get("id") is not None:
+        if len(_lineas) >= MAX_ITEMS:
+            _lineas.clear()
+        _lineas[key] = (c, line)
+    return line
+
+
+def context_lines(cards: Sequence[Dict[str, Any]]) -> List[str]:
+    return [context_line(c) for c in cards]
+
+
+def clave(c: Dict[str, Any]) -> str:
+    """Identificador de card para el registro por sesión: "propiedad:12"."""
+    return f"{c.get('type') or 'propiedad'}:{c.get('id')}"
+
+
+def _recortar(texto: str, n: int) -> str:
+    if len(texto) <= n:
+        return texto
+    corte = texto[:n].rsplit(" ", 1)[0] if " " in texto[:n] else texto[:n]
+    return corte.rstrip(" ,.;:") + "…"
+
+
+def card_compacta(c: Dict[str, Any]) -> Dict[str, Any]:
+    """Card con la descripción recortada a CARD_DESC_MAX caracteres (se recorta en el servidor)."""
+    desc = c.get("descripcion") or ""
+    if len(desc) <= CARD_DESC_MAX:
+        return c
+    key = (c.get("type") or "propiedad", c.get("id"))
+    hit = _compactas.get(key)
+    if hit is not None and hit[0] is c:
+        return hit[1]
+    compacta = {**c, "descripcion": _recortar(desc, CARD_DESC_MAX)}
+    if len(_compactas) >= MAX_ITEMS:
+        _compactas.clear()
+    _compactas[key] = (c, compacta)
+    return compacta
+
+
+def compactar(cards: Sequence[Dict[str, Any]], vistas: Set[str]) -> List[Dict[str, Any]]:
+    """Cards para el modo compacto: solo {type, id} si la sesión ya la tiene, si no recortada."""
+    out: List[Dict[str, Any]] = []
+    for c in cards:
+        if clave(c) in vistas:
+            out.append({"type": c.get("type") or "propiedad", "id": c.get("id"), "vista": True})
+        else:
+            out.append(card_compacta(c))
+    return out
+
+
+def stats() -> Dict[str, Any]:
+    total = _stats["hits"] + _stats["renders"]
+    return {**_stats, "items": len(_cards), "hit_rate": round(_stats["hits"] / total, 4) if total else None}
+
+
+def _on_change(tablas: frozenset) -> None:
+    # Las cards viejas ya no coincidirían en versión; se sueltan para liberar memoria
+    tipos = {"propiedades": "propiedad", "proyectos": "proyecto"}
+    for tipo in {tipos[t] for t in tablas}:
+        for key in [k for k in list(_cards) if k[0] == tipo]:
+            _cards.pop(key, None)
+        for cache in (_lineas, _compactas):
+            for key in [k for k in list(cache) if k[0] == tipo]:
+                cache.pop(key, None)
+
+
+changes.subscribe(("propiedades", "proyectos"), _on_change)
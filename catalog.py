@@ -0,0 +1,272 @@
+# catalog.py - Catálogo activo en memoria (propiedades + proyectos)
+"""
+Snapshot de propiedades/proyectos activos y lo derivado de ellos: el gazetteer y, si
+numpy está instalado, el ranking de alternativas, el índice de propiedades parecidas,
+la búsqueda por descripción y las facetas para el widget.
+Se carga al primer turno y se reconstruye cuando el detector de cambios (changes.py)
+avisa que cambió propiedades, proyectos o chatbot_faqs; solo se vuelve a leer la tabla
+que cambió. Si la BD falla se mantiene el último.
+"""
+
+import logging
+import threading
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional
+
+import changes
+import db
+import fuzzy
+import gazetteer
+from db import cursor_de, listar_faqs, listar_propiedades_activas, listar_proyectos_activos
+from nlu import fold, set_gazetteer
+
+try:
+    import facets
+    import ranking
+    import semantic
+    import similar
+except ImportError:  # numpy no instalado: sin ranking, parecidas, búsqueda por descripción ni facetas
+    facets = ranking = semantic = similar = None
+
+logger = logging.getLogger("chatbot-api")
+
+TABLAS = ("propiedades", "proyectos", "chatbot_faqs")
+
+_lock = threading.Lock()
+_state: Dict[str, Any] = {
+    "version": 0,
+    "propiedades": [],
+    "proyectos": [],
+    "faqs": [],
+    "gazetteer": None,
+    "por_id": {},
+    "similares": None,
+    "ranking": None,
+    "facetas": None,
+}
+
+
+def refresh(tablas: Iterable[str] = TABLAS) -> None:
+    """Relee las tablas indicadas (las demás se reutilizan) y reconstruye el gazetteer."""
+    tablas = frozenset(tablas)
+    with _lock:
+        if _state["gazetteer"] is None:
+            tablas = frozenset(TABLAS)
+        props = listar_propiedades_activas() if "propiedades" in tablas else _state["propiedades"]
+        proys = listar_proyectos_activos() if "proyectos" in tablas else _state["proyectos"]
+        faqs = listar_faqs() if "chatbot_faqs" in tablas else _state["faqs"]
+        version = _state["version"] + 1
+        g = gazetteer.build(props, proys, version=version, faqs=faqs)
+        _state.update(version=version, propiedades=props, proyectos=proys, faqs=faqs, gazetteer=g)
+        set_gazetteer(g)
+        if "propiedades" in tablas:
+            _state["por_id"] = {int(p["id"]): p for p in props}
+            if similar is not None:
+                _state["ranking"] = ranking.build(props)
+                _state["facetas"] = facets.build(props)
+                _state["similares"] = similar.build(props)
+                semantic.indice.update("propiedad", props)
+        if "proyectos" in tablas and semantic is not None:
+            semantic.indice.update("proyecto", proys)
+    logger.info(
+        "Catálogo v%d (%s): %d propiedades, %d proyectos, %d frases en gazetteer, %d palabras para corrección (fuzzy %s)",
+        version, ", ".join(sorted(tablas)), len(props), len(proys), g.size, len(g.vocab), fuzzy.stats(),
+    )
+
+
+def _on_change(tablas: FrozenSet[str]) -> None:
+    # Aún no cargado: lo hará el primer turno con datos frescos
+    if _state["gazetteer"] is not None:
+        refresh(tablas)
+
+
+changes.subscribe(TABLAS, _on_change)
+
+
+def ensure_fresh() -> None:
+    """
+    Llamar en cada turno: carga el catálogo la primera vez. Con el detector en segundo plano
+    no hace nada más; sin él (scripts, CHANGES_POLL_SEC=0) sondea aquí mismo.
+    """
+    try:
+        if _state["gazetteer"] is None:
+            refresh()
+        elif not changes.running():
+            changes.detector.poll_if_due()
+    except Exception as e:
+        logger.warning("No se pudo refrescar el catálogo (se usa el anterior): %s", e)
+
+
+def propiedades_similares(prop_id: Optional[int], k: int = 4, excluir: Iterable[int] = ()) -> List[Dict[str, Any]]:
+    """Filas de las k propiedades activas más parecidas a prop_id (precalculadas). [] si no hay índice."""
+    idx = _state["similares"]
+    if idx is None or not prop_id:
+        return []
+    por_id = _state["por_id"]
+    return [por_id[i] for i in idx.similares(int(prop_id), k, excluir=list(excluir)) if i in por_id]
+
+
+def alternativas(
+    tipo: Optional[str] = None,
+    precio_min: Optional[float] = None,
+    precio_max: Optional[float] = None,
+    habitaciones: Optional[int] = None,
+    ubicacion: Optional[str] = None,
+    n: int = 6,
+) -> Optional[List[Any]]:
+    """
+    Propiedades activas más cercanas a lo pedido (ranking.Candidato, con lo relajado).
+    None si no hay ranking en memoria (sin numpy o catálogo sin cargar): usar la BD.
+    """
+    idx = _state["ranking"]
+    if idx is None:
+        return None
+    lugar = filtro_propiedades(ubicacion)
+    return idx.rank(
+        tipo=tipo,
+        precio_min=precio_min,
+        precio_max=precio_max,
+        habitaciones=habitaciones,
+        ids=lugar.get("ids"),
+        texto=lugar.get("ubicacion"),
+        n=n,
+    )
+
+
+def buscar_por_descripcion(texto: str, tipo: str = "propiedad", k: int = 4) -> List[Dict[str, Any]]:
+    """Filas (propiedad | proyecto) cuya descripción más se parece al texto. [] si no hay índice."""
+    if semantic is None:
+        return []
+    return [row for row, _ in semantic.indice.search(texto, tipo=tipo, k=k)]
+
+
+def _like(valor: Any, term: str) -> bool:
+    """LIKE '%term%' con collation *_ci: sin distinguir mayúsculas ni tildes."""
+    return term in fold(str(valor or "").lower())
+
+
+def _posicion(c: List[Any]) -> tuple:
+    """Clave de orden (destacado DESC, orden, id) de un cursor de db.cursor_de; NULL al final como en MySQL."""
+    dest, orden, pid = c
+    menor = float("-inf")
+    return (-(dest if dest is not None else menor), orden if orden is not None else menor, int(pid))
+
+
+def propiedades_en_memoria(
+    tipo: Optional[str] = None,
+    precio_min: Optional[float] = None,
+    precio_max: Optional[float] = None,
+    habitaciones: Optional[int] = None,
+    ubicacion: Optional[str] = None,
+    titulo: Optional[str] = None,
+    exclude_ids: Optional[List[int]] = None,
+    limite: int = 6,
+    ids: Optional[List[int]] = None,
+    despues: Optional[List[Any]] = None,
+) -> Optional[List[Dict[str, Any]]]:
+    """
+    Mismo resultado que db.buscar_propiedades, filtrando la copia en memoria (nivel
+    SOLO_CACHE de admission.py). None si el catálogo aún no se cargó: usar la BD.
+    """
+    if not _state["version"]:
+        return None
+    ids_ok = set(int(i) for i in ids) if ids else None
+    excluir = set(int(i) for i in exclude_ids or ())
+    if ids_ok is not None:
+        ubicacion = titulo = None
+    ubicacion = fold(" ".join((ubicacion or "").lower().split()))
+    titulo = fold(" ".join((titulo or "").lower().split()))
+    tipo = (tipo or "").lower()
+    tras = _posicion(despues) if despues else None
+    out: List[Dict[str, Any]] = []
+    for p in _state["propiedades"]:
+        pid = int(p["id"])
+        if ids_ok is not None and pid not in ids_ok or pid in excluir:
+            continue
+        if tipo and (p.get("tipo") or "").lower() != tipo:
+            continue
+        precio = p.get("precio")
+        if (precio_min is not None or precio_max is not None) and precio is None:
+            continue
+        if precio_min is not None and precio < precio_min or precio_max is not None and precio > precio_max:
+            continue
+        if habitaciones is not None and (p.get("habitaciones") is None or p["habitaciones"] < habitaciones):
+            continue
+        if ubicacion and titulo:
+            if not (_like(p.get("ubicacion"), ubicacion) or _like(p.get("titulo"), titulo)):
+                continue
+        elif ubicacion and not _like(p.get("ubicacion"), ubicacion) or titulo and not _like(p.get("titulo"), titulo):
+            continue
+        if tras is not None and _posicion(cursor_de(p)) <= tras:
+            continue
+        out.append(p)
+        if len(out) >= limite:
+            break
+    return out
+
+
+def proyectos_en_memoria(
+    ubicacion: Optional[str] = None,
+    limite: int = 6,
+    ids: Optional[List[int]] = None,
+) -> Optional[List[Dict[str, Any]]]:
+    """Mismo resultado que db.buscar_proyectos sobre la copia en memoria. None si no se cargó."""
+    if not _state["version"]:
+        return None
+    ids_ok = set(int(i) for i in ids) if ids else None
+    term = fold(" ".join((ubicacion or "").lower().split()))
+    out: List[Dict[str, Any]] = []
+    for p in _state["proyectos"]:
+        if ids_ok is not None:
+            if int(p["id"]) not in ids_ok:
+                continue
+        elif term and not (_like(p.get("ubicacion"), term) or _like(p.get("nombre"), term)):
+            continue
+        out.append(p)
+        if len(out) >= limite:
+            break
+    return out
+
+
+db.registrar_en_memoria("propiedades", propiedades_en_memoria)
+db.registrar_en_memoria("proyectos", proyectos_en_memoria)
+
+
+def get_facetas() -> Optional[Any]:
+    """facets.Facetas del catálogo activo (None sin numpy o antes de cargar)."""
+    return _state["facetas"]
+
+
+def stats() -> Dict[str, Any]:
+    return {
+        "version": _state["version"],
+        "propiedades": len(_state["propiedades"]),
+        "proyectos": len(_state["proyectos"]),
+        "descripciones": semantic.indice.stats() if semantic is not None else None,
+    }
+
+
+def get_gazetteer() -> Optional[gazetteer.Gazetteer]:
+    return _state["gazetteer"]
+
+
+def filtro_propiedades(term: Optional[str]) -> Dict[str, Any]:
+    """
+    kwargs para buscar_propiedades a partir de un lugar/nombre: ids si el gazetteer lo
+    resuelve, si no el LIKE de siempre por ubicación y título.
+    """
+    term = (term or "").strip() or None
+    g = _state["gazetteer"]
+    mention = g.resolve(term) if (g is not None and term) else None
+    if mention:
+        return {"ids": mention.propiedad_ids}
+    return {"ubicacion": term, "titulo": term}
+
+
+def filtro_proyectos(term: Optional[str]) -> Dict[str, Any]:
+    """kwargs para buscar_proyectos (ids resueltos o LIKE por ubicación/nombre)."""
+    term = (term or "").strip() or None
+    g = _state["gazetteer"]
+    mention = g.resolve(term) if (g is not None and term) else None
+    if mention:
+        return {"ids": mention.proyecto_ids}
+    return {"ubicacion": term}
@@ -0,0 +1,174 @@
+# changes.py - Detector de cambios en BD (CDC por sondeo) para las cachés en memoria
+"""
+Un solo hilo consulta cada CHANGES_POLL_SEC segundos una firma barata por tabla
+(conteo + checksum de id y fecha_actualizacion donde existe, o de las columnas cortas)
+en una sola ida a la BD. El texto largo (descripciones, respuestas de FAQs) solo se
+incluye cada CHANGES_FULL_SEC: una edición que solo toca la descripción de una tabla
+sin fecha_actualizacion se ve en el siguiente sondeo completo.
+Si la firma de una tabla cambia, avisa a los suscriptores de esa tabla (catálogo,
+FAQs, config, ejemplos de entrenamiento, caché de búsquedas); cada uno recarga solo
+lo suyo. El aviso del panel (POST /cache/invalidate) entra por el mismo camino.
+"""
+
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+from config import CHANGES_FULL_SEC, CHANGES_POLL_SEC
+
+logger = logging.getLogger("chatbot-api")
+
+TABLAS = ("propiedades", "proyectos", "chatbot_faqs", "chatbot_config", "chatbot_entrenamiento")
+
+# Ámbitos del webhook del panel -> tablas
+_SCOPE_TABLA = {
+    "propiedad": "propiedades",
+    "proyecto": "proyectos",
+    "faqs": "chatbot_faqs",
+    "config": "chatbot_config",
+}
+
+Subscriber = Callable[[FrozenSet[str]], None]
+
+
+def tablas_de_scope(scope: str) -> Tuple[str, ...]:
+    """
+    all | propiedad:<id> | proyecto:<id> | faqs | config -> tablas afectadas.
+    Un cambio en una propiedad puede hacer que entre o salga de cualquier búsqueda, así que
+    propiedad:<id> afecta a toda la tabla (el id queda en el log).
+    """
+    tipo, _, ident = (scope or "").strip().lower().partition(":")
+    if tipo == "all" and not ident:
+        return TABLAS
+    if tipo in ("propiedad", "proyecto") and ident.isdigit():
+        return (_SCOPE_TABLA[tipo],)
+    if tipo in ("faqs", "config") and not ident:
+        return (_SCOPE_TABLA[tipo],)
+    raise ValueError(f"Ámbito no válido: {scope!r}")
+
+
+class ChangeDetector:
+    def __init__(self, interval: float, intervalo_completo: float = 0) -> None:
+        self.interval = interval
+        self.intervalo_completo = intervalo_completo
+        self._subs: List[Tuple[FrozenSet[str], Subscriber]] = []
+        self._firmas: Optional[Dict[str, Any]] = None
+        # Checksum del texto largo por tabla (solo lo traen los sondeos completos)
+        self._contenido: Dict[str, Any] = {}
+        self._ultima_completa: Optional[float] = None
+        self._poll_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._last_poll = 0.0
+        self._ok = True
+        self._stats: Dict[str, Any] = {
+            "polls": 0, "completos": 0, "errores": 0, "ms_ultimo": None, "eventos": {t: 0 for t in TABLAS},
+        }
+
+    def subscribe(self, tablas: Iterable[str], fn: Subscriber) -> None:
+        """fn(tablas cambiadas) se llama una vez por sondeo, en el orden de suscripción."""
+        self._subs.append((frozenset(tablas), fn))
+
+    def _publish(self, cambiadas: FrozenSet[str], origen: str) -> None:
+        if not cambiadas:
+            return
+        for t in cambiadas:
+            self._stats["eventos"][t] = self._stats["eventos"].get(t, 0) + 1
+        logger.info("Cambios en BD (%s): %s", origen, ", ".join(sorted(cambiadas)))
+        for tablas, fn in self._subs:
+            mias = cambiadas & tablas
+            if not mias:
+                continue
+            try:
+                fn(mias)
+            except Exception as e:
+                logger.warning("Error recargando %s tras cambio en BD: %s", ", ".join(sorted(mias)), e)
+
+    def poll(self, forzar: Iterable[str] = (), origen: str = "sondeo") -> FrozenSet[str]:
+        """
+        Una ida a la BD; publica las tablas cuya firma cambió más las forzadas (aviso del
+        panel). El primer sondeo publica todas: lo cargado antes de tener firma puede ser viejo.
+        El primero y luego uno cada intervalo_completo (0 = solo el primero) incluyen el texto largo.
+        """
+        from db import firmas_tablas
+
+        forzar = frozenset(forzar)
+        with self._poll_lock:
+            self._last_poll = time.monotonic()
+            t0 = time.perf_counter()
+            completa = self._ultima_completa is None or (
+                self.intervalo_completo > 0 and self._last_poll - self._ultima_completa >= self.intervalo_completo
+            )
+            try:
+                firmas = firmas_tablas(completa)
+            except Exception as e:
+                self._stats["errores"] += 1
+                if self._ok:
+                    logger.warning("No se pudo consultar la firma de las tablas (se reintenta): %s", e)
+                self._ok = False
+                # El aviso del panel se publica igual: no esperar a que vuelva la BD
+                self._publish(forzar, origen)
+                return forzar
+            if not self._ok:
+                logger.info("Detector de cambios: BD accesible de nuevo")
+            self._ok = True
+            self._stats["polls"] += 1
+            self._stats["ms_ultimo"] = round((time.perf_counter() - t0) * 1000, 2)
+            ligeras = {t: f for t, (f, _) in firmas.items()}
+            contenido = {t: c for t, (_, c) in firmas.items() if c is not None}
+            if self._firmas is None:
+                cambiadas = frozenset(firmas)
+            else:
+                cambiadas = frozenset(
+                    t for t in firmas
+                    if self._firmas.get(t) != ligeras[t] or (t in contenido and self._contenido.get(t) != contenido[t])
+                )
+            self._firmas = ligeras
+            self._contenido.update(contenido)
+            if completa:
+                self._ultima_completa = self._last_poll
+                self._stats["completos"] += 1
+            cambiadas |= forzar
+            self._publish(cambiadas, origen)
+            return cambiadas
+
+    def poll_if_due(self) -> None:
+        """Sin hilo en segundo plano (scripts, pool de procesos): sondeo en línea cada interval."""
+        if time.monotonic() - self._last_poll >= self.interval:
+            self.poll()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self.poll()
+            self._stop.wait(self.interval)
+
+    def start(self) -> None:
+        if self.interval <= 0 or self.running():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="cdc-poller", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self._stats,
+            "eventos": dict(self._stats["eventos"]),
+            "activo": self.running(),
+            "intervalo": self.interval,
+            "intervalo_completo": self.intervalo_completo,
+        }
+
+
+detector = ChangeDetector(CHANGES_POLL_SEC, CHANGES_FULL_SEC)
+subscribe = detector.subscribe
+running = detector.running
@@ -25,3 +25,116 @@ CORS_ORIGINS = [o.strip() for o in CORS_ORIGINS_STR.split(",") if o.strip()]
 # IA generativa (opcional, gratis con Gemini)
 LLM_ENABLED = os.getenv("LLM_ENABLED", "0").strip().lower() in ("1", "true", "yes")
 GEMINI_API_KEY = (os.getenv("GEMINI_API_KEY") or "").strip()
+
+# Detector de cambios en BD: cada cuántos segundos se consulta la firma de propiedades,
+# proyectos, FAQs, config y entrenamiento para recargar las cachés en memoria (0 = apagado:
+# FAQs/config/entrenamiento en vivo; el catálogo se comprueba en línea cada turno)
+CHANGES_POLL_SEC = float(os.getenv("CHANGES_POLL_SEC", os.getenv("CATALOG_CHECK_SEC", "10")))
+# Cada cuántos segundos la firma incluye el texto largo (descripciones, respuestas de FAQs):
+# es lo caro de leer y solo hace falta en tablas sin fecha_actualizacion (0 = solo al arrancar)
+CHANGES_FULL_SEC = float(os.getenv("CHANGES_FULL_SEC", "300"))
+
+# Clasificador de intención entrenado (fallback de duda_general); se carga al arrancar si existe
+INTENT_MODEL_PATH = Path(os.getenv("INTENT_MODEL_PATH", str(BASE_DIR / "models" / "intent_model.npz")))
+INTENT_MODEL_MIN_PROB = float(os.getenv("INTENT_MODEL_MIN_PROB", "0.6"))
+
+# POST /nlu/batch: máximo de mensajes por petición; desde cuántos se reparte en procesos
+NLU_BATCH_MAX = int(os.getenv("NLU_BATCH_MAX", "5000"))
+NLU_BATCH_POOL_MIN = int(os.getenv("NLU_BATCH_POOL_MIN", "1000"))
+NLU_BATCH_WORKERS = int(os.getenv("NLU_BATCH_WORKERS", "0")) or (os.cpu_count() or 1)
+
+# Sesiones en servidor: contexto + últimos turnos por session_id (LRU en memoria con TTL)
+SESSION_TTL_SEC = int(os.getenv("SESSION_TTL_SEC", "1800"))
+SESSION_MAX = int(os.getenv("SESSION_MAX", "10000"))
+SESSION_TURNS = int(os.getenv("SESSION_TURNS", "6"))
+# Persistencia opcional en SQLite (sobrevive reinicios); vacío = solo memoria
+SESSION_SQLITE_PATH = (os.getenv("SESSION_SQLITE_PATH") or "").strip()
+
+# /chat idempotente: segundos que se recuerda la respuesta de una Idempotency-Key
+IDEMPOTENCY_TTL_SEC = float(os.getenv("IDEMPOTENCY_TTL_SEC", "120"))
+
+# Búsquedas idénticas concurrentes comparten una sola consulta; además se puede recordar
+# el resultado unos segundos (0 = no recordar: siempre datos en vivo)
+SEARCH_MEMO_SEC = float(os.getenv("SEARCH_MEMO_SEC", "0"))
+
+# Caché de búsquedas/FAQs/config invalidada por el panel PHP (POST /cache/invalidate).
+# Solo se activa si hay token; CACHE_MAX_AGE_SEC es un tope por si se pierde un aviso
+CACHE_INVALIDATE_TOKEN = (os.getenv("CACHE_INVALIDATE_TOKEN") or "").strip()
+CACHE_MAX_AGE_SEC = float(os.getenv("CACHE_MAX_AGE_SEC", "3600"))
+CACHE_MAX_ITEMS = int(os.getenv("CACHE_MAX_ITEMS", "5000"))
+
+# GET /metrics (contadores internos, saturación, nivel de admisión) pide Authorization: Bearer.
+# Vacío = el mismo CACHE_INVALIDATE_TOKEN; sin ninguno de los dos, /metrics no existe (404)
+METRICS_TOKEN = (os.getenv("METRICS_TOKEN") or "").strip() or CACHE_INVALIDATE_TOKEN
+
+# Modo compacto de /chat (compact=true): largo máximo de la descripción en cada card.
+# Opcional: respuestas mayores a GZIP_MIN_BYTES se comprimen si el cliente acepta gzip
+# (0 = nunca, por defecto; los streams NDJSON nunca se comprimen)
+CARD_DESC_MAX = int(os.getenv("CARD_DESC_MAX", "160"))
+GZIP_MIN_BYTES = int(os.getenv("GZIP_MIN_BYTES", "0"))
+
+# Propiedades parecidas precalculadas por cada propiedad activa (similar.py)
+SIMILAR_TOP_K = int(os.getenv("SIMILAR_TOP_K", "8"))
+
+# Horarios de cita: por defecto (0) manda api/horarios-disponibles.php y el cálculo propio
+# desde citas/agentes corre en sombra para comparar en una fracción de las consultas
+# (DISPONIBILIDAD_CONTRASTE: 0 = nunca, 1 = todas; "true" = 1); 1 = responde
+# la BD y el PHP queda como contraste (solo tras ver paridad en /metrics). Franjas: desde CITAS_HORA_INICIO hasta CITAS_HORA_FIN
+# (inicio de la última) cada CITAS_INTERVALO_MIN; días = weekday de Python (0 = lunes)
+DISPONIBILIDAD_NATIVA = os.getenv("DISPONIBILIDAD_NATIVA", "0").strip().lower() in ("1", "true", "yes")
+_contraste = os.getenv("DISPONIBILIDAD_CONTRASTE", "0.1").strip().lower()
+_contraste = {"true": "1", "yes": "1", "false": "0", "no": "0", "": "0"}.get(_contraste, _contraste)
+DISPONIBILIDAD_CONTRASTE = min(max(float(_contraste), 0.0), 1.0)
+DISPONIBILIDAD_TTL_SEC = float(os.getenv("DISPONIBILIDAD_TTL_SEC", "60"))
+CITAS_HORA_INICIO = os.getenv("CITAS_HORA_INICIO", "08:30")
+CITAS_HORA_FIN = os.getenv("CITAS_HORA_FIN", "17:30")
+CITAS_INTERVALO_MIN = int(os.getenv("CITAS_INTERVALO_MIN", "60"))
+CITAS_DIAS = [int(d) for d in os.getenv("CITAS_DIAS", "0,1,2,3,4,5").split(",") if d.strip().isdigit()]
+# Hoy solo se ofrecen franjas que empiecen al menos CITAS_ANTICIPACION_MIN después de ahora
+CITAS_ANTICIPACION_MIN = int(os.getenv("CITAS_ANTICIPACION_MIN", "60"))
+CITAS_TZ = os.getenv("CITAS_TZ", "America/Bogota")
+# Respuestas de api/horarios-disponibles.php recordadas por fecha (se vacían al agendar) y
+# días hábiles cuyos horarios se piden por adelantado cuando el bot pregunta la fecha
+HORARIOS_PHP_TTL_SEC = float(os.getenv("HORARIOS_PHP_TTL_SEC", "30"))
+HORARIOS_PREFETCH_DIAS = int(os.getenv("HORARIOS_PREFETCH_DIAS", "3"))
+
+# Cliente HTTP hacia el PHP: conexiones keep-alive, llamadas simultáneas (las demás esperan
+# hasta PHP_QUEUE_WAIT_SEC y fallan), reintentos con jitter. PHP_IDEMPOTENCIA=1 cuando
+# procesar-cita.php deduplique por idempotency_key: entonces también se reintenta tras timeout
+PHP_MAX_CONNECTIONS = int(os.getenv("PHP_MAX_CONNECTIONS", "20"))
+PHP_MAX_CONCURRENCY = int(os.getenv("PHP_MAX_CONCURRENCY", "10"))
+PHP_QUEUE_WAIT_SEC = float(os.getenv("PHP_QUEUE_WAIT_SEC", "2"))
+PHP_RETRIES = int(os.getenv("PHP_RETRIES", "2"))
+PHP_RETRY_BACKOFF_SEC = float(os.getenv("PHP_RETRY_BACKOFF_SEC", "0.3"))
+PHP_IDEMPOTENCIA = os.getenv("PHP_IDEMPOTENCIA", "0").strip().lower() in ("1", "true", "yes")
+
+# Bulkheads (hilos y cola máxima por dependencia; con la cola llena se falla enseguida).
+# Los hilos "php" son PHP_MAX_CONCURRENCY. LLM_ESPERA_SEC: lo más que un turno espera a
+# Gemini; después responde con el borrador y la llamada termina sola
+BULKHEAD_DB_HILOS = int(os.getenv("BULKHEAD_DB_HILOS", "16"))
+BULKHEAD_DB_COLA = int(os.getenv("BULKHEAD_DB_COLA", "32"))
+BULKHEAD_PHP_COLA = int(os.getenv("BULKHEAD_PHP_COLA", "20"))
+BULKHEAD_LLM_HILOS = int(os.getenv("BULKHEAD_LLM_HILOS", "4"))
+BULKHEAD_LLM_COLA = int(os.getenv("BULKHEAD_LLM_COLA", "8"))
+LLM_ESPERA_SEC = float(os.getenv("LLM_ESPERA_SEC", "12"))
+
+# Admisión de /chat: umbrales de los niveles 1 (sin Gemini), 2 (búsquedas solo en memoria) y
+# 3 (503) por /chat en curso y por p95 de latencia (ms) en los últimos ADMISION_VENTANA_SEC.
+# Un umbral 0 desactiva ese paso
+ADMISION_EN_CURSO = [int(x) for x in os.getenv("ADMISION_EN_CURSO", "12,24,40").split(",") if x.strip().isdigit()]
+ADMISION_LATENCIA_MS = [int(x) for x in os.getenv("ADMISION_LATENCIA_MS", "6000,12000,20000").split(",") if x.strip().isdigit()]
+ADMISION_VENTANA_SEC = float(os.getenv("ADMISION_VENTANA_SEC", "30"))
+ADMISION_RETRY_AFTER_SEC = int(os.getenv("ADMISION_RETRY_AFTER_SEC", "5"))
+
+# Límite de mensajes a /chat por IP y por session_id (token bucket): fichas por minuto y
+# ráfaga (0 = sin límite; chatbot_config puede cambiarlos). RATE_LIMIT_SQLITE_PATH comparte
+# las cubetas entre workers. RATE_LIMIT_PROXIES: proxies de confianza delante de la API; la
+# IP del cliente es la que añadió el último de ellos a X-Forwarded-For. 0 (default) = se
+# ignora X-Forwarded-For (lo puede inventar el cliente); en Railway poner 1
+RATE_LIMIT_IP_POR_MIN = float(os.getenv("RATE_LIMIT_IP_POR_MIN", "60"))
+RATE_LIMIT_IP_RAFAGA = float(os.getenv("RATE_LIMIT_IP_RAFAGA", "30"))
+RATE_LIMIT_SESION_POR_MIN = float(os.getenv("RATE_LIMIT_SESION_POR_MIN", "20"))
+RATE_LIMIT_SESION_RAFAGA = float(os.getenv("RATE_LIMIT_SESION_RAFAGA", "8"))
+RATE_LIMIT_MAX_CLAVES = int(os.getenv("RATE_LIMIT_MAX_CLAVES", "50000"))
+RATE_LIMIT_SQLITE_PATH = (os.getenv("RATE_LIMIT_SQLITE_PATH") or "").strip()
+RATE_LIMIT_PROXIES = int(os.getenv("RATE_LIMIT_PROXIES", "0"))
@@ -0,0 +1,237 @@
+# cors.py - CORS como middleware ASGI puro (una sola capa, headers precalculados)
+"""
+Reemplaza a CORSFixMiddleware (BaseHTTPMiddleware: envolvía cada respuesta en un stream)
+más el CORSMiddleware de Starlette encima: cada petición pasaba dos veces por CORS.
+Aquí los headers de cada origen permitido se arman una vez (bytes listos para ASGI) y
+la decisión por origen se memoriza; en cada petición solo se busca el header Origin y
+se añade la lista a la respuesta. Los preflight (OPTIONS) se responden sin entrar en la
+app. Mismas reglas que antes: CORS_ORIGINS + el dominio de producción y sus subdominios
+(comparando el host, no buscando el dominio dentro del texto del origen);
+un origen no permitido recibe el primer origen de la lista (el navegador lo bloquea).
+Medir la diferencia: python cors.py bench
+"""
+
+from typing import Dict, List, Sequence, Tuple
+from urllib.parse import urlsplit
+
+from config import CORS_ORIGINS
+
+Headers = List[Tuple[bytes, bytes]]
+
+DOMINIO = "ctrbienesraices.com"
+
+# Orígenes permitidos: lista explícita + dominio producción (siempre permitir ctrbienesraices.com)
+ALLOWED_ORIGINS = list(CORS_ORIGINS) if CORS_ORIGINS else []
+for o in (f"https://{DOMINIO}", f"https://www.{DOMINIO}", f"http://{DOMINIO}", f"http://www.{DOMINIO}"):
+    if o not in ALLOWED_ORIGINS:
+        ALLOWED_ORIGINS.append(o)
+if not ALLOWED_ORIGINS:
+    ALLOWED_ORIGINS = ["*"]
+
+METODOS = b"GET, POST, OPTIONS"
+HEADERS_PERMITIDOS = b"Content-Type, Authorization, Accept, Origin, Idempotency-Key"
+MAX_AGE = b"86400"
+
+# Orígenes distintos recordados (se vacía al llenarse: solo lo alcanza quien inventa orígenes)
+MAX_MEMO = 1024
+
+
+def origen_permitido(origin: str, permitidos: Sequence[str] = ALLOWED_ORIGINS) -> bool:
+    """
+    El origen está en la lista o es el dominio de producción / un subdominio suyo.
+    Se compara el host ya parseado: "https://ctrbienesraices.com.evil.io" no pasa.
+    """
+    origin = (origin or "").strip().rstrip("/")
+    if not origin:
+        return False
+    if "*" in permitidos or origin in permitidos:
+        return True
+    try:
+        u = urlsplit(origin)
+        host = (u.hostname or "").lower()
+    except ValueError:
+        return False
+    return u.scheme in ("http", "https") and (host == DOMINIO or host.endswith("." + DOMINIO))
+
+
+def allow_origin(origin: str, permitidos: Sequence[str] = ALLOWED_ORIGINS) -> str:
+    """Devuelve el origen a poner en Access-Control-Allow-Origin (nunca * si credentials)."""
+    if not origin:
+        return permitidos[0] if permitidos and "*" not in permitidos else "*"
+    origin = origin.rstrip("/")
+    if origen_permitido(origin, permitidos):
+        return origin
+    return permitidos[0] if permitidos else "*"
+
+
+def _comunes(valor: str) -> Headers:
+    return [
+        (b"access-control-allow-origin", valor.encode("latin-1")),
+        (b"access-control-allow-credentials", b"true"),
+        (b"access-control-allow-methods", METODOS),
+        (b"access-control-allow-headers", HEADERS_PERMITIDOS),
+    ]
+
+
+class CORSMiddleware:
+    def __init__(self, app, origins: Sequence[str] = ALLOWED_ORIGINS) -> None:
+        self.app = app
+        self.origins = list(origins)
+        # valor de Allow-Origin -> (headers de respuesta, headers de preflight)
+        self._por_valor: Dict[str, Tuple[Headers, Headers]] = {}
+        for valor in {*self.origins, allow_origin("", self.origins)}:
+            self._armar(valor)
+        # Origin tal como llega (bytes) -> headers; la decisión se toma una vez por origen
+        self._memo: Dict[bytes, Tuple[Headers, Headers]] = {}
+
+    def _armar(self, valor: str) -> Tuple[Headers, Headers]:
+        par = self._por_valor.get(valor)
+        if par is None:
+            base = _comunes(valor)
+            respuesta = base + [(b"access-control-expose-headers", b"*")]
+            preflight = base + [
+                (b"access-control-max-age", MAX_AGE),
+                (b"vary", b"Origin"),
+                (b"content-type", b"application/json"),
+                (b"content-length", b"2"),
+            ]
+            par = self._por_valor[valor] = (respuesta, preflight)
+        return par
+
+    def _headers(self, origin: bytes) -> Tuple[Headers, Headers]:
+        par = self._memo.get(origin)
+        if par is None:
+            valor = allow_origin(origin.decode("latin-1"), self.origins)
+            if valor not in self._por_valor and len(self._por_valor) >= MAX_MEMO:
+                self._por_valor.clear()
+            par = self._armar(valor)
+            if len(self._memo) >= MAX_MEMO:
+                self._memo.clear()
+            self._memo[origin] = par
+        return par
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        origin = b""
+        pedidos = b""
+        for k, v in scope["headers"]:
+            if k == b"origin":
+                origin = v
+            elif k == b"access-control-request-headers":
+                pedidos = v
+        respuesta, preflight = self._headers(origin)
+
+        if scope["method"] == "OPTIONS":
+            headers = preflight
+            if pedidos:
+                # Como allow_headers=["*"]: se aceptan los headers que el navegador pide
+                headers = [h for h in preflight if h[0] != b"access-control-allow-headers"]
+                headers.append((b"access-control-allow-headers", pedidos))
+            await send({"type": "http.response.start", "status": 200, "headers": headers})
+            await send({"type": "http.response.body", "body": b"{}"})
+            return
+
+        async def send_cors(message) -> None:
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers") or ())
+                for i, (k, v) in enumerate(headers):
+                    if k.lower() == b"vary":
+                        headers[i] = (k, v + b", Origin")
+                        break
+                else:
+                    headers.append((b"vary", b"Origin"))
+                message = {**message, "headers": headers + respuesta}
+            await send(message)
+
+        await self.app(scope, receive, send_cors)
+
+
+def _bench(n: int) -> None:
+    """µs por petición de la capa CORS anterior (BaseHTTPMiddleware + CORSMiddleware de Starlette) vs. esta."""
+    import asyncio
+    import time
+
+    from starlette.applications import Starlette
+    from starlette.middleware.base import BaseHTTPMiddleware
+    from starlette.middleware.cors import CORSMiddleware as StarletteCORS
+    from starlette.responses import JSONResponse, PlainTextResponse
+    from starlette.routing import Route
+
+    class CORSFixAnterior(BaseHTTPMiddleware):
+        # La de main.py antes de este módulo
+        async def dispatch(self, request, call_next):
+            allow = allow_origin((request.headers.get("origin") or "").strip().rstrip("/"))
+            cors = {
+                "Access-Control-Allow-Origin": allow,
+                "Access-Control-Allow-Credentials": "true",
+                "Access-Control-Allow-Methods": "GET, POST, OPTIONS",
+                "Access-Control-Allow-Headers": "Content-Type, Authorization, Accept, Origin",
+            }
+            if request.method == "OPTIONS":
+                return JSONResponse({}, headers={**cors, "Access-Control-Max-Age": "86400"})
+            response = await call_next(request)
+            response.headers.update(cors)
+            return response
+
+    async def ok(request):
+        return PlainTextResponse("ok")
+
+    def app():
+        return Starlette(routes=[Route("/health", ok, methods=["GET", "POST"])])
+
+    anterior = StarletteCORS(
+        CORSFixAnterior(app()),
+        allow_origins=ALLOWED_ORIGINS,
+        allow_credentials=True,
+        allow_methods=["GET", "POST", "OPTIONS"],
+        allow_headers=["*"],
+        expose_headers=["*"],
+    )
+    pilas = {"sin CORS": app(), "anterior": anterior, "cors.py": CORSMiddleware(app())}
+
+    def scope(method: str) -> dict:
+        headers = [(b"host", b"api"), (b"origin", ALLOWED_ORIGINS[0].encode())]
+        if method == "OPTIONS":
+            headers += [(b"access-control-request-method", b"POST"), (b"access-control-request-headers", b"content-type")]
+        return {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": method, "scheme": "https",
+            "path": "/health", "raw_path": b"/health", "query_string": b"", "root_path": "", "headers": headers,
+            "client": ("127.0.0.1", 1), "server": ("api", 443),
+        }
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    async def medir(asgi, method: str) -> float:
+        s = scope(method)
+        for _ in range(200):
+            await asgi(dict(s), receive, send)
+        t0 = time.perf_counter()
+        for _ in range(n):
+            await asgi(dict(s), receive, send)
+        return (time.perf_counter() - t0) / n * 1e6
+
+    async def main() -> None:
+        for method in ("GET", "OPTIONS"):
+            base = await medir(pilas["sin CORS"], method) if method == "GET" else None
+            for nombre in ("anterior", "cors.py"):
+                us = await medir(pilas[nombre], method)
+                extra = f"  ({us - base:+.1f} µs sobre la app sin CORS)" if base is not None else ""
+                print(f"{method:8} {nombre:9} {us:8.1f} µs/petición{extra}")
+
+    asyncio.run(main())
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Middleware CORS")
+    parser.add_argument("cmd", choices=["bench"])
+    parser.add_argument("-n", type=int, default=5000, help="peticiones por medición")
+    args = parser.parse_args()
+    _bench(args.n)
@@ -2,19 +2,93 @@
 """
 Acceso a BD. Usa tablas: propiedades, proyectos, citas, agentes, chatbot_*.
 
-Importante: cada petición al chat consulta la BD en vivo; no hay caché.
-Cuando agregues o actualices una casa/proyecto en la BD, el bot la verá en la
-siguiente consulta (si está activo=1 y estado='disponible' en propiedades).
+Importante: cuando agregues o actualices una casa/proyecto en la BD, el bot la verá
+en la siguiente consulta (si está activo=1 y estado='disponible' en propiedades).
+Sin CACHE_INVALIDATE_TOKEN las búsquedas consultan la BD en vivo. Con token se cachean
+y el panel PHP avisa de cada cambio por POST /cache/invalidate, que vacía la caché
+antes de que el bot vuelva a consultar. FAQs, chatbot_config y los ejemplos aprobados
+se copian en memoria mientras corre el detector de cambios (changes.py).
+Búsquedas idénticas simultáneas comparten una sola consulta en curso
+(SEARCH_MEMO_SEC > 0 además recuerda el resultado unos segundos).
 """
 
 import uuid
 from contextlib import contextmanager
-from typing import Any, Generator, List, Optional
+from typing import Any, Callable, Dict, Generator, List, Optional, Tuple
 
 import mysql.connector
 from mysql.connector import Error
 
-from config import DB_CHARSET, DB_HOST, DB_NAME, DB_PASS, DB_PORT, DB_USER
+import changes
+from admission import controlador as admision
+from cache import MISS, ResultCache, Snapshot
+from config import (
+    CACHE_INVALIDATE_TOKEN,
+    CACHE_MAX_AGE_SEC,
+    CACHE_MAX_ITEMS,
+    DB_CHARSET,
+    DB_HOST,
+    DB_NAME,
+    DB_PASS,
+    DB_PORT,
+    DB_USER,
+    SEARCH_MEMO_SEC,
+)
+from singleflight import SingleFlight
+
+
+# Columnas que usan las cards y el motor de razonamiento
+PROPIEDAD_COLS = """id, titulo, slug, tipo, ubicacion, precio, habitaciones, banos,
+               area_construida, area_total, imagen_principal, descripcion, destacado, orden"""
+
+# Orden del catálogo (destacado DESC, orden, id) como clave de cursor. NULL se ordena como el
+# mínimo en ambos campos (igual que hace MySQL en ORDER BY), así el cursor no salta filas.
+_NULL_KEY = -2147483648
+_KEYSET_SQL = (
+    " AND (COALESCE(destacado, %s) < %s OR (COALESCE(destacado, %s) = %s"
+    " AND (COALESCE(orden, %s) > %s OR (COALESCE(orden, %s) = %s AND id > %s))))"
+)
+PROYECTO_COLS = "id, nombre, slug, ubicacion, precio_desde, imagen_principal, descripcion"
+
+
+# Búsquedas de catálogo idénticas y simultáneas (ej. un anuncio promocionado) comparten
+# una sola consulta. Clave: SQL + parámetros normalizados.
+_search_flight = SingleFlight(ttl=SEARCH_MEMO_SEC)
+
+# Resultados guardados hasta que el panel PHP invalida el ámbito (ver cache.py)
+result_cache = ResultCache(bool(CACHE_INVALIDATE_TOKEN), ttl=CACHE_MAX_AGE_SEC, max_items=CACHE_MAX_ITEMS)
+
+
+def _cacheado(scope: str, key: Any, fn):
+    """Resultado cacheado de fn(); la generación se lee antes de consultar (ver ResultCache.put)."""
+    hit = result_cache.get(scope, key)
+    if hit is not MISS:
+        return hit
+    gen = result_cache.generation(scope)
+    value = fn()
+    result_cache.put(scope, key, gen, value)
+    return value
+
+
+# Cada cambio detectado (o avisado por el panel) vacía solo las búsquedas de esa tabla
+changes.subscribe(("propiedades", "proyectos"), result_cache.invalidate)
+
+# Búsquedas sobre la copia del catálogo en memoria (las registra catalog.py): bajo carga
+# (admission.py, nivel SOLO_CACHE) se usan en vez de MySQL
+_en_memoria: Dict[str, Callable[..., Optional[List[dict]]]] = {}
+
+
+def registrar_en_memoria(scope: str, fn: Callable[..., Optional[List[dict]]]) -> None:
+    _en_memoria[scope] = fn
+
+
+def _desde_memoria(scope: str, **kwargs: Any) -> Optional[List[dict]]:
+    """Resultado en memoria si la admisión lo pide y el catálogo está cargado; None = ir a la BD."""
+    fn = _en_memoria.get(scope)
+    if fn is None or not admision.solo_cache():
+        return None
+    rows = fn(**kwargs)
+    return list(rows) if rows is not None else None
 
 
 def get_conn():
@@ -47,14 +121,50 @@ def cursor_dict():
         conn.close()
 
 
+def _cargar_config() -> Dict[str, Optional[str]]:
+    with cursor_dict() as cur:
+        cur.execute("SELECT `key`, `value` FROM chatbot_config")
+        return {r["key"]: r["value"] for r in cur.fetchall()}
+
+
+def _cargar_faqs() -> List[dict]:
+    with cursor_dict() as cur:
+        cur.execute(
+            """
+            SELECT id, pregunta, respuesta, categoria, palabras_clave
+            FROM chatbot_faqs
+            WHERE activo = 1
+            ORDER BY orden, id
+            """,
+        )
+        return cur.fetchall()
+
+
+# Tablas pequeñas en memoria; el detector de cambios las descarta cuando cambian.
+# Suscritas aquí (al importar db) para descartarse antes de que el catálogo recargue.
+_config_snapshot = Snapshot(_cargar_config)
+_faqs_snapshot = Snapshot(_cargar_faqs)
+changes.subscribe(("chatbot_config",), _config_snapshot.invalidate)
+changes.subscribe(("chatbot_faqs",), _faqs_snapshot.invalidate)
+
+
 def config_get(key: str) -> Optional[str]:
     """Obtener valor de chatbot_config."""
+    if changes.running():
+        return _config_snapshot.get().get(key)
     with cursor_dict() as cur:
         cur.execute("SELECT `value` FROM chatbot_config WHERE `key` = %s", (key,))
         row = cur.fetchone()
         return row["value"] if row else None
 
 
+def listar_faqs() -> List[dict]:
+    """FAQs activas (id, pregunta, respuesta, categoria, palabras_clave), en orden."""
+    if changes.running():
+        return list(_faqs_snapshot.get())
+    return _cargar_faqs()
+
+
 def faq_match(texto: str, limite: int = 5) -> List[dict]:
     """
     Buscar FAQs por coincidencia en pregunta o palabras_clave.
@@ -67,16 +177,7 @@ def faq_match(texto: str, limite: int = 5) -> List[dict]:
     if not words:
         return []
 
-    with cursor_dict() as cur:
-        cur.execute(
-            """
-            SELECT id, pregunta, respuesta, categoria, palabras_clave
-            FROM chatbot_faqs
-            WHERE activo = 1
-            ORDER BY orden, id
-            """,
-        )
-        rows = cur.fetchall()
+    rows = listar_faqs()
 
     scored = []
     for r in rows:
@@ -90,6 +191,49 @@ def faq_match(texto: str, limite: int = 5) -> List[dict]:
     return [r for _, r in scored[:limite]]
 
 
+def _norm_like(term: Optional[str]) -> Optional[str]:
+    """Término LIKE normalizado (la collation *_ci ya ignora mayúsculas): misma clave, misma consulta."""
+    term = " ".join((term or "").lower().split())
+    return term or None
+
+
+def _consulta_compartida(scope: str, q: str, params: List[Any]) -> List[dict]:
+    """
+    Ejecuta la búsqueda (o la toma de la caché); si otra idéntica está en curso, espera y
+    comparte su resultado. La generación va en la clave: tras invalidar, nadie se une a una
+    consulta que empezó antes.
+    """
+    key = (q, tuple(params))
+
+    def run() -> List[dict]:
+        with cursor_dict() as cur:
+            cur.execute(q, params)
+            return cur.fetchall()
+
+    def compartida() -> List[dict]:
+        return _search_flight.do((scope, result_cache.generation(scope), key), run)
+
+    # Copia de la lista: los llamadores pueden filtrarla/reordenarla sin afectar a los demás
+    return list(_cacheado(scope, key, compartida))
+
+
+def search_stats() -> dict:
+    """Métricas de búsquedas: ejecutadas vs. colapsadas en una consulta en curso, y caché."""
+    return {**_search_flight.stats(), "cache": result_cache.stats()}
+
+
+def _num(v: Any) -> Optional[float]:
+    if v is None:
+        return None
+    v = float(v)
+    return int(v) if v.is_integer() else v
+
+
+def cursor_de(p: dict) -> List[Any]:
+    """Posición de una propiedad en el orden del catálogo: [destacado, orden, id] (serializable)."""
+    return [_num(p.get("destacado")), _num(p.get("orden")), int(p["id"])]
+
+
 def buscar_propiedades(
     tipo: Optional[str] = None,
     precio_min: Optional[float] = None,
@@ -100,21 +244,37 @@ def buscar_propiedades(
     proyecto_id: Optional[int] = None,
     exclude_ids: Optional[List[int]] = None,
     limite: int = 6,
+    ids: Optional[List[int]] = None,
+    despues: Optional[List[Any]] = None,
 ) -> List[dict]:
     """
-    Filtrar propiedades activas y disponibles. Consulta la BD en vivo (sin caché):
-    cualquier casa nueva con activo=1 y estado='disponible' aparece de inmediato.
+    Filtrar propiedades activas y disponibles. Cualquier casa nueva con activo=1 y
+    estado='disponible' aparece de inmediato (la caché se vacía con cada aviso del panel).
     tipo: venta | renta | lote
     ubicacion/titulo: búsqueda por ubicación o por nombre (titulo) de la propiedad.
+    ids: ubicación/nombre ya resuelto por el gazetteer (id IN, usa la PK; reemplaza al LIKE).
     exclude_ids: excluir estos IDs (para "qué otra tienes").
+    despues: cursor (ver cursor_de): solo las que van después en el orden del catálogo.
     """
-    q = """
-        SELECT id, titulo, slug, tipo, ubicacion, precio, habitaciones, banos,
-               area_construida, area_total, imagen_principal, descripcion
+    if ids is not None and not ids:
+        return []
+    rows = _desde_memoria(
+        "propiedades", tipo=tipo, precio_min=precio_min, precio_max=precio_max, habitaciones=habitaciones,
+        ubicacion=ubicacion, titulo=titulo, exclude_ids=exclude_ids, limite=limite, ids=ids, despues=despues,
+    )
+    if rows is not None:
+        return rows
+    q = f"""
+        SELECT {PROPIEDAD_COLS}
         FROM propiedades
         WHERE activo = 1 AND estado = 'disponible'
         """
     params: List[Any] = []
+    if ids:
+        q += f" AND id IN ({', '.join(['%s'] * len(ids))})"
+        params.extend(sorted(ids))
+        ubicacion = titulo = None
+    ubicacion, titulo = _norm_like(ubicacion), _norm_like(titulo)
     if tipo:
         q += " AND tipo = %s"
         params.append(tipo)
@@ -130,66 +290,199 @@ def buscar_propiedades(
     if exclude_ids:
         placeholders = ", ".join(["%s"] * len(exclude_ids))
         q += f" AND id NOT IN ({placeholders})"
-        params.extend(exclude_ids)
+        params.extend(sorted(exclude_ids))
+    if despues:
+        dest, orden, last_id = despues
+        dest = _NULL_KEY if dest is None else dest
+        orden = _NULL_KEY if orden is None else orden
+        q += _KEYSET_SQL
+        params.extend([_NULL_KEY, dest, _NULL_KEY, dest, _NULL_KEY, orden, _NULL_KEY, orden, int(last_id)])
     if ubicacion and not titulo:
         q += " AND ubicacion LIKE %s"
-        params.append(f"%{ubicacion.strip()}%")
+        params.append(f"%{ubicacion}%")
     elif titulo and not ubicacion:
         q += " AND titulo LIKE %s"
-        params.append(f"%{titulo.strip()}%")
+        params.append(f"%{titulo}%")
     elif ubicacion and titulo:
         # Búsqueda por nombre o ubicación (ej. "qué es Ibiza"): coincide en cualquiera
         q += " AND (ubicacion LIKE %s OR titulo LIKE %s)"
-        params.extend([f"%{ubicacion.strip()}%", f"%{titulo.strip()}%"])
+        params.extend([f"%{ubicacion}%", f"%{titulo}%"])
     q += " ORDER BY destacado DESC, orden, id LIMIT %s"
     params.append(limite)
-
-    with cursor_dict() as cur:
-        cur.execute(q, params)
-        return cur.fetchall()
+    return _consulta_compartida("propiedades", q, params)
 
 
 def get_propiedad_by_id(propiedad_id: int) -> Optional[dict]:
     """Obtener una propiedad por ID (para preguntas de seguimiento: baños, detalles)."""
-    with cursor_dict() as cur:
-        cur.execute(
-            """
-            SELECT id, titulo, slug, tipo, ubicacion, precio, habitaciones, banos,
-                   area_construida, area_total, imagen_principal, descripcion
-            FROM propiedades
-            WHERE activo = 1 AND estado = 'disponible' AND id = %s
-            """,
-            (propiedad_id,),
-        )
-        return cur.fetchone()
+
+    def run() -> Optional[dict]:
+        with cursor_dict() as cur:
+            cur.execute(
+                f"""
+                SELECT {PROPIEDAD_COLS}
+                FROM propiedades
+                WHERE activo = 1 AND estado = 'disponible' AND id = %s
+                """,
+                (propiedad_id,),
+            )
+            return cur.fetchone()
+
+    row = _cacheado("propiedades", ("id", int(propiedad_id)), run)
+    return dict(row) if row else None
 
 
 def buscar_proyectos(
     ubicacion: Optional[str] = None,
     limite: int = 6,
+    ids: Optional[List[int]] = None,
 ) -> List[dict]:
     """
-    Proyectos activos. Consulta la BD en vivo (sin caché):
-    proyectos nuevos con activo=1 aparecen de inmediato en el bot.
-    Opcional filtro por ubicación.
+    Proyectos activos. Proyectos nuevos con activo=1 aparecen de inmediato en el bot
+    (la caché se vacía con cada aviso del panel).
+    Opcional filtro por ubicación, o por ids ya resueltos por el gazetteer.
     """
-    q = """
-        SELECT id, nombre, slug, ubicacion, precio_desde, imagen_principal, descripcion
+    if ids is not None and not ids:
+        return []
+    rows = _desde_memoria("proyectos", ubicacion=ubicacion, limite=limite, ids=ids)
+    if rows is not None:
+        return rows
+    q = f"""
+        SELECT {PROYECTO_COLS}
         FROM proyectos
         WHERE activo = 1
         """
     params: List[Any] = []
-    if ubicacion:
+    ubicacion = _norm_like(ubicacion)
+    if ids:
+        q += f" AND id IN ({', '.join(['%s'] * len(ids))})"
+        params.extend(sorted(ids))
+    elif ubicacion:
         q += " AND (ubicacion LIKE %s OR nombre LIKE %s)"
         params.extend([f"%{ubicacion}%", f"%{ubicacion}%"])
     q += " ORDER BY destacado DESC, orden, id LIMIT %s"
     params.append(limite)
+    return _consulta_compartida("proyectos", q, params)
 
+
+def listar_propiedades_activas() -> List[dict]:
+    """Todas las propiedades activas y disponibles (para construir el gazetteer del catálogo)."""
     with cursor_dict() as cur:
-        cur.execute(q, params)
+        cur.execute(
+            f"""
+            SELECT {PROPIEDAD_COLS}
+            FROM propiedades
+            WHERE activo = 1 AND estado = 'disponible'
+            ORDER BY destacado DESC, orden, id
+            """,
+        )
+        return cur.fetchall()
+
+
+def listar_proyectos_activos() -> List[dict]:
+    """Todos los proyectos activos (para construir el gazetteer del catálogo)."""
+    with cursor_dict() as cur:
+        cur.execute(
+            f"""
+            SELECT {PROYECTO_COLS}
+            FROM proyectos
+            WHERE activo = 1
+            ORDER BY destacado DESC, orden, id
+            """,
+        )
         return cur.fetchall()
 
 
+# tabla -> (FROM/WHERE, columnas cortas que usa el bot, columna de texto largo o None).
+# El texto largo (descripción, respuesta) solo entra en la firma completa.
+_FIRMAS = {
+    "propiedades": (
+        "FROM propiedades WHERE activo = 1 AND estado = 'disponible'",
+        "id, titulo, slug, tipo, ubicacion, precio, habitaciones, banos, area_construida, area_total, "
+        "imagen_principal, destacado, orden",
+        "descripcion",
+    ),
+    "proyectos": (
+        "FROM proyectos WHERE activo = 1",
+        "id, nombre, slug, ubicacion, precio_desde, imagen_principal, destacado, orden",
+        "descripcion",
+    ),
+    "chatbot_faqs": ("FROM chatbot_faqs WHERE activo = 1", "id, pregunta, categoria, palabras_clave, orden", "respuesta"),
+    "chatbot_config": ("FROM chatbot_config", "`key`, `value`", None),
+    "chatbot_entrenamiento": ("FROM chatbot_entrenamiento", "id, estado_aprobacion, intencion, respuesta_corregida", None),
+}
+# Tablas con fecha_actualizacion (se consulta una vez a information_schema)
+_con_fecha: Optional[frozenset] = None
+
+
+def _tablas_con_fecha(cur) -> frozenset:
+    global _con_fecha
+    if _con_fecha is None:
+        tablas = ", ".join(f"'{t}'" for t in _FIRMAS)
+        cur.execute(
+            f"""
+            SELECT TABLE_NAME AS tabla FROM information_schema.COLUMNS
+             WHERE TABLE_SCHEMA = DATABASE() AND COLUMN_NAME = 'fecha_actualizacion' AND TABLE_NAME IN ({tablas})
+            """,
+        )
+        _con_fecha = frozenset(r["tabla"] for r in cur.fetchall())
+    return _con_fecha
+
+
+def firmas_tablas(completa: bool = False) -> Dict[str, Tuple[tuple, Optional[int]]]:
+    """
+    Firma de cada tabla que alimenta una caché (una sola ida a la BD):
+    {tabla: ((conteo, checksum, MAX(fecha_actualizacion)), checksum del texto largo)}.
+    El checksum es de las columnas cortas que usa el bot, más fecha_actualizacion donde
+    existe (entonces el texto largo no hace falta). El texto largo (descripción, respuesta) solo se
+    lee con completa=True (cada CHANGES_FULL_SEC); si no, su checksum va como None.
+    """
+    with cursor_dict() as cur:
+        con_fecha = _tablas_con_fecha(cur)
+        partes = []
+        for tabla, (desde, cortas, largo) in _FIRMAS.items():
+            if tabla in con_fecha:
+                # La fecha cambia con cualquier edición (también del texto largo); las columnas
+                # cortas siguen en el checksum por si dos ediciones caen en el mismo segundo
+                cortas, ultima, largo = f"{cortas}, fecha_actualizacion", "MAX(fecha_actualizacion)", None
+            else:
+                ultima = "NULL"
+            contenido = f"BIT_XOR(CRC32(CONCAT_WS('|', id, {largo})))" if completa and largo else "NULL"
+            partes.append(
+                f"SELECT '{tabla}' AS tabla, COUNT(*) AS n, BIT_XOR(CRC32(CONCAT_WS('|', {cortas}))) AS crc, "
+                f"{ultima} AS ultima, {contenido} AS contenido {desde}"
+            )
+        cur.execute("\nUNION ALL\n".join(partes))
+        return {r["tabla"]: ((r["n"], r["crc"], r["ultima"]), r["contenido"]) for r in cur.fetchall()}
+
+
+def ocupacion_citas(fecha: str) -> Tuple[int, Dict[str, int]]:
+    """
+    (agentes activos, {hora "HH:MM": citas no canceladas}) de una fecha YYYY-MM-DD, en una
+    sola ida a la BD. Una franja está libre mientras tenga menos citas que agentes.
+    """
+    with cursor_dict() as cur:
+        cur.execute(
+            """
+            SELECT NULL AS hora, COUNT(*) AS n FROM agentes WHERE activo = 1
+            UNION ALL
+            SELECT TIME_FORMAT(hora, '%%H:%%i'), COUNT(*)
+              FROM citas
+             WHERE fecha = %s AND estado <> 'cancelada'
+             GROUP BY TIME_FORMAT(hora, '%%H:%%i')
+            """,
+            (fecha,),
+        )
+        rows = cur.fetchall()
+    agentes = 0
+    ocupadas: Dict[str, int] = {}
+    for r in rows:
+        if r["hora"] is None:
+            agentes = int(r["n"] or 0)
+        else:
+            ocupadas[r["hora"]] = int(r["n"] or 0)
+    return agentes, ocupadas
+
+
 def crear_conversacion(origen: str = "web") -> str:
     """Crea conversación y devuelve id (UUID)."""
     cid = str(uuid.uuid4()).replace("-", "")[:32]
@@ -311,7 +604,29 @@ def actualizar_entrenamiento_evaluacion(
                 """,
                 (estado_aprobacion, entrenamiento_id),
             )
-        return cur.rowcount > 0
+        ok = cur.rowcount > 0
+    if ok:
+        # Cambio hecho por este proceso: no esperar al siguiente sondeo
+        _entrenamiento_snapshot.invalidate()
+    return ok
+
+
+def _cargar_entrenamiento_reciente() -> List[dict]:
+    with cursor_dict() as cur:
+        cur.execute(
+            """
+            SELECT id, input_usuario, respuesta_chatbot, respuesta_corregida, intencion
+            FROM chatbot_entrenamiento
+            WHERE estado_aprobacion IN ('correcta', 'corregida')
+            ORDER BY fecha_actualizacion DESC
+            LIMIT 200
+            """,
+        )
+        return cur.fetchall()
+
+
+_entrenamiento_snapshot = Snapshot(_cargar_entrenamiento_reciente)
+changes.subscribe(("chatbot_entrenamiento",), _entrenamiento_snapshot.invalidate)
 
 
 def entrenamiento_match(texto: str, intencion: Optional[str], limite: int = 3) -> Optional[dict]:
@@ -327,17 +642,7 @@ def entrenamiento_match(texto: str, intencion: Optional[str], limite: int = 3) -
     if not words:
         return None
 
-    with cursor_dict() as cur:
-        cur.execute(
-            """
-            SELECT id, input_usuario, respuesta_chatbot, respuesta_corregida, intencion
-            FROM chatbot_entrenamiento
-            WHERE estado_aprobacion IN ('correcta', 'corregida')
-            ORDER BY fecha_actualizacion DESC
-            LIMIT 200
-            """,
-        )
-        rows = cur.fetchall()
+    rows = _entrenamiento_snapshot.get() if changes.running() else _cargar_entrenamiento_reciente()
 
     scored = []
     for r in rows:
@@ -383,3 +688,20 @@ def listar_entrenamiento(
     with cursor_dict() as cur:
         cur.execute(q, params)
         return cur.fetchall()
+
+
+def listar_entrenamiento_aprobado(limite: int = 20000) -> List[dict]:
+    """Pares input_usuario/intencion aprobados (correcta o corregida) para entrenar el clasificador."""
+    with cursor_dict() as cur:
+        cur.execute(
+            """
+            SELECT id, input_usuario, intencion
+            FROM chatbot_entrenamiento
+            WHERE estado_aprobacion IN ('correcta', 'corregida')
+              AND intencion IS NOT NULL AND intencion <> ''
+            ORDER BY id
+            LIMIT %s
+            """,
+            (limite,),
+        )
+        return cur.fetchall()
@@ -0,0 +1,253 @@
+# disponibilidad.py - Horarios de cita libres calculados desde la BD (sin pasar por PHP)
+"""
+Las franjas del día salen de la configuración (CITAS_HORA_INICIO..CITAS_HORA_FIN cada
+CITAS_INTERVALO_MIN, solo CITAS_DIAS); una franja está libre mientras tenga menos citas
+no canceladas que agentes activos, y hoy solo cuentan las que empiezan con
+CITAS_ANTICIPACION_MIN de margen. Estas reglas (y las columnas de citas/agentes que lee
+db.ocupacion_citas) son una reconstrucción de api/horarios-disponibles.php, que no está
+en este repo: por eso el PHP sigue mandando por defecto (DISPONIBILIDAD_NATIVA=0) y el
+cálculo propio corre en sombra para una muestra de las consultas (DISPONIBILIDAD_CONTRASTE,
+fracción de 0 a 1), comparado con la respuesta del PHP (contraste_ok / contraste_difiere en
+/metrics). Con paridad comprobada, DISPONIBILIDAD_NATIVA=1 invierte los papeles: responde
+la BD y el PHP queda como contraste (con la misma muestra). Si la BD falla, se usa el PHP.
+
+Cada fecha se guarda DISPONIBILIDAD_TTL_SEC segundos (las citas del sitio web también
+ocupan franjas) y se descarta al agendar por el bot. El contraste no bloquea el turno:
+la consulta al PHP corre en el bulkhead "php" y el cálculo en sombra en el "db"; si están
+llenos, esa comparación se omite.
+Cuando el bot pregunta la fecha, los próximos HORARIOS_PREFETCH_DIAS días hábiles se
+consultan en segundo plano, de a una fecha, en el bulkhead de quien responde ("php" o
+"db"): al responder "mañana" las horas ya están listas.
+"""
+
+import logging
+import random
+import threading
+import time
+from concurrent.futures import Future
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import (
+    CITAS_ANTICIPACION_MIN,
+    CITAS_DIAS,
+    CITAS_HORA_FIN,
+    CITAS_HORA_INICIO,
+    CITAS_INTERVALO_MIN,
+    CITAS_TZ,
+    DISPONIBILIDAD_CONTRASTE,
+    DISPONIBILIDAD_NATIVA,
+    DISPONIBILIDAD_TTL_SEC,
+    HORARIOS_PREFETCH_DIAS,
+)
+import bulkheads
+from db import ocupacion_citas
+from php_client import consultar_horarios, consultar_horarios_async, invalidar_horarios
+from singleflight import SingleFlight
+
+logger = logging.getLogger("chatbot-api")
+
+try:
+    from zoneinfo import ZoneInfo
+
+    _TZ: Any = ZoneInfo(CITAS_TZ)
+except Exception:  # sin base de zonas horarias: hora local del servidor
+    _TZ = None
+
+
+def _minutos(hhmm: str) -> int:
+    h, m = hhmm.strip().split(":")[:2]
+    return int(h) * 60 + int(m)
+
+
+def franjas() -> List[str]:
+    """Todas las franjas de un día hábil: ['08:30', '09:30', ...]."""
+    inicio, fin = _minutos(CITAS_HORA_INICIO), _minutos(CITAS_HORA_FIN)
+    paso = max(CITAS_INTERVALO_MIN, 1)
+    return [f"{m // 60:02d}:{m % 60:02d}" for m in range(inicio, fin + 1, paso)]
+
+
+def _ahora() -> datetime:
+    return datetime.now(_TZ) if _TZ is not None else datetime.now()
+
+
+def calcular(fecha: str, agentes: int, ocupadas: Dict[str, int], ahora: Optional[datetime] = None) -> List[str]:
+    """Franjas libres de la fecha según agentes activos y citas ya tomadas."""
+    dia = date.fromisoformat(fecha)
+    ahora = ahora or _ahora()
+    if dia < ahora.date() or dia.weekday() not in CITAS_DIAS or agentes <= 0:
+        return []
+    libres = [h for h in franjas() if ocupadas.get(h, 0) < agentes]
+    if dia == ahora.date():
+        limite = ahora.hour * 60 + ahora.minute + CITAS_ANTICIPACION_MIN
+        libres = [h for h in libres if _minutos(h) >= limite]
+    return libres
+
+
+class Disponibilidad:
+    def __init__(self, ttl: float) -> None:
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._cache: Dict[str, Tuple[float, List[str]]] = {}
+        # Generación por fecha: una consulta que empezó antes de invalidar no se guarda
+        self._gen: Dict[str, int] = {}
+        self._flight = SingleFlight()
+        self._prefetch_lock = threading.Lock()
+        self._stats = {
+            "hits": 0, "nativas": 0, "php": 0, "errores_bd": 0, "invalidaciones": 0,
+            "contraste_ok": 0, "contraste_difiere": 0, "contraste_error": 0, "contraste_omitido": 0,
+            "prefetch": 0, "prefetch_omitido": 0,
+        }
+
+    def horarios(self, fecha: str) -> Optional[List[str]]:
+        """Horas libres de la fecha (YYYY-MM-DD). None = no se pudo saber (ni BD ni PHP)."""
+        try:
+            date.fromisoformat(fecha)
+        except (TypeError, ValueError):
+            return []
+        hit = self._cache.get(fecha)
+        if hit is not None and hit[0] > time.monotonic():
+            self._stats["hits"] += 1
+            return hit[1]
+        gen = self._gen.get(fecha, 0)
+        horas = self._flight.do((fecha, gen), lambda: self._consultar(fecha))
+        self._guardar(fecha, gen, horas)
+        return horas
+
+    def _guardar(self, fecha: str, gen: int, horas: Optional[List[str]]) -> None:
+        """Recuerda las horas de la fecha salvo que se haya invalidado desde que se pidieron."""
+        if horas is None:
+            return
+        with self._lock:
+            if self._gen.get(fecha, 0) == gen:
+                self._cache[fecha] = (time.monotonic() + self.ttl, horas)
+            for f in [f for f, (exp, _) in self._cache.items() if exp <= time.monotonic()]:
+                del self._cache[f]
+
+    @staticmethod
+    def _muestra() -> bool:
+        """Si esta consulta entra en la muestra que se contrasta."""
+        return DISPONIBILIDAD_CONTRASTE > 0 and random.random() < DISPONIBILIDAD_CONTRASTE
+
+    def _consultar(self, fecha: str) -> Optional[List[str]]:
+        if DISPONIBILIDAD_NATIVA:
+            horas = self._calcular(fecha)
+            if horas is not None:
+                self._stats["nativas"] += 1
+                if self._muestra():
+                    self._contrastar_php(fecha, horas)
+                return horas
+        self._stats["php"] += 1
+        php = consultar_horarios(fecha)
+        if php is not None and not DISPONIBILIDAD_NATIVA and self._muestra():
+            self._en_sombra(fecha, php)
+        return php
+
+    def _calcular(self, fecha: str) -> Optional[List[str]]:
+        """Horas libres calculadas desde la BD; None si la consulta falla."""
+        try:
+            agentes, ocupadas = ocupacion_citas(fecha)
+        except Exception as e:
+            self._stats["errores_bd"] += 1
+            logger.warning("No se pudieron calcular los horarios de %s en BD: %s", fecha, e)
+            return None
+        return calcular(fecha, agentes, ocupadas)
+
+    def _contrastar_php(self, fecha: str, horas: List[str]) -> None:
+        """Pregunta al PHP en su bulkhead y compara al llegar la respuesta (no espera)."""
+        try:
+            fut = consultar_horarios_async(fecha)
+        except bulkheads.Saturado:
+            self._stats["contraste_omitido"] += 1
+            return
+        fut.add_done_callback(
+            lambda f: self._comparar(fecha, horas, None if f.cancelled() or f.exception() else f.result())
+        )
+
+    def _en_sombra(self, fecha: str, php: List[str]) -> None:
+        """Calcula en el bulkhead "db" lo que habría respondido la BD y lo compara con el PHP."""
+        try:
+            fut = bulkheads.db.submit(self._calcular, fecha)
+        except bulkheads.Saturado:
+            self._stats["contraste_omitido"] += 1
+            return
+        fut.add_done_callback(
+            lambda f: self._comparar(fecha, None if f.cancelled() or f.exception() else f.result(), php)
+        )
+
+    def _comparar(self, fecha: str, horas: Optional[List[str]], php: Optional[List[str]]) -> None:
+        if horas is None or php is None:
+            self._stats["contraste_error"] += 1
+        elif sorted(map(_minutos, php)) == sorted(map(_minutos, horas)):
+            self._stats["contraste_ok"] += 1
+        else:
+            self._stats["contraste_difiere"] += 1
+            logger.warning("Horarios de %s no coinciden con el PHP: API %s, PHP %s", fecha, horas, php)
+
+    def proximas_fechas(self, n: int, desde: Optional[date] = None) -> List[str]:
+        """Los próximos n días con citas (CITAS_DIAS), empezando hoy."""
+        dia = desde or _ahora().date()
+        out: List[str] = []
+        for _ in range(n * 7 if CITAS_DIAS else 0):
+            if len(out) >= n:
+                break
+            if dia.weekday() in CITAS_DIAS:
+                out.append(dia.isoformat())
+            dia += timedelta(days=1)
+        return out
+
+    def prefetch(self, n: int = HORARIOS_PREFETCH_DIAS) -> None:
+        """
+        Consulta en segundo plano los horarios de los próximos n días hábiles, uno tras otro:
+        cada fecha es una tarea del bulkhead de quien responde (sin hilos propios ni esperas
+        anidadas); si está lleno, el prefetch se deja para la próxima vez.
+        """
+        if n <= 0:
+            return
+        ahora = time.monotonic()
+        fechas = [f for f in self.proximas_fechas(n) if not (f in self._cache and self._cache[f][0] > ahora)]
+        # Un solo prefetch en curso: si ya hay uno, ese deja la caché lista
+        if not fechas or not self._prefetch_lock.acquire(blocking=False):
+            return
+
+        def siguiente(k: int) -> None:
+            if k >= len(fechas):
+                self._prefetch_lock.release()
+                return
+            fecha, gen = fechas[k], self._gen.get(fechas[k], 0)
+            try:
+                fut = bulkheads.db.submit(self._calcular, fecha) if DISPONIBILIDAD_NATIVA else consultar_horarios_async(fecha)
+            except bulkheads.Saturado:
+                self._stats["prefetch_omitido"] += 1
+                self._prefetch_lock.release()
+                return
+
+            def hecho(f: Future) -> None:
+                try:
+                    horas = None if f.cancelled() or f.exception() else f.result()
+                    self._guardar(fecha, gen, horas)
+                    if horas is not None:
+                        self._stats["prefetch"] += 1
+                finally:
+                    siguiente(k + 1)
+
+            fut.add_done_callback(hecho)
+
+        siguiente(0)
+
+    def invalidar(self, fecha: Optional[str]) -> None:
+        """Tras agendar (o intentar agendar) en esa fecha: la próxima consulta va a la BD (o al PHP)."""
+        invalidar_horarios(fecha)
+        with self._lock:
+            self._cache.pop(fecha or "", None)
+            self._gen[fecha or ""] = self._gen.get(fecha or "", 0) + 1
+            self._stats["invalidaciones"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self._stats, "nativa": DISPONIBILIDAD_NATIVA, "muestra_contraste": DISPONIBILIDAD_CONTRASTE, "fechas": len(self._cache)}
+
+
+agenda = Disponibilidad(DISPONIBILIDAD_TTL_SEC)
+horarios = agenda.horarios
+invalidar = agenda.invalidar
+prefetch = agenda.prefetch
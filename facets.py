@@ -0,0 +1,173 @@
+# facets.py - Conteos por tipo/zona/habitaciones e histograma de precios del catálogo
+"""
+Para que el widget muestre "rangos de precio" y conteos antes de que el usuario escriba.
+Las columnas se pasan a arrays al refrescar el catálogo; cada combinación de filtros se
+calcula en memoria (máscaras NumPy) y se guarda ya serializada con su ETag, así que las
+peticiones repetidas solo devuelven bytes. Conteos "disjuntivos": cada faceta se cuenta
+con los demás filtros, no con el suyo (dentro de tipo=renta se sigue viendo cuántas hay
+en venta).
+"""
+
+import hashlib
+import json
+import math
+import threading
+from collections import Counter, OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from cards import format_precio
+from nlu import fold
+
+# Zonas listadas (las de más propiedades); el resto no se muestra como faceta
+MAX_ZONAS = 20
+# Intervalos del histograma de precios (como máximo)
+MAX_BINS = 8
+# Habitaciones: 1, 2, ..., HAB_MAX+ (la última agrupa las mayores)
+HAB_MAX = 5
+# Combinaciones de filtros memorizadas por versión del catálogo
+MAX_MEMO = 256
+
+Filtros = Tuple[Optional[str], Optional[str], Optional[int], Optional[float], Optional[float]]
+
+
+def _clave_zona(v: Optional[str]) -> str:
+    return fold(" ".join((v or "").lower().split()))
+
+
+def _paso(rango: float) -> float:
+    """Paso "redondo" (1, 2, 2.5, 5 x 10^k) para que el rango quepa en MAX_BINS intervalos."""
+    bruto = rango / MAX_BINS
+    base = 10 ** math.floor(math.log10(bruto))
+    for m in (1, 2, 2.5, 5, 10):
+        if m * base >= bruto:
+            return m * base
+    return 10 * base
+
+
+def _histograma(precios: np.ndarray) -> List[Dict[str, Any]]:
+    precios = precios[~np.isnan(precios)]
+    if not len(precios):
+        return []
+    lo, hi = float(precios.min()), float(precios.max())
+    if hi <= lo:
+        return [{"desde": lo, "hasta": hi, "count": int(len(precios)), "etiqueta": format_precio(lo)}]
+    paso = _paso(hi - lo)
+    inicio = math.floor(lo / paso) * paso
+    bordes = inicio + paso * np.arange(int(math.floor((hi - inicio) / paso)) + 2)
+    conteos, _ = np.histogram(precios, bins=bordes)
+    return [
+        {
+            "desde": float(a),
+            "hasta": float(b),
+            "count": int(c),
+            "etiqueta": f"{format_precio(float(a))} - {format_precio(float(b))}",
+        }
+        for a, b, c in zip(bordes[:-1], bordes[1:], conteos)
+    ]
+
+
+class Facetas:
+    def __init__(self, propiedades: Sequence[Dict[str, Any]]) -> None:
+        self.total = len(propiedades)
+        tipos = [(p.get("tipo") or "").lower() for p in propiedades]
+        self._tipos = sorted(set(tipos))
+        self.tipo = np.asarray([self._tipos.index(t) for t in tipos], dtype=np.int32)
+        # Zona = ubicación tal como se publica (sin distinguir mayúsculas/tildes); se muestra
+        # la escritura más frecuente
+        variantes: List[Counter] = []
+        indice: Dict[str, int] = {}
+        codigos = []
+        for p in propiedades:
+            clave = _clave_zona(p.get("ubicacion"))
+            if clave not in indice:
+                indice[clave] = len(variantes)
+                variantes.append(Counter())
+            variantes[indice[clave]][(p.get("ubicacion") or "").strip()] += 1
+            codigos.append(indice[clave])
+        self._zonas = [v.most_common(1)[0][0] for v in variantes]
+        self._zona_idx = indice
+        self.zona = np.asarray(codigos, dtype=np.int32)
+        hab = np.asarray([p.get("habitaciones") if p.get("habitaciones") is not None else np.nan for p in propiedades], dtype=np.float64)
+        self.habitaciones = hab
+        self.precio = np.asarray([float(p["precio"]) if p.get("precio") else np.nan for p in propiedades], dtype=np.float64)
+        self._lock = threading.Lock()
+        self._memo: "OrderedDict[Filtros, Tuple[str, bytes]]" = OrderedDict()
+
+    def _mascaras(self, f: Filtros) -> Dict[str, np.ndarray]:
+        tipo, zona, habitaciones, precio_min, precio_max = f
+        m: Dict[str, np.ndarray] = {}
+        if tipo:
+            m["tipo"] = self.tipo == (self._tipos.index(tipo) if tipo in self._tipos else -1)
+        if zona:
+            m["zona"] = self.zona == self._zona_idx.get(zona, -1)
+        if habitaciones is not None:
+            m["habitaciones"] = self.habitaciones >= habitaciones
+        if precio_min is not None or precio_max is not None:
+            p = np.ones(self.total, dtype=bool)
+            if precio_min is not None:
+                p &= self.precio >= precio_min
+            if precio_max is not None:
+                p &= self.precio <= precio_max
+            m["precio"] = p
+        return m
+
+    def _sin(self, mascaras: Dict[str, np.ndarray], faceta: Optional[str]) -> np.ndarray:
+        """Todas las máscaras menos la de la faceta (None = todas)."""
+        out = np.ones(self.total, dtype=bool)
+        for nombre, m in mascaras.items():
+            if nombre != faceta:
+                out &= m
+        return out
+
+    def _calcular(self, f: Filtros) -> Dict[str, Any]:
+        mascaras = self._mascaras(f)
+        t = self._sin(mascaras, "tipo")
+        z = self._sin(mascaras, "zona")
+        h = self._sin(mascaras, "habitaciones")
+        conteo_tipo = np.bincount(self.tipo[t], minlength=len(self._tipos))
+        conteo_zona = np.bincount(self.zona[z], minlength=len(self._zonas))
+        top_zonas = np.argsort(-conteo_zona, kind="stable")[:MAX_ZONAS]
+        hab = self.habitaciones[h]
+        hab = np.minimum(hab[~np.isnan(hab)], HAB_MAX).astype(np.int64)
+        conteo_hab = np.bincount(hab, minlength=HAB_MAX + 1)
+        por_hab = [(n, int(conteo_hab[n:].sum() if n == HAB_MAX else conteo_hab[n])) for n in range(1, HAB_MAX + 1)]
+        filtros = {k: v for k, v in zip(("tipo", "zona", "habitaciones", "precio_min", "precio_max"), f) if v is not None}
+        if f[1] in self._zona_idx:
+            filtros["zona"] = self._zonas[self._zona_idx[f[1]]]
+        return {
+            "total": int(self._sin(mascaras, None).sum()),
+            "filtros": filtros,
+            "tipo": [{"valor": v, "count": int(c)} for v, c in zip(self._tipos, conteo_tipo) if c and v],
+            "zona": [{"valor": self._zonas[i], "count": int(conteo_zona[i])} for i in top_zonas if conteo_zona[i] and self._zonas[i]],
+            "habitaciones": [
+                {"valor": f"{n}+" if n == HAB_MAX else str(n), "minimo": n, "count": c} for n, c in por_hab if c
+            ],
+            "precio": _histograma(self.precio[self._sin(mascaras, "precio")]),
+        }
+
+    def respuesta(
+        self,
+        tipo: Optional[str] = None,
+        zona: Optional[str] = None,
+        habitaciones: Optional[int] = None,
+        precio_min: Optional[float] = None,
+        precio_max: Optional[float] = None,
+    ) -> Tuple[str, bytes]:
+        """(ETag, JSON) de las facetas con esos filtros; cada combinación se calcula una vez."""
+        f: Filtros = ((tipo or "").lower() or None, _clave_zona(zona) or None, habitaciones, precio_min, precio_max)
+        hit = self._memo.get(f)
+        if hit is not None:
+            return hit
+        body = json.dumps(self._calcular(f), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        etag = '"' + hashlib.blake2b(body, digest_size=8).hexdigest() + '"'
+        with self._lock:
+            self._memo[f] = (etag, body)
+            while len(self._memo) > MAX_MEMO:
+                self._memo.popitem(last=False)
+        return etag, body
+
+
+def build(propiedades: Sequence[Dict[str, Any]]) -> Facetas:
+    return Facetas(propiedades)
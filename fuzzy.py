@@ -0,0 +1,106 @@
+# fuzzy.py - Corrección rápida de nombres mal escritos (ibisa, pereria)
+"""
+Índice de borrados simétricos (estilo SymSpell) sobre el vocabulario del catálogo.
+Se precalcula al refrescar el catálogo; corregir un token cuesta unas pocas
+búsquedas en dict (microsegundos). Palabras conocidas (FAQs, keywords del NLU)
+nunca se corrigen hacia un nombre del catálogo.
+"""
+
+import logging
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+logger = logging.getLogger("chatbot-api")
+
+# Tokens más cortos no se corrigen (demasiado ambiguos)
+MIN_LEN = 4
+
+_stats: Dict[str, int] = {"lookups": 0, "corrected": 0, "misses": 0}
+
+
+def _max_dist(word: str) -> int:
+    return 1 if len(word) < 7 else 2
+
+
+def _deletes(word: str, max_dist: int) -> Set[str]:
+    """Todas las variantes de word con hasta max_dist letras borradas."""
+    out = {word}
+    frontier = {word}
+    for _ in range(max_dist):
+        nxt = set()
+        for w in frontier:
+            if len(w) <= 1:
+                continue
+            for i in range(len(w)):
+                nxt.add(w[:i] + w[i + 1:])
+        out |= nxt
+        frontier = nxt
+    return out
+
+
+def _distance(a: str, b: str, limit: int) -> int:
+    """Damerau-Levenshtein (transposiciones adyacentes); corta en cuanto supera limit."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    prev2: List[int] = []
+    prev = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        cur = [i] + [0] * len(b)
+        row_min = cur[0]
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                cur[j] = min(cur[j], prev2[j - 2] + 1)
+            row_min = min(row_min, cur[j])
+        if row_min > limit:
+            return limit + 1
+        prev2, prev = prev, cur
+    return prev[len(b)]
+
+
+class FuzzyIndex:
+    """Vocabulario (token -> frecuencia) + índice de borrados -> tokens candidatos."""
+
+    def __init__(self, vocab: Dict[str, int], known: Iterable[str] = ()) -> None:
+        self.vocab = dict(vocab)
+        self.known = set(known) | set(self.vocab)
+        self._index: Dict[str, List[str]] = {}
+        for word in self.vocab:
+            for d in _deletes(word, _max_dist(word)):
+                self._index.setdefault(d, []).append(word)
+
+    def correct(self, token: str) -> Optional[str]:
+        """Token del vocabulario más cercano, o None si es conocido o no hay candidato."""
+        if len(token) < MIN_LEN or token in self.known or token.isdigit():
+            return None
+        _stats["lookups"] += 1
+        limit = _max_dist(token)
+        best: Optional[Tuple[int, int, str]] = None
+        seen: Set[str] = set()
+        for d in _deletes(token, limit):
+            for cand in self._index.get(d, ()):
+                # Casi nunca se equivoca la primera letra; exigirla evita correcciones absurdas
+                if cand in seen or cand[0] != token[0]:
+                    continue
+                seen.add(cand)
+                dist = _distance(token, cand, min(limit, _max_dist(cand)))
+                if dist > min(limit, _max_dist(cand)):
+                    continue
+                key = (dist, -self.vocab[cand], cand)
+                if best is None or key < best:
+                    best = key
+        if best is None:
+            _stats["misses"] += 1
+            return None
+        _stats["corrected"] += 1
+        logger.debug("Fuzzy: '%s' -> '%s' (distancia %d)", token, best[2], best[0])
+        return best[2]
+
+    def correct_tokens(self, tokens: Sequence[str]) -> Tuple[str, ...]:
+        return tuple(self.correct(t) or t for t in tokens)
+
+
+def stats() -> Dict[str, float]:
+    """Contadores de correcciones y tasa de aciertos."""
+    lookups = _stats["lookups"]
+    return {**_stats, "hit_rate": round(_stats["corrected"] / lookups, 4) if lookups else 0.0}
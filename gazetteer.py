@@ -0,0 +1,213 @@
+# gazetteer.py - Diccionario de lugares y nombres derivado del catálogo
+"""
+Trie de frases (tokens sin tildes) construido desde propiedades.ubicacion,
+proyectos.nombre/ubicacion y, de propiedades.titulo, solo frases de dos o más
+palabras (una palabra suelta del título, "moderno", "campestre", no es un lugar
+y acotaría la búsqueda a un puñado de propiedades). Resuelve menciones del mensaje ("casas en Pereira",
+"busco Ibiza") a ids canónicos en una sola pasada; la búsqueda filtra por id
+en vez de LIKE '%x%'.
+"""
+
+import re
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from fuzzy import FuzzyIndex
+from nlu import (
+    KEYWORDS_AGENDAR,
+    KEYWORDS_BUSCAR,
+    KEYWORDS_DESPEDIDA,
+    KEYWORDS_INFO,
+    KEYWORDS_SALUDO,
+    RE_TOKEN,
+    fold,
+)
+
+# Frases más largas no aportan (los títulos son cortos)
+MAX_NGRAM = 6
+
+# Palabras que por sí solas no identifican un lugar ni un proyecto
+STOPWORDS = frozenset((
+    "a", "al", "con", "de", "del", "el", "en", "la", "las", "los", "para", "por", "sin", "su", "un", "una", "y",
+))
+GENERICAS = frozenset((
+    "casa", "casas", "apartamento", "apartamentos", "aparto", "apto", "lote", "lotes", "local", "oficina",
+    "finca", "bodega", "proyecto", "proyectos", "propiedad", "propiedades", "venta", "renta", "arriendo",
+    "habitaciones", "habitacion", "banos", "bano", "alcobas", "piso", "barrio", "sector", "zona", "ciudad",
+    "conjunto", "edificio", "torre", "etapa", "nuevo", "nueva", "hermosa", "hermoso", "amplia", "amplio",
+    "bonita", "bonito", "excelente", "cerca", "colombia",
+))
+
+_SEGMENTO = re.compile(r"[,;/()|]+|\s-\s")
+
+
+class Mention:
+    """
+    Mención resuelta: etiqueta canónica + ids de propiedades y proyectos que la contienen.
+    de_titulo: la frase solo aparece en títulos de propiedades (no es lugar ni proyecto).
+    """
+
+    __slots__ = ("label", "start", "end", "propiedad_ids", "proyecto_ids", "de_titulo")
+
+    def __init__(
+        self, label: str, start: int, end: int, propiedad_ids: List[int], proyecto_ids: List[int], de_titulo: bool = False
+    ):
+        self.label = label
+        self.start = start
+        self.end = end
+        self.propiedad_ids = propiedad_ids
+        self.proyecto_ids = proyecto_ids
+        self.de_titulo = de_titulo
+
+
+def _tokens_con_original(valor: str) -> Tuple[List[str], List[str]]:
+    """Tokens normalizados (para el trie) y su forma original (para la etiqueta)."""
+    keys: List[str] = []
+    originales: List[str] = []
+    for m in re.finditer(r"\w+", valor or ""):
+        key = RE_TOKEN.findall(fold(m.group(0).lower()))
+        if not key:
+            continue
+        keys.append("".join(key))
+        originales.append(m.group(0))
+    return keys, originales
+
+
+def _es_frase_util(keys: Sequence[str]) -> bool:
+    # La frase empieza por un token distintivo: "casa en pereira" no debe tapar a "pereira"
+    # (la mención más larga gana y dejaría fuera las demás propiedades de Pereira)
+    first, last = keys[0], keys[-1]
+    if first in STOPWORDS or first in GENERICAS or first.isdigit():
+        return False
+    if last in STOPWORDS or last in GENERICAS:
+        return False
+    # Un solo token corto ("sm", "b2") genera demasiados falsos positivos
+    return len(keys) > 1 or len(first) >= 3
+
+
+class Gazetteer:
+    """Trie inmutable; se reconstruye completo cuando cambia el catálogo."""
+
+    def __init__(self) -> None:
+        self._root: Dict[str, Any] = {}
+        self.size = 0
+        self.version = 0
+        # token distintivo -> nº de apariciones (vocabulario para la corrección difusa)
+        self.vocab: Dict[str, int] = {}
+        self.fuzzy: Optional[FuzzyIndex] = None
+
+    def _add(self, keys: Sequence[str], label: str, tipo: str, item_id: int, titulo: bool) -> None:
+        node = self._root
+        for k in keys:
+            node = node.setdefault(k, {})
+        entry = node.get("$")
+        if entry is None:
+            entry = node["$"] = {"label": label, "propiedad": set(), "proyecto": set(), "titulo": titulo}
+            self.size += 1
+        entry[tipo].add(item_id)
+        entry["titulo"] = entry["titulo"] and titulo
+
+    def add_value(self, valor: Optional[str], tipo: str, item_id: int, titulo: bool = False) -> None:
+        """
+        Indexa todas las sub-frases útiles de un nombre/ubicación (equivale a LIKE por tokens).
+        titulo=True (propiedades.titulo): solo frases de dos o más palabras.
+        """
+        if not valor:
+            return
+        for segmento in _SEGMENTO.split(valor):
+            keys, originales = _tokens_con_original(segmento)
+            for k in keys:
+                if len(k) >= 3 and k not in STOPWORDS and k not in GENERICAS and not k.isdigit():
+                    self.vocab[k] = self.vocab.get(k, 0) + 1
+            n = len(keys)
+            for i in range(n):
+                for j in range(i + 1, min(n, i + MAX_NGRAM) + 1):
+                    frase = keys[i:j]
+                    if (len(frase) > 1 or not titulo) and _es_frase_util(frase):
+                        self._add(frase, " ".join(originales[i:j]), tipo, item_id, titulo)
+
+    def _mention(self, entry: Dict[str, Any], start: int, end: int) -> Mention:
+        return Mention(
+            entry["label"], start, end, sorted(entry["propiedad"]), sorted(entry["proyecto"]), entry["titulo"]
+        )
+
+    def find_all(self, tokens: Sequence[str]) -> List[Mention]:
+        """Menciones más largas, de izquierda a derecha, sin solaparse (una pasada sobre los tokens)."""
+        out: List[Mention] = []
+        i, n = 0, len(tokens)
+        while i < n:
+            node = self._root
+            best: Optional[Tuple[int, Dict[str, Any]]] = None
+            j = i
+            while j < n:
+                node = node.get(tokens[j])
+                if node is None:
+                    break
+                j += 1
+                if "$" in node:
+                    best = (j, node["$"])
+            if best:
+                out.append(self._mention(best[1], i, best[0]))
+                i = best[0]
+            else:
+                i += 1
+        return out
+
+    def find(self, tokens: Sequence[str]) -> Optional[Mention]:
+        """Primera mención; si no hay, reintenta con los tokens corregidos (ibisa -> ibiza)."""
+        found = self.find_all(tokens)
+        if not found and self.fuzzy is not None:
+            corrected = self.fuzzy.correct_tokens(tokens)
+            if corrected != tuple(tokens):
+                found = self.find_all(corrected)
+        return found[0] if found else None
+
+    def resolve(self, term: Optional[str]) -> Optional[Mention]:
+        """Resuelve un término suelto (ej. contexto['ubicacion']): frase exacta o primera mención dentro."""
+        if not term:
+            return None
+        tokens = RE_TOKEN.findall(fold(term.lower().strip()))
+        if not tokens:
+            return None
+        node = self._root
+        for k in tokens:
+            node = node.get(k)
+            if node is None:
+                break
+        if node is not None and "$" in node:
+            return self._mention(node["$"], 0, len(tokens))
+        return self.find(tokens)
+
+
+def _palabras(textos: Iterable[Optional[str]]) -> set:
+    out = set()
+    for t in textos:
+        out.update(RE_TOKEN.findall(fold((t or "").lower())))
+    return out
+
+
+# Vocabulario propio del bot: nunca se "corrige" hacia un nombre del catálogo
+_PALABRAS_NLU = _palabras(KEYWORDS_SALUDO + KEYWORDS_BUSCAR + KEYWORDS_AGENDAR + KEYWORDS_INFO + KEYWORDS_DESPEDIDA)
+
+
+def build(
+    propiedades: Iterable[Dict[str, Any]],
+    proyectos: Iterable[Dict[str, Any]],
+    version: int = 0,
+    faqs: Iterable[Dict[str, Any]] = (),
+) -> Gazetteer:
+    """
+    Construye el gazetteer desde filas activas de propiedades y proyectos, con su índice
+    difuso. faqs: su vocabulario (pregunta, palabras_clave) cuenta como palabras conocidas.
+    """
+    g = Gazetteer()
+    for p in propiedades:
+        g.add_value(p.get("titulo"), "propiedad", int(p["id"]), titulo=True)
+        g.add_value(p.get("ubicacion"), "propiedad", int(p["id"]))
+    for pr in proyectos:
+        g.add_value(pr.get("nombre"), "proyecto", int(pr["id"]))
+        g.add_value(pr.get("ubicacion"), "proyecto", int(pr["id"]))
+    known = _PALABRAS_NLU | STOPWORDS | GENERICAS
+    known |= _palabras(f"{f.get('pregunta') or ''} {f.get('palabras_clave') or ''}" for f in faqs)
+    g.fuzzy = FuzzyIndex(g.vocab, known=known)
+    g.version = version
+    return g
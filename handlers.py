@@ -4,12 +4,17 @@ Flujo: ENTENDER → CONSULTAR (BD) → RAZONAR → PERSUADIR.
 Motor de razonamiento integrado; tono de secretaria experta.
 """
 
-from typing import Any, Dict, List, Optional
+import uuid
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
+import bulkheads
+from admission import controlador as admision
+from config import LLM_ESPERA_SEC
 from db import (
     buscar_propiedades,
     buscar_proyectos,
     config_get,
+    cursor_de,
     entrenamiento_match,
     faq_match,
     get_propiedad_by_id,
@@ -28,6 +33,7 @@ from nlu import (
     INTENT_PEDIR_RECOMENDACION,
     INTENT_PREGUNTA_SOBRE_PROPIEDAD,
     INTENT_SALUDO,
+    analyze,
     detect_intent,
     extract_entities,
     extract_fecha,
@@ -35,8 +41,18 @@ from nlu import (
     extract_nombre,
     extract_telefono,
     extract_email,
+    pide_similar,
 )
-from php_client import horarios_disponibles, procesar_cita
+from cards import card_propiedad as _card_propiedad, card_proyecto as _card_proyecto, format_precio as _format_precio
+from catalog import (
+    buscar_por_descripcion,
+    ensure_fresh as catalog_ensure_fresh,
+    filtro_propiedades,
+    filtro_proyectos,
+    propiedades_similares,
+)
+import disponibilidad
+from php_client import procesar_cita
 from reasoning import run_reasoning
 
 try:
@@ -50,22 +66,6 @@ def _cfg(key: str, default: str = "") -> str:
     return (config_get(key) or default).strip()
 
 
-def _format_precio(v: Optional[float]) -> str:
-    if v is None:
-        return ""
-    if v >= 1_000_000:
-        return f"${v/1_000_000:.1f}M" if v % 1_000_000 == 0 else f"${v/1_000_000:.2f}M"
-    return f"${v:,.0f}"
-
-
-def _url_propiedad(slug: str, base: str) -> str:
-    return f"{base.rstrip('/')}/?page=propiedad&slug={slug}"
-
-
-def _url_proyecto(slug: str, base: str) -> str:
-    return f"{base.rstrip('/')}/?page=proyecto&slug={slug}"
-
-
 def handle_saludo(conversacion_id: Optional[str], base_url: str) -> Dict[str, Any]:
     msg = _cfg("saludo_inicial", "Hola, soy el asistente de CTR Bienes Raíces. Puedo mostrarte casas, apartamentos, lotes o en renta, y agendar visitas. ¿Qué buscas?")
     return {"text": msg, "actions": [], "context": {}}
@@ -88,7 +88,17 @@ def handle_buscar_propiedad(
     precio_max = ent.get("presupuesto_max") or contexto.get("presupuesto_max")
     habitaciones = ent.get("habitaciones") if ent.get("habitaciones") is not None else contexto.get("habitaciones")
     ubicacion = (ent.get("ubicacion") or "").strip() or (contexto.get("ubicacion") or "").strip()
-    pide_proyectos = "proyecto" in (texto or "").lower()
+    pide_proyectos = "proyecto" in analyze(texto).normalized
+
+    # Pocos filtros estructurados ("casa iluminada con parqueadero"): la descripción ordena lo
+    # encontrado (antes de razonar, para que el texto hable de la primera card) y, si hay
+    # pocas opciones, completa con las que mejor encajan
+    descritas: List[Dict[str, Any]] = []
+    if precio_min is None and precio_max is None and habitaciones is None and not filtro_propiedades(ubicacion).get("ids"):
+        if pide_proyectos:
+            descritas = _descritas(texto, "proyecto", None, 3)
+        else:
+            descritas = _descritas(texto, "propiedad", tipo, 4)
 
     match_type, props, proyectos, reasoning_text = run_reasoning(
         tipo=tipo,
@@ -97,8 +107,20 @@ def handle_buscar_propiedad(
         habitaciones=habitaciones,
         ubicacion=ubicacion or None,
         pide_proyectos=pide_proyectos,
+        preferidas=[r["id"] for r in descritas],
     )
 
+    extra_text = None
+    if descritas:
+        if pide_proyectos:
+            proyectos, extra = _completar(proyectos, descritas, 3)
+        else:
+            props, extra = _completar(props, descritas, 4)
+        if extra and extra == len(proyectos if pide_proyectos else props):
+            extra_text = "Por lo que describes, estas son las opciones que mejor encajan."
+        elif extra:
+            extra_text = "Por lo que describes, también te pueden interesar estas opciones."
+
     agenda_msg = _cfg("mensaje_agendar_cita", "¿Quieres agendar una visita? Te pido nombre, correo y teléfono para confirmar.")
     cards: List[Dict[str, Any]] = []
     for p in props[:4]:
@@ -108,6 +130,8 @@ def handle_buscar_propiedad(
             cards.append(_card_proyecto(pr, base_url))
 
     lines = [reasoning_text]
+    if extra_text:
+        lines.append(extra_text)
     if cards:
         lines.append(agenda_msg)
 
@@ -129,33 +153,21 @@ def handle_buscar_propiedad(
     return {"text": "\n\n".join(lines), "actions": [], "cards": cards, "context": ctx}
 
 
-def _card_propiedad(p: Dict[str, Any], base_url: str) -> Dict[str, Any]:
-    return {
-        "type": "propiedad",
-        "id": p["id"],
-        "titulo": p["titulo"],
-        "tipo": p.get("tipo", "venta"),
-        "ubicacion": p.get("ubicacion") or "",
-        "precio": _format_precio(float(p["precio"])) if p.get("precio") else "",
-        "habitaciones": p.get("habitaciones"),
-        "banos": p.get("banos"),
-        "descripcion": (p.get("descripcion") or "").strip(),
-        "url": _url_propiedad(p["slug"], base_url),
-        "imagen": f"{base_url.rstrip('/')}/uploads/propiedades/{p['imagen_principal']}" if p.get("imagen_principal") else None,
-    }
+def _descritas(texto: str, tipo_fila: str, tipo: Optional[str], limite: int) -> List[Dict[str, Any]]:
+    """
+    Etapa extra de búsqueda por descripción (catalog.buscar_por_descripcion): filas
+    (propiedad | proyecto) que mejor encajan con lo descrito, de más a menos parecida.
+    """
+    return [r for r in buscar_por_descripcion(texto, tipo=tipo_fila, k=limite + 2) if not tipo or r.get("tipo") == tipo]
 
 
-def _card_proyecto(pr: Dict[str, Any], base_url: str) -> Dict[str, Any]:
-    return {
-        "type": "proyecto",
-        "id": pr["id"],
-        "titulo": pr["nombre"],
-        "ubicacion": pr.get("ubicacion") or "",
-        "precio_desde": _format_precio(float(pr["precio_desde"])) if pr.get("precio_desde") else "",
-        "descripcion": (pr.get("descripcion") or "").strip(),
-        "url": _url_proyecto(pr["slug"], base_url),
-        "imagen": f"{base_url.rstrip('/')}/uploads/proyectos/{pr['imagen_principal']}" if pr.get("imagen_principal") else None,
-    }
+def _completar(
+    filas: List[Dict[str, Any]], descritas: List[Dict[str, Any]], limite: int
+) -> Tuple[List[Dict[str, Any]], int]:
+    """Si el razonamiento dio menos de limite filas, completa con las descritas. Devuelve (filas, cuántas se añadieron)."""
+    vistas = {r["id"] for r in filas}
+    extra = [r for r in descritas if r["id"] not in vistas][: max(limite - len(filas), 0)]
+    return filas + extra, len(extra)
 
 
 def _add_opciones_cercanas_or_fallback(
@@ -183,9 +195,8 @@ def _add_opciones_cercanas_or_fallback(
         precio_min=precio_min,
         precio_max=precio_max_relajado,
         habitaciones=hab_relajado,
-        ubicacion=ubicacion,
-        titulo=ubicacion,
         limite=6,
+        **filtro_propiedades(ubicacion),
     )
 
     if props_cercanas:
@@ -222,9 +233,8 @@ def _add_opciones_cercanas_or_fallback(
         precio_min=None,
         precio_max=None,
         habitaciones=None,
-        ubicacion=ubicacion,
-        titulo=ubicacion,
         limite=4,
+        **filtro_propiedades(ubicacion),
     )
     if props_general:
         lines.append("No tenemos justo lo que buscas, pero aquí van **otras opciones** que podrían interesarte:")
@@ -250,7 +260,7 @@ def _extract_lugar_info(texto: str) -> Optional[str]:
     """
     if not texto or len(texto.strip()) < 3:
         return None
-    t = (texto or "").strip().lower()
+    t = analyze(texto).normalized
     # "información de X", "info de X", "qué hay en X"
     for prefix in ["informacion de ", "información de ", "info de ", "todo de ", "datos de ", "qué hay en ", "que hay en ", "hablame de ", "cuéntame de ", "cuentame de ", "hablar de ", "contar de "]:
         if prefix in t:
@@ -280,13 +290,13 @@ def handle_pedir_informacion(
         log_pregunta(conversacion_id, texto, "pedir_informacion", r["id"])
         return {"text": msg, "actions": [], "context": {}}
 
-    t = (texto or "").lower()
+    t = analyze(texto).normalized
     # "Información de [lugar]" (ej. Ibiza): buscar en BD y mostrar propiedades/proyectos con imágenes
     lugar = _extract_lugar_info(texto)
     if lugar:
         # Buscar por nombre (titulo/nombre) y por ubicación para "qué es Ibiza", "info de X", etc.
-        props = buscar_propiedades(ubicacion=lugar, titulo=lugar, limite=6)
-        proyectos = buscar_proyectos(ubicacion=lugar, limite=4)
+        props = buscar_propiedades(limite=6, **filtro_propiedades(lugar))
+        proyectos = buscar_proyectos(limite=4, **filtro_proyectos(lugar))
         lines = []
         cards = []
         if props or proyectos:
@@ -362,9 +372,11 @@ def handle_agendar_cita(
                 return _do_procesar_cita(contexto, conversacion_id, base_url)
             if tipo_ref and ref_id:
                 contexto["esperando"] = "fecha"
+                disponibilidad.prefetch()
                 return {"text": "¿Qué fecha te queda bien? (formato: AAAA-MM-DD, ej. 2025-02-15)", "actions": [], "context": contexto}
             # Sin referencia: pedir que elija de las opciones o agendar “visita general”
             contexto["esperando"] = "fecha"
+            disponibilidad.prefetch()
             return {"text": "¿Qué fecha te gustaría? (formato: AAAA-MM-DD)", "actions": [], "context": contexto}
         return {"text": "Escribe tu número de celular (ej. 3001234567) para confirmar la visita.", "actions": [], "context": contexto}
 
@@ -386,16 +398,23 @@ def handle_agendar_cita(
         contexto["email"] = email
         contexto["telefono"] = telefono
         contexto["esperando"] = "fecha"
+        disponibilidad.prefetch()
         return {"text": "¿Qué fecha te queda bien? (formato: AAAA-MM-DD)", "actions": [], "context": contexto}
     if not hora:
-        horas = horarios_disponibles(fecha)
+        horas = disponibilidad.horarios(fecha)
+        if horas is None:
+            contexto["fecha_cita"] = fecha
+            contexto["esperando"] = "hora"
+            return {"text": "No pude consultar la agenda en este momento. ¿A qué hora te gustaría? (ej. 10:00) La confirmo al agendar.", "actions": [], "context": contexto}
         if not horas:
+            disponibilidad.prefetch()
             return {"text": "Ese día no hay horarios disponibles. ¿Pruebas otra fecha? (AAAA-MM-DD)", "actions": [], "context": {**contexto, "fecha_cita": None}}
         contexto["fecha_cita"] = fecha
         contexto["esperando"] = "hora"
         return {"text": f"Horarios disponibles: {', '.join(horas[:10])}. ¿Cuál prefieres?", "actions": [{"type": "horarios", "horarios": horas}], "context": contexto}
 
-    horas_ok = horarios_disponibles(fecha)
+    # Misma fecha que al ofrecer las horas: sale de la caché (procesar-cita.php valida de nuevo)
+    horas_ok = disponibilidad.horarios(fecha)
     if horas_ok and hora not in horas_ok:
         return {"text": f"Ese horario no está disponible. Opciones: {', '.join(horas_ok[:10])}. ¿Cuál prefieres?", "actions": [{"type": "horarios", "horarios": horas_ok}], "context": contexto}
     contexto["hora_cita"] = hora
@@ -429,7 +448,18 @@ def _do_procesar_cita(contexto: Dict[str, Any], conversacion_id: Optional[str],
             else:
                 return {"text": "No hay propiedades o proyectos disponibles para agendar. Escríbenos por teléfono y te ayudamos.", "actions": [], "context": {}}
 
-    resp = procesar_cita(nombre=nombre, telefono=telefono, tipo_referencia=tipo, referencia_id=ref_id, fecha=fecha, hora=hora, email=email)
+    # Mismo token para la misma cita de la misma conversación (ej. timeout y el usuario repite):
+    # el PHP no la duplica
+    token = (
+        uuid.uuid5(uuid.NAMESPACE_URL, f"cita|{conversacion_id}|{tipo}|{ref_id}|{fecha}|{hora}|{telefono}").hex
+        if conversacion_id else None
+    )
+    resp = procesar_cita(
+        nombre=nombre, telefono=telefono, tipo_referencia=tipo, referencia_id=ref_id,
+        fecha=fecha, hora=hora, email=email, idempotency_key=token,
+    )
+    # Agendada o rechazada (ej. la franja se ocupó desde el sitio): los horarios de ese día cambiaron
+    disponibilidad.invalidar(fecha)
     if resp.get("success") and resp.get("cita_id"):
         if conversacion_id:
             marcar_conversion_cita(conversacion_id, int(resp["cita_id"]))
@@ -444,7 +474,7 @@ def handle_duda_general(texto: str, conversacion_id: Optional[str], base_url: st
         msg = faqs[0]["respuesta"]
         log_pregunta(conversacion_id, texto, "duda_general", faqs[0]["id"])
         return {"text": msg, "actions": [], "context": {}}
-    t = (texto or "").lower()
+    t = analyze(texto).normalized
     if any(w in t for w in ["donde", "ubicados", "ubicacion", "ubicación", "direccion", "dirección"]):
         msg = _cfg("respuesta_ubicacion") or _cfg("ubicacion") or "Puedes ver nuestra ubicación y contacto en la web. ¿Quieres que te muestre propiedades o agendar una visita?"
         return {"text": msg, "actions": [], "context": {}}
@@ -484,7 +514,7 @@ def handle_pregunta_sobre_propiedad(
     if not prop:
         return {"text": "Esa propiedad ya no está disponible. ¿Quieres que te muestre otras opciones?", "actions": [], "context": {}}
 
-    t = (texto or "").lower()
+    t = analyze(texto).normalized
     lines: List[str] = []
     # Pregunta por baños
     if "baño" in t or "bano" in t or "baños" in t or "banos" in t:
@@ -525,7 +555,11 @@ def handle_pedir_otra_opcion(
     base_url: str,
 ) -> Dict[str, Any]:
     """
-    "Qué otra tienes disponible": misma búsqueda pero excluyendo la(s) ya mostrada(s).
+    "Qué otra tienes disponible": la siguiente de la misma búsqueda, nunca una ya mostrada.
+    Cursor en el orden del catálogo (destacado, orden, id) guardado en contexto: cada
+    "otra" trae una sola fila después del cursor. Las de la primera respuesta (que pueden
+    venir de filtros relajados, fuera de ese orden) y las "parecidas" se excluyen aparte.
+    Las traídas por el cursor se anotan solo para que el camino de "parecida" no las repita.
     Responde de forma fluida: "Claro, también tengo [Casa X]. Tiene N hab, M baños..."
     """
     tipo = contexto.get("tipo")
@@ -533,21 +567,33 @@ def handle_pedir_otra_opcion(
     precio_max = contexto.get("presupuesto_max")
     habitaciones = contexto.get("habitaciones")
     ubicacion = (contexto.get("ubicacion") or "").strip() or None
-    mostradas = contexto.get("propiedades_mostradas_ids") or []
+    mostradas = list(contexto.get("propiedades_mostradas_ids") or [])
+    por_cursor = list(contexto.get("otra_cursor_ids") or [])
+    cursor = contexto.get("otra_cursor")
     ref_id = contexto.get("referencia_id")
-    if ref_id and ref_id not in mostradas:
-        mostradas = mostradas + [ref_id]
-    exclude_ids = mostradas if mostradas else ([ref_id] if ref_id else None)
-
-    props = buscar_propiedades(
-        tipo=tipo,
-        precio_min=precio_min,
-        precio_max=precio_max,
-        habitaciones=habitaciones,
-        ubicacion=ubicacion,
-        exclude_ids=exclude_ids,
-        limite=4,
-    )
+    # La referencia (ej. card elegida) ya quedó atrás del cursor si vino de un "otra"
+    if ref_id and ref_id not in mostradas and ref_id not in por_cursor:
+        mostradas.append(ref_id)
+
+    # "Una parecida a esa": vecina precalculada de la propiedad de referencia (sin consulta)
+    parecida = None
+    if ref_id and contexto.get("tipo_referencia", "propiedad") == "propiedad" and pide_similar(texto):
+        vecinas = propiedades_similares(ref_id, 1, excluir=mostradas + por_cursor + [ref_id])
+        parecida = vecinas[0] if vecinas else None
+
+    if parecida is not None:
+        props = [parecida]
+    else:
+        props = buscar_propiedades(
+            tipo=tipo,
+            precio_min=precio_min,
+            precio_max=precio_max,
+            habitaciones=habitaciones,
+            exclude_ids=mostradas or None,
+            limite=1,
+            despues=cursor,
+            **filtro_propiedades(ubicacion),
+        )
     if not props:
         # No hay más con esos filtros; ofrecer búsqueda más amplia o visita
         msg = "Con esos criterios ya te mostré las que tenía. ¿Quieres que ajustemos (más habitaciones, otra zona) o agendamos una visita y un asesor te muestra más opciones?"
@@ -559,7 +605,10 @@ def handle_pedir_otra_opcion(
     hab = primera.get("habitaciones")
     banos = primera.get("banos")
     prec = _format_precio(float(primera["precio"])) if primera.get("precio") else ""
-    partes = [f"Claro, también tengo **{titulo}**."]
+    if parecida is not None:
+        partes = [f"Claro, una muy parecida es **{titulo}**."]
+    else:
+        partes = [f"Claro, también tengo **{titulo}**."]
     if hab is not None:
         partes.append(f"Tiene {hab} habitación(es).")
     if banos is not None:
@@ -573,8 +622,13 @@ def handle_pedir_otra_opcion(
     ctx = dict(contexto)
     ctx["tipo_referencia"] = "propiedad"
     ctx["referencia_id"] = primera["id"]
-    nuevas_mostradas = list(mostradas) + [primera["id"]]
-    ctx["propiedades_mostradas_ids"] = nuevas_mostradas[:10]
+    if parecida is not None:
+        # Fuera del orden del catálogo: se excluye aparte y el cursor no se mueve
+        ctx["propiedades_mostradas_ids"] = mostradas + [primera["id"]]
+    else:
+        ctx["propiedades_mostradas_ids"] = mostradas
+        ctx["otra_cursor"] = cursor_de(primera)
+        ctx["otra_cursor_ids"] = por_cursor + [primera["id"]]
 
     return {"text": " ".join(partes), "actions": [], "cards": [card], "context": ctx}
 
@@ -585,9 +639,25 @@ def handle_pedir_recomendacion(
     conversacion_id: Optional[str],
     base_url: str,
 ) -> Dict[str, Any]:
-    """Recomendaciones: usa motor de razonamiento con filtros relajados (destacados)."""
+    """
+    Recomendaciones: si el usuario viene de ver una propiedad, las más parecidas a ella
+    (índice precalculado); si no, motor de razonamiento con filtros relajados (destacados).
+    """
     tipo = contexto.get("tipo")
     ubicacion = (contexto.get("ubicacion") or "").strip() or None
+    ref_id = contexto.get("referencia_id")
+    if ref_id and contexto.get("tipo_referencia", "propiedad") == "propiedad":
+        vecinas = propiedades_similares(ref_id, 4, excluir=[ref_id])
+        if vecinas:
+            agenda_msg = _cfg("mensaje_agendar_cita", "¿Quieres agendar una visita? Te pido nombre, correo y teléfono para confirmar.")
+            lines = [
+                "Según la que estabas viendo, te recomiendo estas opciones muy parecidas "
+                "(precio, tamaño, zona y características). 🏡",
+                agenda_msg,
+            ]
+            cards = [_card_propiedad(p, base_url) for p in vecinas]
+            return {"text": "\n\n".join(lines), "actions": [], "cards": cards, "context": contexto}
+
     match_type, props, proyectos, reasoning_text = run_reasoning(
         tipo=tipo,
         precio_min=None,
@@ -618,13 +688,18 @@ def handle_comparar_opciones(
     return handle_pedir_recomendacion(texto, contexto, conversacion_id, base_url)
 
 
-def dispatch(
+def dispatch_reglas(
     texto: str,
     contexto: Dict[str, Any],
     conversacion_id: Optional[str],
     base_url: str,
 ) -> Dict[str, Any]:
-    intent = detect_intent(texto, contexto)
+    """Primera etapa del turno (bulkhead "db"): intención, handler y ejemplos aprobados. Sin Gemini."""
+    # Gazetteer del catálogo al día antes de extraer entidades (comprobación barata y espaciada)
+    catalog_ensure_fresh()
+    # Un solo análisis por turno: los extractores de cada handler leen del mismo objeto (memoizado)
+    analisis = analyze(texto)
+    intent = detect_intent(analisis, contexto)
     handlers = {
         INTENT_SALUDO: lambda: handle_saludo(conversacion_id, base_url),
         INTENT_DESPEDIDA: lambda: handle_despedida(conversacion_id, base_url),
@@ -647,30 +722,71 @@ def dispatch(
     ej = entrenamiento_match(texto, intent)
     if ej and (ej.get("respuesta") or "").strip():
         out["text"] = ej["respuesta"].strip()
-
-    # Célula inteligente (Gemini): genera la respuesta desde datos de la BD; si falla, se usa el borrador
-    if llm_generate_reply and out.get("text"):
-        try:
-            data_ctx = build_data_context(out.get("cards")) if build_data_context else None
-            if not (data_ctx or "").strip():
-                data_ctx = f"Contexto: {out['text'][:500]}"
-            last_user = (contexto.get("last_user_message") or "").strip() or None
-            last_bot = (contexto.get("last_bot_message") or "").strip() or None
-            system_prompt = _cfg("prompt_sistema") or _cfg("instrucciones_ia") or None
-            natural = llm_generate_reply(
-                texto,
-                out["text"],
-                intent=intent,
-                data_context=data_ctx,
-                last_user_message=last_user,
-                last_bot_message=last_bot,
-                system_prompt=system_prompt,
-            )
-            if natural:
-                out["text"] = natural
-                out["llm_used"] = True
-        except Exception:
-            pass
-
     out["intent"] = intent
     return out
+
+
+def pedido_llm(texto: str, contexto: Dict[str, Any], out: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Argumentos de llm_generate_reply para humanizar out, o None si Gemini no aplica (apagado,
+    sin texto o admisión en SIN_LLM). Lee la configuración de la BD: va en la etapa de reglas.
+    """
+    if not (llm_generate_reply and out.get("text") and admision.permite_llm()):
+        return None
+    try:
+        data_ctx = build_data_context(out.get("cards")) if build_data_context else None
+        if not (data_ctx or "").strip():
+            data_ctx = f"Contexto: {out['text'][:500]}"
+        system_prompt = _cfg("prompt_sistema") or _cfg("instrucciones_ia") or None
+    except Exception:
+        return None
+    return {
+        "user_message": texto,
+        "draft_reply": out["text"],
+        "intent": out.get("intent"),
+        "data_context": data_ctx,
+        "last_user_message": (contexto.get("last_user_message") or "").strip() or None,
+        "last_bot_message": (contexto.get("last_bot_message") or "").strip() or None,
+        "system_prompt": system_prompt,
+    }
+
+
+class _Flujo:
+    """Fragmentos de un intento con Gemini: si se abandona (timeout, error), lo que siga llegando no se envía."""
+
+    def __init__(self, on_token: Optional[Callable[[str], None]], on_reset: Optional[Callable[[], None]]) -> None:
+        self.on_token = on_token
+        self.on_reset = on_reset
+        self.vigente = True
+        self.enviado = False
+
+    def token(self, t: str) -> None:
+        if self.vigente:
+            self.enviado = True
+            self.on_token(t)
+
+    def abandonar(self) -> None:
+        self.vigente = False
+        if self.enviado and self.on_reset is not None:
+            self.on_reset()
+
+    def kwargs(self) -> Dict[str, Any]:
+        return {"on_token": self.token if self.on_token is not None else None, "on_reset": self.on_reset}
+
+
+async def humanizar(
+    pedido: Dict[str, Any],
+    on_token: Optional[Callable[[str], None]] = None,
+    on_reset: Optional[Callable[[], None]] = None,
+) -> Optional[str]:
+    """
+    Segunda etapa del turno: Gemini en el bulkhead "llm", esperado desde el event loop (sin
+    ocupar un hilo de "db"). None si falla, está saturado o no responde en LLM_ESPERA_SEC:
+    queda el borrador, igual que bajo carga (admission.py, nivel SIN_LLM).
+    """
+    flujo = _Flujo(on_token, on_reset)
+    try:
+        return await bulkheads.llm.ejecutar(llm_generate_reply, **pedido, **flujo.kwargs(), timeout=LLM_ESPERA_SEC)
+    except Exception:
+        flujo.abandonar()
+        return None
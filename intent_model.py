@@ -0,0 +1,242 @@
+# intent_model.py - Clasificador de intención entrenado con chatbot_entrenamiento
+"""
+n-gramas con hashing (palabras, bigramas y trigramas de caracteres) + modelo lineal
+softmax en NumPy. Se entrena offline con los turnos aprobados (correcta/corregida),
+se guarda en un .npz compacto y se carga al arrancar. En ejecución solo se usa como
+respaldo cuando las reglas de nlu.detect_intent terminan en duda_general.
+
+Entrenar:  python intent_model.py train [--out models/intent_model.npz] [--holdout 0.2]
+"""
+
+import argparse
+import logging
+import time
+import zlib
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from config import INTENT_MODEL_MIN_PROB, INTENT_MODEL_PATH
+from nlu import MessageAnalysis, analyze
+
+logger = logging.getLogger("chatbot-api")
+
+DIM = 1 << 14
+FORMAT_VERSION = 1
+
+
+def _features(texto: Union[str, MessageAnalysis], dim: int = DIM) -> List[int]:
+    """Índices hash (estables entre procesos: crc32) de palabras, bigramas y trigramas de caracteres."""
+    a = texto if isinstance(texto, MessageAnalysis) else analyze(texto or "")
+    toks = a.tokens
+    feats = {"_"}  # siempre al menos una feature por fila
+    for i, tok in enumerate(toks):
+        feats.add("w:" + tok)
+        if i:
+            feats.add("b:" + toks[i - 1] + " " + tok)
+        padded = f"#{tok}#"
+        for j in range(len(padded) - 2):
+            feats.add("c:" + padded[j:j + 3])
+    mask = dim - 1
+    return [zlib.crc32(f.encode()) & mask for f in feats]
+
+
+def _featurize(textos: Sequence[Union[str, MessageAnalysis]], dim: int = DIM) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Matriz dispersa por filas: (idx, pesos, fila de cada idx, inicio de cada fila)."""
+    idx: List[int] = []
+    starts: List[int] = []
+    weights: List[float] = []
+    for t in textos:
+        f = _features(t, dim)
+        starts.append(len(idx))
+        idx.extend(f)
+        weights.extend([1.0 / np.sqrt(len(f))] * len(f))
+    starts_a = np.asarray(starts, dtype=np.int64)
+    lengths = np.diff(np.append(starts_a, len(idx)))
+    rows = np.repeat(np.arange(len(textos), dtype=np.int64), lengths)
+    return np.asarray(idx, dtype=np.int64), np.asarray(weights, dtype=np.float32), rows, starts_a
+
+
+def _softmax(s: np.ndarray) -> np.ndarray:
+    s = s - s.max(axis=1, keepdims=True)
+    e = np.exp(s)
+    return e / e.sum(axis=1, keepdims=True)
+
+
+class IntentModel:
+    """Pesos W (dim x clases) y sesgo b. predict/predict_batch no tocan la BD."""
+
+    def __init__(self, W: np.ndarray, b: np.ndarray, labels: Sequence[str], min_prob: float = INTENT_MODEL_MIN_PROB):
+        self.W = W.astype(np.float32, copy=False)
+        self.b = b.astype(np.float32, copy=False)
+        self.labels = list(labels)
+        self.dim = W.shape[0]
+        self.min_prob = min_prob
+
+    def _scores(self, idx: np.ndarray, w: np.ndarray, starts: np.ndarray) -> np.ndarray:
+        contrib = self.W[idx] * w[:, None]
+        return np.add.reduceat(contrib, starts, axis=0) + self.b
+
+    def predict_batch(self, textos: Sequence[Union[str, MessageAnalysis]]) -> List[Tuple[str, float]]:
+        """[(intención, probabilidad)] para cada texto, en una sola pasada vectorizada."""
+        if not textos:
+            return []
+        idx, w, _, starts = _featurize(textos, self.dim)
+        probs = _softmax(self._scores(idx, w, starts))
+        best = probs.argmax(axis=1)
+        return [(self.labels[k], float(probs[i, k])) for i, k in enumerate(best)]
+
+    def predict_one(self, texto: Union[str, MessageAnalysis]) -> Tuple[str, float]:
+        f = np.asarray(_features(texto, self.dim), dtype=np.int64)
+        s = self.W[f].sum(axis=0) / np.sqrt(len(f)) + self.b
+        p = _softmax(s[None, :])[0]
+        k = int(p.argmax())
+        return self.labels[k], float(p[k])
+
+    def save(self, path: Union[str, Path]) -> Path:
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # float16 + compresión: unos cientos de KB para ~10 intenciones
+        np.savez_compressed(
+            path,
+            W=self.W.astype(np.float16),
+            b=self.b,
+            labels=np.asarray(self.labels),
+            version=np.asarray(FORMAT_VERSION),
+        )
+        return path
+
+    @classmethod
+    def load(cls, path: Union[str, Path]) -> "IntentModel":
+        with np.load(path, allow_pickle=False) as data:
+            if int(data["version"]) != FORMAT_VERSION:
+                raise ValueError(f"Formato de modelo no soportado: {int(data['version'])}")
+            return cls(data["W"], data["b"], [str(x) for x in data["labels"]])
+
+
+def train(
+    textos: Sequence[str],
+    etiquetas: Sequence[str],
+    epochs: int = 150,
+    lr: float = 0.1,
+    l2: float = 1e-5,
+    dim: int = DIM,
+) -> IntentModel:
+    """Regresión logística multinomial, descenso por lotes completo con Adam."""
+    labels = sorted(set(etiquetas))
+    y = np.asarray([labels.index(e) for e in etiquetas], dtype=np.int64)
+    n, k = len(textos), len(labels)
+    idx, w, rows, starts = _featurize(textos, dim)
+    Y = np.zeros((n, k), dtype=np.float32)
+    Y[np.arange(n), y] = 1.0
+
+    # Orden por índice de feature: el gradiente de W se acumula con reduceat (sin np.add.at)
+    order = np.argsort(idx, kind="stable")
+    uniq, first = np.unique(idx[order], return_index=True)
+
+    W = np.zeros((dim, k), dtype=np.float32)
+    b = np.zeros(k, dtype=np.float32)
+    mW, vW = np.zeros((len(uniq), k), np.float32), np.zeros((len(uniq), k), np.float32)
+    mb, vb = np.zeros(k, np.float32), np.zeros(k, np.float32)
+    beta1, beta2, eps = 0.9, 0.999, 1e-8
+    for t in range(1, epochs + 1):
+        S = np.add.reduceat(W[idx] * w[:, None], starts, axis=0) + b
+        G = (_softmax(S) - Y) / n
+        gW = np.add.reduceat((G[rows] * w[:, None])[order], first, axis=0) + l2 * W[uniq]
+        gb = G.sum(axis=0)
+        mW = beta1 * mW + (1 - beta1) * gW
+        vW = beta2 * vW + (1 - beta2) * gW * gW
+        mb = beta1 * mb + (1 - beta1) * gb
+        vb = beta2 * vb + (1 - beta2) * gb * gb
+        corr = np.sqrt(1 - beta2 ** t) / (1 - beta1 ** t)
+        W[uniq] -= lr * corr * mW / (np.sqrt(vW) + eps)
+        b -= lr * corr * mb / (np.sqrt(vb) + eps)
+    return IntentModel(W, b, labels)
+
+
+def _accuracy(model: IntentModel, textos: Sequence[str], etiquetas: Sequence[str]) -> Optional[float]:
+    if not textos:
+        return None
+    pred = model.predict_batch(textos)
+    return round(sum(1 for (p, _), e in zip(pred, etiquetas) if p == e) / len(textos), 4)
+
+
+def _throughput(model: IntentModel, textos: Sequence[str]) -> Dict[str, float]:
+    """Microsegundos por mensaje: uno a uno y en lote (textos nuevos, sin caché de análisis)."""
+    muestra = [f"{t} {i}" for i, t in enumerate(list(textos)[:500] or ["hola"])]
+    t0 = time.perf_counter()
+    for t in muestra:
+        model.predict_one(t)
+    single = (time.perf_counter() - t0) / len(muestra)
+    muestra = [f"{t} #{i}" for i, t in enumerate(muestra)]
+    t0 = time.perf_counter()
+    model.predict_batch(muestra)
+    batch = (time.perf_counter() - t0) / len(muestra)
+    return {
+        "us_por_mensaje": round(single * 1e6, 1),
+        "us_por_mensaje_lote": round(batch * 1e6, 1),
+        "mensajes_por_seg_lote": round(1.0 / batch) if batch else 0,
+    }
+
+
+def train_from_db(out: Union[str, Path] = INTENT_MODEL_PATH, holdout: float = 0.2, seed: int = 13) -> Dict[str, Any]:
+    """
+    Entrena con los turnos aprobados de chatbot_entrenamiento, guarda el .npz y
+    devuelve un reporte (muestras, exactitud en validación, throughput de predicción).
+    """
+    from db import listar_entrenamiento_aprobado
+
+    rows = [r for r in listar_entrenamiento_aprobado() if (r.get("input_usuario") or "").strip()]
+    textos = [r["input_usuario"].strip() for r in rows]
+    etiquetas = [r["intencion"].strip() for r in rows]
+    if len(set(etiquetas)) < 2:
+        return {"ok": False, "error": "Se necesitan ejemplos aprobados de al menos 2 intenciones", "muestras": len(textos)}
+
+    perm = np.random.default_rng(seed).permutation(len(textos))
+    n_val = int(len(textos) * holdout) if len(textos) >= 20 else 0
+    val, tr = perm[:n_val], perm[n_val:]
+    model = train([textos[i] for i in tr], [etiquetas[i] for i in tr])
+    report = {
+        "ok": True,
+        "muestras": len(textos),
+        "intenciones": {e: etiquetas.count(e) for e in sorted(set(etiquetas))},
+        "exactitud_entrenamiento": _accuracy(model, [textos[i] for i in tr], [etiquetas[i] for i in tr]),
+        "exactitud_validacion": _accuracy(model, [textos[i] for i in val], [etiquetas[i] for i in val]),
+        "muestras_validacion": int(n_val),
+    }
+    # Modelo final con todos los datos
+    model = train(textos, etiquetas)
+    path = model.save(out)
+    report["archivo"] = str(path)
+    report["kb"] = round(path.stat().st_size / 1024, 1)
+    report["throughput"] = _throughput(model, textos)
+    return report
+
+
+def load(path: Union[str, Path] = INTENT_MODEL_PATH) -> Optional[IntentModel]:
+    """Carga el modelo y lo instala en nlu (respaldo de duda_general). None si no hay archivo."""
+    from nlu import set_intent_model
+
+    path = Path(path)
+    if not path.exists():
+        return None
+    try:
+        model = IntentModel.load(path)
+    except Exception as e:
+        logger.warning("No se pudo cargar el clasificador de intención %s: %s", path, e)
+        return None
+    set_intent_model(model)
+    logger.info("Clasificador de intención cargado: %s (%d intenciones)", path, len(model.labels))
+    return model
+
+
+if __name__ == "__main__":
+    import json
+
+    parser = argparse.ArgumentParser(description="Clasificador de intención (chatbot_entrenamiento)")
+    parser.add_argument("cmd", choices=["train"])
+    parser.add_argument("--out", default=str(INTENT_MODEL_PATH))
+    parser.add_argument("--holdout", type=float, default=0.2)
+    args = parser.parse_args()
+    print(json.dumps(train_from_db(args.out, holdout=args.holdout), ensure_ascii=False, indent=2))
@@ -3,14 +3,20 @@
 - Respuesta principal generada por Gemini usando contexto real de la BD (propiedades/proyectos).
 - Reintentos ante 429 (Too Many Requests) con backoff.
 - Si Gemini falla, se usa el borrador del motor de reglas como fallback.
+- Con on_token (canal WebSocket) se usa streamGenerateContent: cada fragmento de texto
+  se entrega apenas llega; el valor devuelto sigue siendo el texto completo. Si lo ya
+  entregado se descarta (error a mitad, reintento o se pasa al borrador), se llama
+  on_reset antes de cualquier otro fragmento.
 """
 
+import json
 import logging
 import time
-from typing import Any, Dict, List, Optional
+from typing import Any, Callable, Dict, List, Optional
 
 import httpx
 
+from cards import context_lines
 from config import GEMINI_API_KEY, LLM_ENABLED
 
 logger = logging.getLogger("chatbot-api")
@@ -35,6 +41,7 @@ DEFAULT_SYSTEM_PROMPT = (
 )
 
 GEMINI_URL = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent"
+GEMINI_STREAM_URL = GEMINI_URL.replace(":generateContent", ":streamGenerateContent")
 MAX_TOKENS = 500
 TIMEOUT = 22.0
 
@@ -49,49 +56,59 @@ def build_data_context(cards: Optional[List[Dict[str, Any]]]) -> str:
     if not cards or not isinstance(cards, list):
         return "Sin resultados en base de datos para esta búsqueda."
 
-    lines: List[str] = []
-    for c in cards[:6]:
-        card_type = (c.get("type") or "propiedad").lower()
-        titulo = (c.get("titulo") or "").strip() or "Sin título"
-        ubicacion = (c.get("ubicacion") or "").strip()
-        desc = (c.get("descripcion") or "").strip()[:80]
-        if card_type == "proyecto":
-            precio = c.get("precio_desde") or ""
-            line = f"- Proyecto: {titulo}"
-            if ubicacion:
-                line += f", ubicación: {ubicacion}"
-            if precio:
-                line += f", desde {precio}"
-            if desc:
-                line += f". {desc}"
-            lines.append(line)
-        else:
-            precio = c.get("precio") or ""
-            hab = c.get("habitaciones")
-            banos = c.get("banos")
-            tipo = c.get("tipo") or "venta"
-            line = f"- Propiedad: {titulo}, {tipo}"
-            if ubicacion:
-                line += f", ubicación: {ubicacion}"
-            if precio:
-                line += f", precio: {precio}"
-            if hab is not None:
-                line += f", {hab} hab"
-            if banos is not None:
-                line += f", {banos} baños"
-            if desc:
-                line += f". {desc}"
-            lines.append(line)
-
+    # Líneas pre-renderizadas junto con cada card (cards.py)
+    lines = context_lines(cards[:6])
     if not lines:
         return "Sin resultados en base de datos para esta búsqueda."
     return "Contexto de la base de datos (usa esto para responder por nombre, ubicación, precio o características):\n" + "\n".join(lines)
 
 
-def _call_gemini(prompt: str) -> Optional[str]:
-    """Llama a Gemini con reintentos ante 429. Devuelve el texto generado o None."""
+def _stream_gemini(payload: Dict[str, Any], on_token: Callable[[str], None]) -> str:
+    """streamGenerateContent (SSE): llama on_token con cada fragmento y devuelve el texto completo."""
+    partes: List[str] = []
+    with httpx.stream(
+        "POST",
+        f"{GEMINI_STREAM_URL}?alt=sse&key={GEMINI_API_KEY.strip()}",
+        json=payload,
+        timeout=TIMEOUT,
+    ) as r:
+        r.raise_for_status()
+        for line in r.iter_lines():
+            if not line.startswith("data:"):
+                continue
+            data = json.loads(line[5:])
+            for c in (data.get("candidates") or [])[:1]:
+                for part in c.get("content", {}).get("parts") or []:
+                    t = part.get("text")
+                    if t:
+                        partes.append(t)
+                        on_token(t)
+    return "".join(partes).strip()
+
+
+def _call_gemini(
+    prompt: str,
+    on_token: Optional[Callable[[str], None]] = None,
+    on_reset: Optional[Callable[[], None]] = None,
+) -> Optional[str]:
+    """
+    Llama a Gemini con reintentos ante 429. Devuelve el texto generado o None.
+    Con on_token, si devuelve None o reintenta tras haber entregado fragmentos, llama on_reset.
+    """
     if not (GEMINI_API_KEY or "").strip():
         return None
+    enviados = False
+
+    def emitir(t: str) -> None:
+        nonlocal enviados
+        enviados = True
+        on_token(t)
+
+    def descartar() -> None:
+        nonlocal enviados
+        if enviados and on_reset is not None:
+            on_reset()
+        enviados = False
     payload = {
         "contents": [{"role": "user", "parts": [{"text": prompt}]}],
         "generationConfig": {
@@ -103,6 +120,12 @@ def _call_gemini(prompt: str) -> Optional[str]:
     last_error = None
     for attempt in range(GEMINI_RETRIES):
         try:
+            if on_token is not None:
+                text = _stream_gemini(payload, emitir)
+                # Sin tope de largo: lo que ya se entregó no se retira
+                if not text:
+                    break
+                return text
             r = httpx.post(
                 f"{GEMINI_URL}?key={GEMINI_API_KEY.strip()}",
                 json=payload,
@@ -113,7 +136,7 @@ def _call_gemini(prompt: str) -> Optional[str]:
                 if attempt < GEMINI_RETRIES - 1:
                     wait = GEMINI_BACKOFF_SEC * (2 ** attempt)
                     logger.warning("Gemini 429, reintento en %.1fs (intento %d/%d)", wait, attempt + 1, GEMINI_RETRIES)
-                    time.sleep(w)
+                    time.sleep(wait)
                 continue
             r.raise_for_status()
             data = r.json()
@@ -129,6 +152,7 @@ def _call_gemini(prompt: str) -> Optional[str]:
             return text
         except httpx.HTTPStatusError as e:
             last_error = str(e)
+            descartar()
             if e.response.status_code == 429 and attempt < GEMINI_RETRIES - 1:
                 wait = GEMINI_BACKOFF_SEC * (2 ** attempt)
                 logger.warning("Gemini 429, reintento en %.1fs", wait)
@@ -138,6 +162,7 @@ def _call_gemini(prompt: str) -> Optional[str]:
         except Exception as e:
             last_error = str(e)
             break
+    descartar()
     logger.warning("Célula inteligente (Gemini) falló tras reintentos: %s", last_error)
     return None
 
@@ -148,6 +173,8 @@ def generate_full_reply(
     last_user_message: Optional[str] = None,
     last_bot_message: Optional[str] = None,
     system_prompt: Optional[str] = None,
+    on_token: Optional[Callable[[str], None]] = None,
+    on_reset: Optional[Callable[[], None]] = None,
 ) -> Optional[str]:
     """
     Célula como cerebro: Gemini genera la respuesta completa solo con datos de la BD.
@@ -172,7 +199,7 @@ def generate_full_reply(
         "No inventes. Si hay proyectos o propiedades listadas, menciónalos. Invita a agendar visita si aplica. "
         "Escribe solo la respuesta al usuario, sin explicaciones ni comillas."
     )
-    return _call_gemini(prompt)
+    return _call_gemini(prompt, on_token, on_reset)
 
 
 def process_response(
@@ -183,6 +210,8 @@ def process_response(
     last_user_message: Optional[str] = None,
     last_bot_message: Optional[str] = None,
     system_prompt: Optional[str] = None,
+    on_token: Optional[Callable[[str], None]] = None,
+    on_reset: Optional[Callable[[], None]] = None,
 ) -> Optional[str]:
     """
     Humaniza el borrador con Gemini, o genera respuesta completa si hay contexto de BD.
@@ -199,6 +228,8 @@ def process_response(
             last_user_message=last_user_message,
             last_bot_message=last_bot_message,
             system_prompt=system_prompt,
+            on_token=on_token,
+            on_reset=on_reset,
         )
         if full:
             return full
@@ -225,7 +256,7 @@ def process_response(
         f"Borrador de respuesta (usa esta información, escribe de forma conversacional):\n{draft_reply[:1800]}\n\n"
         "Escribe únicamente la respuesta final al usuario, sin explicaciones ni comillas."
     )
-    return _call_gemini(prompt)
+    return _call_gemini(prompt, on_token, on_reset)
 
 
 def generate_reply(
@@ -236,10 +267,14 @@ def generate_reply(
     last_user_message: Optional[str] = None,
     last_bot_message: Optional[str] = None,
     system_prompt: Optional[str] = None,
+    on_token: Optional[Callable[[str], None]] = None,
+    on_reset: Optional[Callable[[], None]] = None,
 ) -> Optional[str]:
     """
     Punto de entrada: humaniza/processa la respuesta con la célula inteligente.
     system_prompt: instrucciones desde Admin (chatbot_config: prompt_sistema o instrucciones_ia).
+    on_token: recibe el texto a medida que Gemini lo genera (streaming).
+    on_reset: lo recibido por on_token se descarta (sigue otro intento o ninguno).
     """
     return process_response(
         user_message=user_message,
@@ -249,4 +284,6 @@ def generate_reply(
         last_user_message=last_user_message,
         last_bot_message=last_bot_message,
         system_prompt=system_prompt,
+        on_token=on_token,
+        on_reset=on_reset,
     )
@@ -1,54 +1,67 @@
 # main.py - API REST Chatbot Inmobiliario CTR
-"""FastAPI. POST /chat, GET /health. CORS para frontend PHP."""
+"""FastAPI. POST /chat, WS /ws/chat, GET /health. CORS para frontend PHP."""
 
+import asyncio
+import hmac
+import json
 import logging
+import math
+import time
 import uuid
-from typing import Any, Dict, List, Optional
+from typing import Any, Callable, Dict, List, Optional, Union
 
-from fastapi import FastAPI, HTTPException
-from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, Header, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel, Field
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.requests import Request
-
-from config import CORS_ORIGINS, DB_PASS, GEMINI_API_KEY, LLM_ENABLED, PHP_BASE_URL
+from starlette.requests import HTTPConnection, Request
+
+from admission import RECHAZO, controlador as admision
+from catalog import ensure_fresh as catalog_ensure_fresh, get_facetas, stats as catalog_stats
+from config import (
+    ADMISION_RETRY_AFTER_SEC,
+    CACHE_INVALIDATE_TOKEN,
+    DB_PASS,
+    GEMINI_API_KEY,
+    GZIP_MIN_BYTES,
+    IDEMPOTENCY_TTL_SEC,
+    LLM_ENABLED,
+    METRICS_TOKEN,
+    NLU_BATCH_MAX,
+    PHP_BASE_URL,
+    RATE_LIMIT_PROXIES,
+)
 from db import (
     actualizar_entrenamiento_evaluacion,
+    buscar_propiedades,
+    buscar_proyectos,
     crear_conversacion,
     get_conn,
     guardar_entrenamiento_turno,
     guardar_mensaje,
     listar_entrenamiento,
+    search_stats,
 )
-from handlers import dispatch
+from handlers import dispatch_reglas, humanizar, pedido_llm
+import bulkheads
+import cards as cards_mod
+import changes
+from cors import CORSMiddleware, origen_permitido
+import disponibilidad
+import fuzzy
+import nlu_batch
+import php_client
+import sessions
+from ratelimit import limitador
+from singleflight import SingleFlight
+
+try:
+    import intent_model
+except ImportError:  # numpy no instalado: solo reglas
+    intent_model = None
 
 logger = logging.getLogger("chatbot-api")
 
-# Orígenes permitidos: lista explícita + dominio producción (siempre permitir ctrbienesraices.com)
-ALLOWED_ORIGINS = list(CORS_ORIGINS) if CORS_ORIGINS else []
-for o in ("https://ctrbienesraices.com", "https://www.ctrbienesraices.com", "http://ctrbienesraices.com", "http://www.ctrbienesraices.com"):
-    if o not in ALLOWED_ORIGINS:
-        ALLOWED_ORIGINS.append(o)
-if not ALLOWED_ORIGINS:
-    ALLOWED_ORIGINS = ["*"]
-
-
-def _cors_allow_origin(origin: str) -> str:
-    """Devuelve el origen a poner en Access-Control-Allow-Origin (nunca * si credentials)."""
-    if not origin:
-        return ALLOWED_ORIGINS[0] if ALLOWED_ORIGINS and "*" not in ALLOWED_ORIGINS else "*"
-    origin = origin.rstrip("/")
-    if "*" in ALLOWED_ORIGINS:
-        return origin
-    if origin in ALLOWED_ORIGINS:
-        return origin
-    # Permitir cualquier subdominio de ctrbienesraices.com
-    if "ctrbienesraices.com" in origin and (origin.startswith("https://") or origin.startswith("http://")):
-        return origin
-    return ALLOWED_ORIGINS[0] if ALLOWED_ORIGINS else "*"
-
-
 app = FastAPI(
     title="Chatbot CTR Bienes Raíces",
     description="API del asistente inmobiliario. Complementa el backend PHP.",
@@ -56,44 +69,11 @@ app = FastAPI(
 )
 
 
-class CORSFixMiddleware(BaseHTTPMiddleware):
-    """Responde OPTIONS con 200 y CORS; añade CORS a todas las respuestas."""
-
-    async def dispatch(self, request: Request, call_next):
-        origin = (request.headers.get("origin") or "").strip().rstrip("/")
-        allow_origin = _cors_allow_origin(origin or request.headers.get("origin") or "")
-
-        # Preflight: responder de inmediato con 200 y headers CORS
-        if request.method == "OPTIONS":
-            return JSONResponse(
-                content={},
-                status_code=200,
-                headers={
-                    "Access-Control-Allow-Origin": allow_origin,
-                    "Access-Control-Allow-Methods": "GET, POST, OPTIONS",
-                    "Access-Control-Allow-Headers": "Content-Type, Authorization, Accept, Origin",
-                    "Access-Control-Max-Age": "86400",
-                    "Access-Control-Allow-Credentials": "true",
-                },
-            )
-
-        response = await call_next(request)
-        response.headers["Access-Control-Allow-Origin"] = allow_origin
-        response.headers["Access-Control-Allow-Credentials"] = "true"
-        response.headers["Access-Control-Allow-Methods"] = "GET, POST, OPTIONS"
-        response.headers["Access-Control-Allow-Headers"] = "Content-Type, Authorization, Accept, Origin"
-        return response
-
-
-app.add_middleware(CORSFixMiddleware)
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=ALLOWED_ORIGINS,
-    allow_credentials=True,
-    allow_methods=["GET", "POST", "OPTIONS"],
-    allow_headers=["*"],
-    expose_headers=["*"],
-)
+# Primero (más interno): CORS añade sus headers a la respuesta ya comprimida
+if GZIP_MIN_BYTES > 0:
+    app.add_middleware(GZipMiddleware, minimum_size=GZIP_MIN_BYTES)
+# Una sola capa ASGI: preflight sin entrar en la app, headers por origen precalculados
+app.add_middleware(CORSMiddleware)
 
 
 class ChatRequest(BaseModel):
@@ -102,6 +82,10 @@ class ChatRequest(BaseModel):
     contexto: Optional[Dict[str, Any]] = None
     referencia_tipo: Optional[str] = Field(None, pattern="^(propiedad|proyecto)$")
     referencia_id: Optional[int] = Field(None, ge=1)
+    # Alternativa al header Idempotency-Key (reintentos / doble envío del widget)
+    idempotency_key: Optional[str] = Field(None, max_length=128)
+    # Cards compactas: descripción recortada y solo {type, id, vista} si la sesión ya la recibió
+    compact: bool = False
 
 
 class ChatResponse(BaseModel):
@@ -115,10 +99,69 @@ class ChatResponse(BaseModel):
     entrenamiento_id: Optional[int] = None  # Solo cuando origen=admin (panel de entrenamiento)
 
 
+@app.on_event("startup")
+def _startup():
+    if intent_model is not None:
+        intent_model.load()
+    changes.detector.start()
+    if not changes.detector.running():
+        # Sin detector de cambios nadie avisa de chatbot_config: los límites se leen una vez
+        limitador.cargar()
+
+
+@app.on_event("shutdown")
+def _shutdown():
+    changes.detector.stop()
+    nlu_batch.shutdown()
+    php_client.close()
+    bulkheads.shutdown()
+
+
 @app.get("/health")
-def health():
-    """Health check para monitoreo."""
-    return {"status": "ok", "service": "chatbot-api"}
+async def health():
+    """Health check para monitoreo (async: no ocupa hilos, responde aunque estén todos ocupados).
+    admision: nivel de degradación actual de /chat (0 normal .. 3 rechazando)."""
+    estado = admision.estado()
+    return {"status": "ok" if not estado["nivel"] else "degradado", "service": "chatbot-api", "admision": estado}
+
+
+def _bearer_valido(authorization: Optional[str], esperado: str) -> bool:
+    """Authorization: Bearer <token> contra el token esperado (comparación en tiempo constante)."""
+    token = (authorization or "").strip()
+    if token.lower().startswith("bearer "):
+        token = token[7:].strip()
+    return hmac.compare_digest(token.encode(), esperado.encode())
+
+
+def _autorizar(authorization: Optional[str], esperado: str) -> None:
+    """404 si el endpoint no tiene token configurado; 401 si el Bearer no coincide."""
+    if not esperado:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not _bearer_valido(authorization, esperado):
+        raise HTTPException(status_code=401, detail="Token inválido")
+
+
+@app.get("/metrics")
+def metrics(authorization: Optional[str] = Header(None)):
+    """
+    Contadores internos: búsquedas colapsadas, idempotencia, sesiones, corrección difusa, CDC, bulkheads.
+    Header: Authorization: Bearer <METRICS_TOKEN> (dice cuándo el servicio está descartando carga).
+    """
+    _autorizar(authorization, METRICS_TOKEN)
+    return {
+        "bulkheads": bulkheads.stats(),
+        "admision": admision.stats(),
+        "limites": limitador.stats(),
+        "busquedas": search_stats(),
+        "catalogo": catalog_stats(),
+        "cambios": changes.detector.stats(),
+        "cards": cards_mod.stats(),
+        "horarios": disponibilidad.agenda.stats(),
+        "php": php_client.stats(),
+        "idempotencia": _idempotency.stats(),
+        "sesiones": sessions.store.stats(),
+        "fuzzy": fuzzy.stats(),
+    }
 
 
 def _llm_status():
@@ -185,24 +228,139 @@ def _fallback_response(session_id: str) -> ChatResponse:
     )
 
 
+# Respuestas por Idempotency-Key: un duplicado espera y reutiliza la primera ejecución
+_idempotency = SingleFlight(ttl=IDEMPOTENCY_TTL_SEC)
+
+
+def _ip_cliente(request: HTTPConnection) -> str:
+    """IP del visitante: la que el último proxy de confianza (RATE_LIMIT_PROXIES) puso en X-Forwarded-For."""
+    xff = [ip.strip() for ip in (request.headers.get("x-forwarded-for") or "").split(",") if ip.strip()]
+    if RATE_LIMIT_PROXIES > 0 and len(xff) >= RATE_LIMIT_PROXIES:
+        return xff[-RATE_LIMIT_PROXIES]
+    return request.client.host if request.client else ""
+
+
 @app.post("/chat", response_model=ChatResponse)
-def chat(req: ChatRequest):
+async def chat(req: ChatRequest, request: Request, idempotency_key: Optional[str] = Header(None, max_length=128)):
     """
     Recibe mensaje del usuario, detecta intención, responde.
     session_id: opcional; si no se envía, se crea nueva conversación.
-    contexto: estado previo (nombre, teléfono, fecha, etc.).
+    contexto: estado previo (nombre, teléfono, fecha, etc.). Opcional: si no se envía,
+    se usa el guardado en servidor para session_id (junto con el intercambio anterior).
     referencia_tipo / referencia_id: cuando el usuario elige "Agendar" en una card.
+    compact: cards con descripción recortada; las ya enviadas en la sesión van como
+    {type, id, vista: true} (el cliente las tiene o las pide a GET /cards).
+    Idempotency-Key (header) o idempotency_key: un reenvío con la misma clave no vuelve a
+    ejecutar el turno (ni guarda mensajes, ni llama a Gemini, ni agenda dos veces).
+    Pasado el límite de mensajes por IP o por sesión (ratelimit.py) se responde 429.
+    Reglas y BD corren en el bulkhead "db"; si está lleno, o la admisión está en RECHAZO
+    (ver admission.py), se responde 503 enseguida. Gemini corre después en "llm" (ver _turno).
+    """
+    espera = await limitador.revisar_async(_ip_cliente(request), (req.session_id or "").strip() or None)
+    if espera:
+        raise HTTPException(status_code=429, detail=_MUY_RAPIDO, headers={"Retry-After": str(max(1, math.ceil(espera)))})
+    if admision.entrar() >= RECHAZO:
+        raise _ocupado(ADMISION_RETRY_AFTER_SEC)
+    t0 = time.perf_counter()
+    key = (idempotency_key or req.idempotency_key or "").strip()
+    try:
+        if not key:
+            return await _chat(req)
+        clave = ((req.session_id or "").strip(), key, req.message)
+        return await _idempotency.do_async(clave, lambda: _chat(req))
+    except bulkheads.Saturado:
+        raise _ocupado(2)
+    finally:
+        admision.salir((time.perf_counter() - t0) * 1000)
+
+
+_MUY_RAPIDO = "Estás enviando mensajes muy rápido. Espera unos segundos e intenta de nuevo."
+_OCUPADO = "Estamos atendiendo muchas conversaciones. Intenta de nuevo en unos segundos."
+
+
+def _ocupado(retry_after: int) -> HTTPException:
+    return HTTPException(status_code=503, detail=_OCUPADO, headers={"Retry-After": str(retry_after)})
+
+
+async def _chat(req: ChatRequest) -> ChatResponse:
+    return await _turno(req.message, req.session_id, req.contexto, req.referencia_tipo, req.referencia_id, req.compact)
+
+
+class _Etapa:
+    """Lo que deja la etapa de reglas para las siguientes (Gemini y guardar el turno)."""
+
+    __slots__ = ("msg", "session_id", "contexto", "es_admin", "compact", "out", "pedido", "reglas")
+
+    def __init__(self, msg: str, session_id: str, contexto: Dict[str, Any], es_admin: bool, compact: bool) -> None:
+        self.msg = msg
+        self.session_id = session_id
+        self.contexto = contexto
+        self.es_admin = es_admin
+        self.compact = compact
+        self.out: Dict[str, Any] = {}
+        # Argumentos para Gemini (None = queda el borrador) y respuesta de reglas para el cliente
+        self.pedido: Optional[Dict[str, Any]] = None
+        self.reglas: Optional[Dict[str, Any]] = None
+
+
+async def _turno(
+    message: str,
+    session_id: Optional[str],
+    contexto_cliente: Optional[Dict[str, Any]] = None,
+    referencia_tipo: Optional[str] = None,
+    referencia_id: Optional[int] = None,
+    compact: bool = False,
+    on_reglas: Optional[Callable[[Dict[str, Any]], None]] = None,
+    on_token: Optional[Callable[[str], None]] = None,
+    on_reset: Optional[Callable[[], None]] = None,
+) -> ChatResponse:
     """
-    msg = (req.message or "").strip()
+    Un turno de /chat o de /ws/chat, en tres etapas: reglas y BD en el bulkhead "db"; Gemini
+    en "llm", esperado aquí (el hilo de "db" ya quedó libre; sin respuesta en LLM_ESPERA_SEC o
+    saturado, va el borrador); y guardar el turno, de nuevo en "db".
+    on_reglas: respuesta del motor de reglas (cards ya listas para el cliente) antes de Gemini;
+    on_token: texto de Gemini a medida que llega; on_reset: descartar lo recibido por on_token.
+    Lanza Saturado si "db" no tiene cupo para la primera etapa.
+    """
+    msg = (message or "").strip()
     if not msg:
         raise HTTPException(status_code=400, detail="message requerido")
 
-    session_id = (req.session_id or "").strip() or None
-    contexto = dict(req.contexto or {})
-
-    if req.referencia_tipo and req.referencia_id:
-        contexto["tipo_referencia"] = req.referencia_tipo
-        contexto["referencia_id"] = req.referencia_id
+    etapa = await bulkheads.db.ejecutar(
+        _etapa_reglas, msg, session_id, contexto_cliente, referencia_tipo, referencia_id, compact, on_reglas is not None
+    )
+    if isinstance(etapa, ChatResponse):
+        return etapa
+    if on_reglas is not None:
+        on_reglas(etapa.reglas)
+    if etapa.pedido is not None:
+        natural = await humanizar(etapa.pedido, on_token, on_reset)
+        if natural:
+            etapa.out["text"] = natural
+            etapa.out["llm_used"] = True
+    try:
+        return await bulkheads.db.ejecutar(_etapa_cierre, etapa)
+    except bulkheads.Saturado:
+        # El turno ya se respondió: guardarlo no se descarta por carga
+        return await asyncio.to_thread(_etapa_cierre, etapa)
+
+
+def _etapa_reglas(
+    msg: str,
+    session_id: Optional[str],
+    contexto_cliente: Optional[Dict[str, Any]],
+    referencia_tipo: Optional[str],
+    referencia_id: Optional[int],
+    compact: bool,
+    con_reglas: bool,
+) -> Union[_Etapa, ChatResponse]:
+    """Sesión, intención, handler y argumentos para Gemini. ChatResponse = respuesta de error ya lista."""
+    session_id = (session_id or "").strip() or None
+    contexto = sessions.contexto_para_turno(session_id, contexto_cliente)
+
+    if referencia_tipo and referencia_id:
+        contexto["tipo_referencia"] = referencia_tipo
+        contexto["referencia_id"] = referencia_id
 
     es_admin = (contexto.get("origen") or "").strip().lower() == "admin"
     try:
@@ -213,17 +371,37 @@ def chat(req: ChatRequest):
         session_id = str(uuid.uuid4()).replace("-", "")[:32]
         return _fallback_response(session_id)
 
+    etapa = _Etapa(msg, session_id, contexto, es_admin, compact)
     try:
-        out = dispatch(msg, contexto, session_id, PHP_BASE_URL)
+        etapa.out = dispatch_reglas(msg, contexto, session_id, PHP_BASE_URL)
     except Exception as e:
         logger.exception("Error en dispatch: %s", e)
         return _fallback_response(session_id)
+    etapa.pedido = pedido_llm(msg, contexto, etapa.out)
+
+    if con_reglas:
+        out = etapa.out
+        cards = out.get("cards")
+        if cards and compact:
+            cards = cards_mod.compactar(cards, sessions.cards_vistas(session_id))
+        etapa.reglas = {**{k: out.get(k) for k in ("text", "actions", "intent")}, "cards": cards, "session_id": session_id}
+    return etapa
 
+
+def _etapa_cierre(etapa: _Etapa) -> ChatResponse:
+    """Guarda el turno (sesión, mensajes, entrenamiento) y arma la respuesta."""
+    out, msg, session_id, contexto = etapa.out, etapa.msg, etapa.session_id, etapa.contexto
     text = (out.get("text") or "").strip()
     actions = out.get("actions") or []
     cards = out.get("cards")
-    ctx = out.get("context") or {}
+    ctx = {k: v for k, v in (out.get("context") or {}).items() if k not in sessions.HISTORY_KEYS}
     intent = out.get("intent")
+    # El origen (admin/web) no lo devuelven los handlers: conservarlo para el siguiente turno
+    estado = {**ctx, "origen": contexto["origen"]} if contexto.get("origen") and "origen" not in ctx else ctx
+    enviadas = [cards_mod.clave(c) for c in cards or []]
+    if cards and etapa.compact:
+        cards = cards_mod.compactar(cards, sessions.cards_vistas(session_id))
+    sessions.store.save_turn(session_id, estado, msg, text, cards_enviadas=enviadas)
 
     try:
         guardar_mensaje(session_id, "user", msg)
@@ -232,7 +410,7 @@ def chat(req: ChatRequest):
         pass
 
     entrenamiento_id = None
-    if es_admin:
+    if etapa.es_admin:
         try:
             entrenamiento_id = guardar_entrenamiento_turno(
                 conversacion_id=session_id,
@@ -257,6 +435,232 @@ def chat(req: ChatRequest):
     )
 
 
+# --- Chat por WebSocket (widget con conexión abierta) ---
+
+# Tamaño máximo de un frame del cliente (el mensaje en sí: 2000 caracteres, como en /chat)
+WS_MAX_FRAME = 4096
+
+
+def _ws_mensaje(frame: str) -> Dict[str, Any]:
+    """Frame del cliente (texto o JSON) -> kwargs del turno. ValueError con el motivo si no es válido."""
+    if len(frame) > WS_MAX_FRAME:
+        raise ValueError("Mensaje demasiado largo")
+    frame = frame.strip()
+    if frame.startswith("{"):
+        try:
+            data = json.loads(frame)
+        except ValueError:
+            raise ValueError("JSON no válido")
+    else:
+        data = {"message": frame}
+    msg = str(data.get("message") or "").strip()
+    if not msg or len(msg) > 2000:
+        raise ValueError("message requerido (máximo 2000 caracteres)")
+    tipo, ref = data.get("referencia_tipo"), data.get("referencia_id")
+    if tipo not in (None, "propiedad", "proyecto") or (ref is not None and (not isinstance(ref, int) or ref < 1)):
+        raise ValueError("referencia_tipo / referencia_id no válidos")
+    return {"message": msg, "referencia_tipo": tipo, "referencia_id": ref}
+
+
+@app.websocket("/ws/chat")
+async def ws_chat(ws: WebSocket, session_id: Optional[str] = None, compact: bool = False):
+    """
+    Canal persistente del widget: la sesión queda ligada a la conexión (se crea con el
+    primer mensaje o se retoma con ?session_id=) y el contexto vive en el servidor.
+    ?compact=true: cards compactas, como compact en /chat.
+    Cliente -> servidor: el mensaje como texto, o {"message", "referencia_tipo", "referencia_id"}.
+    Servidor -> cliente, por mensaje:
+      {"type": "reglas", text, cards, actions, intent, session_id}  respuesta del motor de reglas
+      {"type": "token", text}                                        texto de Gemini a medida que llega
+      {"type": "reset"}                                              descartar los token recibidos (reintento o borrador)
+      {"type": "fin", text, context, session_id, intent, llm_used}   texto definitivo (reemplaza a los anteriores)
+      {"type": "error", detail, retry_after?}                        mensaje no válido, límite o carga
+    Mismo turno que /chat (_turno) y mismos límites (ratelimit, admisión, bulkheads "db" y "llm").
+    """
+    origin = ws.headers.get("origin")
+    # CORS no protege los WebSocket: sin esta comprobación cualquier sitio abriría el canal
+    # con las cookies del visitante
+    if origin and not origen_permitido(origin):
+        await ws.close(code=1008)
+        return
+    await ws.accept()
+    loop = asyncio.get_running_loop()
+    ip = _ip_cliente(ws)
+    sid = (session_id or "").strip()[:64] or None
+    try:
+        while True:
+            frame = await ws.receive_text()
+            try:
+                entrada = _ws_mensaje(frame)
+            except ValueError as e:
+                await ws.send_json({"type": "error", "detail": str(e)})
+                continue
+            espera = await limitador.revisar_async(ip, sid)
+            if espera:
+                await ws.send_json({"type": "error", "detail": _MUY_RAPIDO, "retry_after": max(1, math.ceil(espera))})
+                continue
+            if admision.entrar() >= RECHAZO:
+                await ws.send_json({"type": "error", "detail": _OCUPADO, "retry_after": ADMISION_RETRY_AFTER_SEC})
+                continue
+            t0 = time.perf_counter()
+            # El turno (y los hilos de "db" y "llm") dejan aquí lo que hay que enviar; None = fin
+            cola: "asyncio.Queue[Optional[Dict[str, Any]]]" = asyncio.Queue()
+
+            def push(m: Optional[Dict[str, Any]], cola=cola) -> None:
+                loop.call_soon_threadsafe(cola.put_nowait, m)
+
+            turno = asyncio.ensure_future(_turno(
+                entrada["message"], sid, None, entrada["referencia_tipo"], entrada["referencia_id"], compact,
+                on_reglas=lambda r, push=push: push({"type": "reglas", **r}),
+                on_token=lambda t, push=push: push({"type": "token", "text": t}),
+                on_reset=lambda push=push: push({"type": "reset"}),
+            ))
+            turno.add_done_callback(lambda f, push=push: push(None))
+            try:
+                hubo_reglas = False
+                while True:
+                    m = await cola.get()
+                    if m is None:
+                        break
+                    hubo_reglas = hubo_reglas or m["type"] == "reglas"
+                    await ws.send_json(m)
+                resp = turno.result()
+            except WebSocketDisconnect:
+                raise
+            except bulkheads.Saturado:
+                await ws.send_json({"type": "error", "detail": _OCUPADO, "retry_after": 2})
+                continue
+            except Exception as e:
+                logger.exception("Error en turno por WebSocket: %s", e)
+                await ws.send_json({"type": "error", "detail": "No se pudo procesar el mensaje. Intenta de nuevo."})
+                continue
+            finally:
+                admision.salir((time.perf_counter() - t0) * 1000)
+            sid = resp.session_id
+            # Cards y acciones ya fueron con "reglas"
+            fin = resp.model_dump(exclude={"cards", "actions"} if hubo_reglas else None)
+            await ws.send_json({"type": "fin", **fin})
+    except WebSocketDisconnect:
+        return
+
+
+# --- Caché (avisos del panel PHP) ---
+
+class CacheInvalidateRequest(BaseModel):
+    # all | propiedad:<id> | proyecto:<id> | faqs | config
+    scopes: List[str] = Field(..., min_length=1, max_length=100)
+
+
+@app.post("/cache/invalidate")
+def cache_invalidate(req: CacheInvalidateRequest, authorization: Optional[str] = Header(None)):
+    """
+    El panel PHP llama aquí después de guardar una propiedad, proyecto, FAQ o config.
+    Header: Authorization: Bearer <CACHE_INVALIDATE_TOKEN>. Se publica como cambio de las
+    tablas indicadas (mismo camino que el detector de cambios): cada caché recarga lo suyo.
+    """
+    if not CACHE_INVALIDATE_TOKEN:
+        raise HTTPException(status_code=404, detail="Caché deshabilitada (CACHE_INVALIDATE_TOKEN vacío)")
+    if not _bearer_valido(authorization, CACHE_INVALIDATE_TOKEN):
+        raise HTTPException(status_code=401, detail="Token inválido")
+    try:
+        tablas = {t for scope in req.scopes for t in changes.tablas_de_scope(scope)}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    logger.info("Aviso de cambios del panel: %s", req.scopes)
+    # Un sondeo con las tablas avisadas forzadas: también deja la firma al día (sin recarga doble)
+    recargadas = changes.detector.poll(forzar=tablas, origen="panel")
+    return {"ok": True, "scopes": req.scopes, "tablas": sorted(recargadas)}
+
+
+@app.get("/cards")
+def cards_por_id(ids: str, compact: bool = True):
+    """
+    Cards por id para el modo compacto (las que el cliente no tiene en caché).
+    ids: "propiedad:12,proyecto:3" (un número solo = propiedad). Mismo orden; las que ya no
+    están activas se omiten.
+    """
+    pedidas = []
+    for parte in ids.split(","):
+        tipo, _, ident = parte.strip().rpartition(":")
+        tipo = tipo or "propiedad"
+        if tipo not in ("propiedad", "proyecto") or not ident.isdigit():
+            raise HTTPException(status_code=400, detail=f"id no válido: {parte.strip()!r}")
+        pedidas.append((tipo, int(ident)))
+    if len(pedidas) > 50:
+        raise HTTPException(status_code=400, detail="Máximo 50 ids por petición")
+    prop_ids = sorted({i for t, i in pedidas if t == "propiedad"})
+    proy_ids = sorted({i for t, i in pedidas if t == "proyecto"})
+    encontradas: Dict[str, Dict[str, Any]] = {}
+    if prop_ids:
+        for p in buscar_propiedades(ids=prop_ids, limite=len(prop_ids)):
+            c = cards_mod.card_propiedad(p, PHP_BASE_URL)
+            encontradas[cards_mod.clave(c)] = c
+    if proy_ids:
+        for pr in buscar_proyectos(ids=proy_ids, limite=len(proy_ids)):
+            c = cards_mod.card_proyecto(pr, PHP_BASE_URL)
+            encontradas[cards_mod.clave(c)] = c
+    out = [encontradas[f"{t}:{i}"] for t, i in pedidas if f"{t}:{i}" in encontradas]
+    if compact:
+        out = [cards_mod.card_compacta(c) for c in out]
+    return {"cards": out}
+
+
+@app.get("/catalog/facets")
+def catalog_facets(
+    tipo: Optional[str] = None,
+    zona: Optional[str] = None,
+    habitaciones: Optional[int] = None,
+    precio_min: Optional[float] = None,
+    precio_max: Optional[float] = None,
+    if_none_match: Optional[str] = Header(None),
+):
+    """
+    Conteos por tipo, zona y habitaciones e histograma de precios de las propiedades activas,
+    opcionalmente dentro de unos filtros (ej. ?tipo=renta). Con ETag: si el cliente manda
+    If-None-Match y no cambió nada, 304 sin cuerpo.
+    """
+    for nombre, valor in (("precio_min", precio_min), ("precio_max", precio_max)):
+        if valor is not None and not math.isfinite(valor):
+            raise HTTPException(status_code=422, detail=f"{nombre} debe ser un número finito")
+    catalog_ensure_fresh()
+    facetas = get_facetas()
+    if facetas is None:
+        raise HTTPException(status_code=503, detail="Facetas no disponibles (catálogo sin cargar)")
+    etag, body = facetas.respuesta(tipo, zona, habitaciones, precio_min, precio_max)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if if_none_match:
+        enviados = {t.strip().removeprefix("W/") for t in if_none_match.split(",")}
+        if etag in enviados or "*" in enviados:
+            return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+# --- NLU por lotes (panel admin / analítica) ---
+
+class NluBatchItem(BaseModel):
+    message: str = Field(..., max_length=2000)
+    contexto: Optional[Dict[str, Any]] = None
+
+
+class NluBatchRequest(BaseModel):
+    items: List[NluBatchItem] = Field(..., min_length=1, max_length=NLU_BATCH_MAX)
+
+
+@app.post("/nlu/batch")
+def nlu_batch_endpoint(req: NluBatchRequest):
+    """
+    Intención y entidades para muchos mensajes, sin escribir en BD ni llamar a Gemini.
+    Responde NDJSON (una línea por mensaje: i, intent, fuente, entities) a medida que avanza.
+    """
+    catalog_ensure_fresh()
+    items = [(i, it.message, it.contexto) for i, it in enumerate(req.items)]
+    # Content-Encoding propio: GZipMiddleware deja pasar la respuesta tal cual (comprimida,
+    # retendría las líneas hasta llenar su búfer en vez de enviarlas a medida que salen)
+    return StreamingResponse(
+        nlu_batch.stream_ndjson(items), media_type="application/x-ndjson", headers={"Content-Encoding": "identity"}
+    )
+
+
 # --- Entrenamiento supervisado (panel admin) ---
 
 class EvaluarRequest(BaseModel):
@@ -286,3 +690,48 @@ def entrenamiento_listar(limite: int = 50, estado: Optional[str] = None, intenci
     """Lista registros de entrenamiento para el panel admin (filtros opcionales)."""
     items = listar_entrenamiento(limite=min(limite, 200), estado=estado, intencion=intencion)
     return {"items": items, "total": len(items)}
+
+
+# Último entrenamiento del clasificador (POST /entrenamiento/modelo corre en segundo plano)
+_entrenamiento: Dict[str, Any] = {"estado": "sin_iniciar"}
+
+
+def _entrenar_modelo(trabajo: Dict[str, Any]) -> None:
+    try:
+        report = intent_model.train_from_db()
+        if report.get("ok"):
+            intent_model.load()
+        trabajo.update(estado="ok" if report.get("ok") else "error", reporte=report, error=report.get("error"))
+    except Exception as e:
+        logger.exception("Error entrenando el clasificador de intención: %s", e)
+        trabajo.update(estado="error", reporte=None, error=str(e))
+    trabajo["fin"] = time.time()
+
+
+@app.post("/entrenamiento/modelo", status_code=202)
+def entrenamiento_modelo(authorization: Optional[str] = Header(None)):
+    """
+    Entrena el clasificador de intención con los turnos aprobados (correcta/corregida),
+    lo guarda y lo activa, en segundo plano (bulkhead "entrenamiento"). Responde 202 con
+    el estado; GET /entrenamiento/modelo devuelve el resultado (exactitud en validación y
+    throughput de predicción). 409 si ya hay uno en curso.
+    Header: Authorization: Bearer <CACHE_INVALIDATE_TOKEN>.
+    """
+    global _entrenamiento
+    _autorizar(authorization, CACHE_INVALIDATE_TOKEN)
+    if intent_model is None:
+        raise HTTPException(status_code=501, detail="numpy no está instalado")
+    trabajo: Dict[str, Any] = {"estado": "en_curso", "inicio": time.time()}
+    try:
+        bulkheads.entrenamiento.submit(_entrenar_modelo, trabajo)
+    except bulkheads.Saturado:
+        raise HTTPException(status_code=409, detail="Ya hay un entrenamiento en curso")
+    _entrenamiento = trabajo
+    return dict(trabajo)
+
+
+@app.get("/entrenamiento/modelo")
+def entrenamiento_modelo_estado(authorization: Optional[str] = Header(None)):
+    """Estado del último entrenamiento: sin_iniciar | en_curso | ok | error (con reporte)."""
+    _autorizar(authorization, CACHE_INVALIDATE_TOKEN)
+    return dict(_entrenamiento)
@@ -2,8 +2,10 @@
 """Reglas y keywords. Fechas/horas naturales (mañana, 8 am), confirmación sí/no."""
 
 import re
+import unicodedata
 from datetime import date, timedelta
-from typing import Any, Dict, List, Optional, Tuple
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple, Union
 
 # Intenciones soportadas
 INTENT_SALUDO = "saludo"
@@ -48,6 +50,11 @@ KEYWORDS_DESPEDIDA = [
     "gracias", "chao", "adiós", "adios", "hasta luego", "bye", "nos vemos",
     "eso es todo", "nada más", "nada mas", "hasta pronto",
 ]
+# "Otra parecida a esa" (sobre la propiedad mostrada)
+KEYWORDS_SIMILAR = [
+    "parecida", "parecido", "parecidas", "parecidos", "similar", "como esa", "como ese",
+    "igual a esa", "igual a ese", "del mismo estilo",
+]
 
 # Patrones para extraer entidades
 RE_MONEDA = re.compile(
@@ -64,6 +71,42 @@ RE_UBICACION = re.compile(
 )
 
 
+RE_EMAIL = re.compile(r"[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+")
+RE_FECHA_ISO = re.compile(r"\b(20\d{2})-(\d{2})-(\d{2})\b")
+RE_FECHA_DMY = re.compile(r"\b(\d{1,2})[/\-](\d{1,2})[/\-](20\d{2})\b")
+RE_HORA = re.compile(r"\b(\d{1,2}):(\d{2})(?::(\d{2}))?\b")
+RE_HORA_NATURAL = re.compile(r"\b(\d{1,2})\s*(?::(\d{2}))?\s*(?:am|pm|a\.m\.|p\.m\.|de la mañana|de la tarde|de la noche)\b")
+RE_HORA_FINAL = re.compile(r"\b(\d{1,2})\s*(?::(\d{2}))?\s*$")
+RE_HORA_LAS = re.compile(r"(?:a las|las|a la)\s*(\d{1,2})\s*(?::(\d{2}))?")
+RE_NUMEROS = re.compile(r"\d+(?:[.,]\d+)*")
+RE_TOKEN = re.compile(r"[a-z0-9]+")
+
+# Gazetteer del catálogo (lo instala catalog.py al cargar/refrescar). None = solo reglas.
+_gazetteer = None
+
+
+def set_gazetteer(g) -> None:
+    global _gazetteer
+    _gazetteer = g
+
+
+def get_gazetteer():
+    return _gazetteer
+
+
+# Clasificador entrenado (intent_model.py); solo respalda a las reglas cuando dan duda_general
+_intent_model = None
+
+
+def set_intent_model(m) -> None:
+    global _intent_model
+    _intent_model = m
+
+
+def get_intent_model():
+    return _intent_model
+
+
 def _normalize(s: str) -> str:
     if not s:
         return ""
@@ -72,28 +115,131 @@ def _normalize(s: str) -> str:
     return t
 
 
-def _match_keywords(texto: str, keywords: List[str]) -> bool:
-    t = _normalize(texto)
+def fold(s: str) -> str:
+    """Quita tildes (medellín -> medellin, ñ -> n). Espera texto ya normalizado."""
+    if not s or s.isascii():
+        return s or ""
+    return "".join(c for c in unicodedata.normalize("NFKD", s) if not unicodedata.combining(c))
+
+
+class MessageAnalysis:
+    """
+    Análisis de un mensaje calculado una sola vez por turno.
+    Todos los extractores (intención, entidades, nombre, email, teléfono, fecha, hora)
+    leen de aquí en vez de volver a normalizar y recorrer el texto.
+    """
+
+    __slots__ = (
+        "texto", "compact", "normalized", "folded", "tokens", "numbers",
+        "emails", "digits", "fechas", "fecha_relativa", "horas", "_derived",
+    )
+
+    def __init__(self, texto: str):
+        raw = texto or ""
+        self.texto = raw
+        self.compact = re.sub(r"\s+", " ", raw.strip())
+        self.normalized = self.compact.lower()
+        self.folded = fold(self.normalized)
+        self.tokens: Tuple[str, ...] = tuple(RE_TOKEN.findall(self.folded))
+        # (texto del número, inicio, fin) sobre el texto normalizado
+        self.numbers: Tuple[Tuple[str, int, int], ...] = tuple(
+            (m.group(0), m.start(), m.end()) for m in RE_NUMEROS.finditer(self.normalized)
+        )
+        self.emails: Tuple[str, ...] = tuple(m.group(0).strip() for m in RE_EMAIL.finditer(raw.strip()))
+        self.digits = re.sub(r"\D", "", raw)
+        self.fechas = self._fechas(raw)
+        self.fecha_relativa = self._fecha_relativa(self.normalized)
+        self.horas = self._horas(raw, self.normalized)
+        self._derived: Dict[str, Any] = {}
+
+    @staticmethod
+    def _fechas(raw: str) -> Tuple[str, ...]:
+        """Fechas explícitas YYYY-MM-DD, en orden de prioridad (ISO primero, luego dd/mm/yyyy)."""
+        out: List[str] = []
+        m = RE_FECHA_ISO.search(raw)
+        if m:
+            out.append(m.group(0))
+        m = RE_FECHA_DMY.search(raw)
+        if m:
+            d, mo, y = m.group(1).zfill(2), m.group(2).zfill(2), m.group(3)
+            out.append(f"{y}-{mo}-{d}")
+        return tuple(out)
+
+    @staticmethod
+    def _fecha_relativa(t: str) -> Optional[int]:
+        """Días desde hoy para 'mañana', 'pasado mañana', 'hoy' (se resuelve al extraer, no aquí)."""
+        if not t:
+            return None
+        if "manana" in t or "mañana" in t:
+            return 1
+        if "pasado manana" in t or "pasado mañana" in t:
+            return 2
+        if "hoy" in t:
+            return 0
+        return None
+
+    @staticmethod
+    def _horas(raw: str, t: str) -> Tuple[str, ...]:
+        """Horas HH:MM: primero la explícita (8:00), luego la natural (8 am, a las 8)."""
+        out: List[str] = []
+        m = RE_HORA.search(raw)
+        if m:
+            h, mi = int(m.group(1)), int(m.group(2))
+            if 0 <= h <= 23 and 0 <= mi <= 59:
+                out.append(f"{h:02d}:{mi:02d}")
+        natural = _hora_natural(t)
+        if natural:
+            out.append(natural)
+        return tuple(out)
+
+    def entities(self) -> Dict[str, Any]:
+        # El gazetteer puede cambiar entre turnos con el mismo texto: invalidar si es otro
+        g = _gazetteer
+        cached = self._derived.get("entities")
+        if cached is None or cached[0] is not g:
+            cached = self._derived["entities"] = (g, _extract_entities(self, g))
+        return cached[1]
+
+
+@lru_cache(maxsize=512)
+def analyze(texto: str) -> MessageAnalysis:
+    """Análisis memoizado: el mismo texto en el mismo turno se recorre una sola vez."""
+    return MessageAnalysis(texto)
+
+
+def _as_analysis(texto: Union[str, MessageAnalysis, None]) -> MessageAnalysis:
+    if isinstance(texto, MessageAnalysis):
+        return texto
+    return analyze(texto or "")
+
+
+def pide_similar(texto: Union[str, MessageAnalysis]) -> bool:
+    """El usuario pide algo parecido a lo que ya vio ("una parecida", "similar a esa")."""
+    return _match_keywords(_as_analysis(texto).normalized, KEYWORDS_SIMILAR)
+
+
+def _match_keywords(t: str, keywords: List[str]) -> bool:
+    """t: texto ya normalizado (MessageAnalysis.normalized)."""
     for k in keywords:
         if k in t:
             return True
     return False
 
 
-def _has_search_criteria(texto: str) -> bool:
+def _has_search_criteria(a: MessageAnalysis) -> bool:
     """True si el mensaje incluye criterios de búsqueda (casa, habitaciones, presupuesto, etc.)."""
-    t = _normalize(texto)
+    t = a.normalized
     criterios = [
         "casa", "apartamento", "aparto", "lote", "venta", "renta", "arriendo",
         "habitacion", "alcoba", "cuarto", "presupuesto", "precio", "comprar",
         "busco", "buscar", "propiedad", "proyecto", "millon", "millones",
     ]
-    return any(c in t for c in criterios) or bool(RE_NUMERO.search(texto)) or bool(RE_TIPO.search(texto))
+    return any(c in t for c in criterios) or bool(RE_NUMERO.search(a.texto)) or bool(RE_TIPO.search(a.texto))
 
 
-def _has_info_question(texto: str) -> bool:
+def _has_info_question(a: MessageAnalysis) -> bool:
     """True si el mensaje es una pregunta rápida de info (ubicación, quiénes somos, contacto)."""
-    t = _normalize(texto)
+    t = a.normalized
     info_words = [
         "donde", "ubicados", "ubicacion", "ubicación", "direccion", "dirección",
         "quienes somos", "quienes son", "que somos", "contacto", "telefono", "teléfono",
@@ -102,13 +248,30 @@ def _has_info_question(texto: str) -> bool:
     return any(w in t for w in info_words)
 
 
-def detect_intent(texto: str, contexto: Optional[Dict[str, Any]] = None) -> str:
+def detect_intent(texto: Union[str, MessageAnalysis], contexto: Optional[Dict[str, Any]] = None) -> str:
     """
     Detecta intención predominante.
     contexto: { "esperando": "nombre"|"email"|"telefono"|"fecha"|"hora"|None, "tipo_ref", "ref_id", ... }
     Prioridad: si hay saludo + criterios de búsqueda -> buscar_propiedad (contexto de conversación).
     """
-    t = _normalize(texto)
+    a = _as_analysis(texto)
+    intent = detect_intent_rules(a, contexto)
+    if intent is not None:
+        return intent
+    model = _intent_model
+    if model is None:
+        return INTENT_DUDA_GENERAL
+    try:
+        label, prob = model.predict_one(a)
+    except Exception:
+        return INTENT_DUDA_GENERAL
+    return accept_prediction(label, prob, contexto or {}, model.min_prob)
+
+
+def detect_intent_rules(texto: Union[str, MessageAnalysis], contexto: Optional[Dict[str, Any]] = None) -> Optional[str]:
+    """Solo reglas. None = ninguna regla decidió (el llamador cae en duda_general o en el clasificador)."""
+    a = _as_analysis(texto)
+    t = a.normalized
     if not t or len(t) < 2:
         return INTENT_DUDA_GENERAL
 
@@ -127,11 +290,12 @@ def detect_intent(texto: str, contexto: Optional[Dict[str, Any]] = None) -> str:
         return INTENT_AGENDAR_CITA
 
     # Si dice "hola" pero también pregunta algo concreto -> priorizar esa intención
-    if _match_keywords(t, KEYWORDS_SALUDO) and _has_info_question(texto):
+    saludo = _match_keywords(t, KEYWORDS_SALUDO)
+    if saludo and _has_info_question(a):
         return INTENT_PEDIR_INFORMACION  # ej. "hola donde estan ubicados" -> responder ubicación
-    if _match_keywords(t, KEYWORDS_SALUDO) and _has_search_criteria(texto):
+    if saludo and _has_search_criteria(a):
         return INTENT_BUSCAR_PROPIEDAD
-    if _match_keywords(t, KEYWORDS_SALUDO) and len(t) < 60:
+    if saludo and len(t) < 60:
         return INTENT_SALUDO
 
     if _match_keywords(t, KEYWORDS_DESPEDIDA):
@@ -142,7 +306,10 @@ def detect_intent(texto: str, contexto: Optional[Dict[str, Any]] = None) -> str:
         return INTENT_COMPARAR_OPCIONES
     if any(w in t for w in ["recomienda", "recomendación", "qué me recomiendas", "sugiere", "qué me sugieres", "recomiéndame"]):
         return INTENT_PEDIR_RECOMENDACION
-    if _match_keywords(t, KEYWORDS_BUSCAR) or _has_search_criteria(texto):
+    # "¿Tienes una parecida?" sobre la propiedad mostrada (sin criterios nuevos de búsqueda)
+    if ctx.get("referencia_id") and _match_keywords(t, KEYWORDS_SIMILAR) and not _has_search_criteria(a):
+        return INTENT_PEDIR_OTRA_OPCION
+    if _match_keywords(t, KEYWORDS_BUSCAR) or _has_search_criteria(a):
         return INTENT_BUSCAR_PROPIEDAD
     if _match_keywords(t, KEYWORDS_INFO):
         return INTENT_PEDIR_INFORMACION
@@ -159,21 +326,52 @@ def detect_intent(texto: str, contexto: Optional[Dict[str, Any]] = None) -> str:
         if any(w in t for w in ["baños", "banos", "cuántos baños", "cuantos banos", "cuantos baños", "cuántos banos", "y los baños", "tiene baño", "tiene bano", "qué más tiene", "que mas tiene", "cuántas habitaciones tiene", "cuantas habitaciones"]):
             return INTENT_PREGUNTA_SOBRE_PROPIEDAD
 
-    return INTENT_DUDA_GENERAL
+    return None
+
 
+# Intenciones que solo tienen sentido con cierto contexto (no las decide el clasificador a ciegas)
+_INTENTS_CON_REFERENCIA = (INTENT_PEDIR_OTRA_OPCION, INTENT_PREGUNTA_SOBRE_PROPIEDAD)
 
-def extract_entities(texto: str) -> Dict[str, Any]:
+
+def accept_prediction(label: str, prob: float, ctx: Dict[str, Any], min_prob: float) -> str:
+    """Las reglas no decidieron: aceptar la predicción del clasificador solo si es segura."""
+    if prob < min_prob or label in (INTENT_DUDA_GENERAL, INTENT_CONFIRMAR_DATOS):
+        return INTENT_DUDA_GENERAL
+    if label in _INTENTS_CON_REFERENCIA and not (ctx.get("referencia_id") or ctx.get("tipo_referencia")):
+        return INTENT_DUDA_GENERAL
+    return label
+
+
+def extract_entities(texto: Union[str, MessageAnalysis]) -> Dict[str, Any]:
     """
     Extrae presupuesto, habitaciones, tipo, ubicación.
-    Devuelve dict con keys: presupuesto_min, presupuesto_max, habitaciones, tipo, ubicacion.
+    Devuelve dict con keys: presupuesto_min, presupuesto_max, habitaciones, tipo, ubicacion,
+    propiedad_ids, proyecto_ids (ids del catálogo si la ubicación/nombre se resolvió con el gazetteer).
     """
-    t = _normalize(texto)
+    return dict(_as_analysis(texto).entities())
+
+
+def _parse_millions(s: str) -> Optional[float]:
+    s = re.sub(r"[\s.]", "", s.replace(",", "."))
+    try:
+        v = float(s)
+        if v < 1000:
+            return v  # asumir millones
+        return v / 1_000_000
+    except Exception:
+        return None
+
+
+def _extract_entities(a: MessageAnalysis, gazetteer=None) -> Dict[str, Any]:
+    t = a.normalized
     out: Dict[str, Any] = {
         "presupuesto_min": None,
         "presupuesto_max": None,
         "habitaciones": None,
         "tipo": None,
         "ubicacion": None,
+        "propiedad_ids": None,
+        "proyecto_ids": None,
     }
 
     # Tipo: prioridad explícita. "casa renta" = RENTA, no venta.
@@ -200,30 +398,21 @@ def extract_entities(texto: str) -> Dict[str, Any]:
                 out["habitaciones"] = 1 if "una" in w or "1" in w else (2 if "dos" in w or "2" in w else 3)
                 break
 
-    # Presupuesto: números + "millones" / "m" / "mm"
-    def _parse_millions(s: str) -> Optional[float]:
-        s = re.sub(r"[\s.]", "", s.replace(",", "."))
-        try:
-            v = float(s)
-            if v < 1000:
-                return v  # asumir millones
-            return v / 1_000_000
-        except Exception:
-            return None
-
-    for m in RE_MONEDA.finditer(t):
-        g1, g2 = m.group(1), m.group(2) if m.lastindex and m.lastindex >= 2 else None
-        for g in (g1, g2):
-            if g:
-                v = _parse_millions(g)
-                if v and v > 0:
-                    if "maximo" in t or "menos" in t or "hasta" in t:
-                        out["presupuesto_max"] = v * 1_000_000
-                    else:
-                        out["presupuesto_min"] = out["presupuesto_min"] or v * 1_000_000
-                    break
+    # Presupuesto: números + "millones" / "m" / "mm" (solo si el mensaje tiene algún número)
+    if a.numbers:
+        for m in RE_MONEDA.finditer(t):
+            g1, g2 = m.group(1), m.group(2) if m.lastindex and m.lastindex >= 2 else None
+            for g in (g1, g2):
+                if g:
+                    v = _parse_millions(g)
+                    if v and v > 0:
+                        if "maximo" in t or "menos" in t or "hasta" in t:
+                            out["presupuesto_max"] = v * 1_000_000
+                        else:
+                            out["presupuesto_min"] = out["presupuesto_min"] or v * 1_000_000
+                        break
     # Palabras sueltas: presupuesto / millones (ej. "tengo presupuesto de 350.000.000" -> tope máximo)
-    if "millon" in t or "millones" in t or "presupuesto" in t or "precio" in t:
+    if a.numbers and ("millon" in t or "millones" in t or "presupuesto" in t or "precio" in t):
         for n in re.finditer(r"\b(\d{1,3}(?:[.,]\d+)?(?:\s*[.,]\s*\d{3})*)\s*(?:millones?|m\b)?", t):
             raw = n.group(1)
             digits_only = re.sub(r"\D", "", raw)
@@ -246,7 +435,7 @@ def extract_entities(texto: str) -> Dict[str, Any]:
                     out["presupuesto_min"] = val
                 break
 
-    # Ubicación: "en X", "zona X", ciudades conocidas
+    # Lugar por reglas ("en X", "zona X", ciudades conocidas)
     for m in RE_UBICACION.finditer(t):
         u = (m.group(1) or m.group(2) or "").strip()
         if len(u) >= 2:
@@ -257,6 +446,17 @@ def extract_entities(texto: str) -> Dict[str, Any]:
             if w in t:
                 out["ubicacion"] = w.capitalize()
                 break
+
+    # Ubicación o nombre de proyecto/propiedad resuelto contra el catálogo (ids canónicos).
+    # Una frase que solo sale de títulos cede ante un lugar explícito ("casa moderna en Pereira")
+    mention = gazetteer.find(a.tokens) if gazetteer is not None else None
+    if mention and mention.de_titulo and out["ubicacion"]:
+        mention = gazetteer.resolve(out["ubicacion"])
+    if mention:
+        out["ubicacion"] = mention.label
+        out["propiedad_ids"] = mention.propiedad_ids
+        out["proyecto_ids"] = mention.proyecto_ids
+        return out
     # Nombre de proyecto/propiedad o lugar: "busco Ibiza", "tienen el proyecto X", "propiedad Vista Norte"
     if not out["ubicacion"]:
         name_match = re.search(
@@ -274,13 +474,13 @@ def extract_entities(texto: str) -> Dict[str, Any]:
     return out
 
 
-def extract_nombre(texto: str) -> Optional[str]:
+def extract_nombre(texto: Union[str, MessageAnalysis]) -> Optional[str]:
     """
     Extrae nombre (frase corta que parece un nombre, no una petición).
     No devuelve frases como "quiero agendar cita" o "dame información".
     """
-    t = (texto or "").strip()
-    t = re.sub(r"\s+", " ", t)
+    a = _as_analysis(texto)
+    t = a.compact
     if len(t) < 2 or len(t) > 80:
         return None
     if re.search(r"\d{5,}", t):
@@ -293,7 +493,7 @@ def extract_nombre(texto: str) -> Optional[str]:
         "proyecto", "opciones", "precio", "venta", "renta", "por favor", "gracias",
         "hola", "buenas", "dame", "necesito", "me gustaría", "me gustaria",
     )
-    tl = t.lower()
+    tl = a.normalized
     if any(p in tl for p in no_es_nombre):
         return None
     # Nombre razonable: pocas palabras (ej. "Juan Pérez" o "María García López")
@@ -303,73 +503,54 @@ def extract_nombre(texto: str) -> Optional[str]:
     return t if t else None
 
 
-def extract_telefono(texto: str) -> Optional[str]:
+def extract_telefono(texto: Union[str, MessageAnalysis]) -> Optional[str]:
     """Extrae teléfono (dígitos, posiblemente con espacios/guiones)."""
-    digits = re.sub(r"\D", "", (texto or ""))
-    if 7 <= len(digits) <= 15:
-        return digits
+    a = _as_analysis(texto)
+    if 7 <= len(a.digits) <= 15:
+        return a.digits
     return None
 
 
-def extract_email(texto: str) -> Optional[str]:
+def extract_email(texto: Union[str, MessageAnalysis]) -> Optional[str]:
     """Extrae email si aparece en el texto."""
-    t = (texto or "").strip()
-    # Patrón básico de email
-    m = re.search(r"[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+", t)
-    if m:
-        return m.group(0).strip()
-    return None
+    a = _as_analysis(texto)
+    return a.emails[0] if a.emails else None
 
 
-def extract_fecha(texto: str) -> Optional[str]:
+def extract_fecha(texto: Union[str, MessageAnalysis]) -> Optional[str]:
     """YYYY-MM-DD si detecta fecha en texto (ISO, dd/mm/yyyy o natural: mañana, hoy)."""
-    # ISO
-    m = re.search(r"\b(20\d{2})-(\d{2})-(\d{2})\b", texto or "")
-    if m:
-        return m.group(0)
-    # dd/mm/yyyy o dd-mm-yyyy
-    m = re.search(r"\b(\d{1,2})[/\-](\d{1,2})[/\-](20\d{2})\b", texto or "")
-    if m:
-        d, mo, y = m.group(1).zfill(2), m.group(2).zfill(2), m.group(3)
-        return f"{y}-{mo}-{d}"
+    a = _as_analysis(texto)
+    if a.fechas:
+        return a.fechas[0]
     # Natural: mañana, pasado mañana, hoy
-    return extract_fecha_natural(texto)
+    return extract_fecha_natural(a)
 
 
-def extract_fecha_natural(texto: str) -> Optional[str]:
+def extract_fecha_natural(texto: Union[str, MessageAnalysis]) -> Optional[str]:
     """Convierte 'mañana', 'pasado mañana', 'hoy' a YYYY-MM-DD."""
-    if not texto or not texto.strip():
+    a = _as_analysis(texto)
+    if a.fecha_relativa is None:
         return None
-    t = _normalize(texto)
-    hoy = date.today()
-    if "manana" in t or "mañana" in t:
-        return (hoy + timedelta(days=1)).strftime("%Y-%m-%d")
-    if "pasado manana" in t or "pasado mañana" in t:
-        return (hoy + timedelta(days=2)).strftime("%Y-%m-%d")
-    if "hoy" in t:
-        return hoy.strftime("%Y-%m-%d")
-    return None
+    # La fecha de hoy se resuelve aquí (el análisis memoizado no depende del día)
+    return (date.today() + timedelta(days=a.fecha_relativa)).strftime("%Y-%m-%d")
 
 
-def extract_hora(texto: str) -> Optional[str]:
+def extract_hora(texto: Union[str, MessageAnalysis]) -> Optional[str]:
     """HH:MM (formato 8:00 o natural: 8 am, 8 de la mañana)."""
-    # HH:MM o HH:MM:SS
-    m = re.search(r"\b(\d{1,2}):(\d{2})(?::(\d{2}))?\b", texto or "")
-    if m:
-        h, mi = int(m.group(1)), int(m.group(2))
-        if 0 <= h <= 23 and 0 <= mi <= 59:
-            return f"{h:02d}:{mi:02d}"
-    # Natural: 8 am, 8:00 am, 8 de la mañana, 9 pm
-    return extract_hora_natural(texto)
+    a = _as_analysis(texto)
+    return a.horas[0] if a.horas else None
 
 
-def extract_hora_natural(texto: str) -> Optional[str]:
+def extract_hora_natural(texto: Union[str, MessageAnalysis]) -> Optional[str]:
     """Extrae hora de '8 am', '8:00 am', '9 pm', '8 de la mañana'."""
-    if not texto or not texto.strip():
+    return _hora_natural(_as_analysis(texto).normalized)
+
+
+def _hora_natural(t: str) -> Optional[str]:
+    if not t:
         return None
-    t = _normalize(texto)
     # Número + am/pm o "de la mañana/tarde/noche"
-    m = re.search(r"\b(\d{1,2})\s*(?::(\d{2}))?\s*(?:am|pm|a\.m\.|p\.m\.|de la mañana|de la tarde|de la noche)\b", t)
+    m = RE_HORA_NATURAL.search(t)
     if m:
         h = int(m.group(1))
         mi = int(m.group(2)) if m.group(2) else 0
@@ -383,9 +564,9 @@ def extract_hora_natural(texto: str) -> Optional[str]:
             return f"{h:02d}:{mi:02d}"
     # Solo número cuando el contexto es cita/visita (ej. "a las 8")
     if "cita" in t or "visita" in t or "hora" in t or "las " in t:
-        m = re.search(r"\b(\d{1,2})\s*(?::(\d{2}))?\s*$", t)
+        m = RE_HORA_FINAL.search(t)
         if not m:
-            m = re.search(r"(?:a las|las|a la)\s*(\d{1,2})\s*(?::(\d{2}))?", t)
+            m = RE_HORA_LAS.search(t)
         if m:
             h = int(m.group(1))
             mi = int(m.group(2)) if m.group(2) else 0
@@ -394,11 +575,11 @@ def extract_hora_natural(texto: str) -> Optional[str]:
     return None
 
 
-def extract_confirmacion(texto: str) -> Optional[bool]:
+def extract_confirmacion(texto: Union[str, MessageAnalysis]) -> Optional[bool]:
     """True = sí/claro/ok, False = no/cancelar. None = no está confirmando."""
-    if not texto or not texto.strip():
+    t = _as_analysis(texto).normalized
+    if not t:
         return None
-    t = _normalize(texto)
     if len(t) > 80:
         return None
     positivos = ["si", "sí", "claro", "dale", "ok", "vale", "perfecto", "yes", "por favor", "adelante", "bueno", "de acuerdo"]
@@ -0,0 +1,152 @@
+# nlu_batch.py - Intención y entidades para lotes de mensajes (sin efectos secundarios)
+"""
+Para el panel admin y analítica: no escribe en BD ni llama a Gemini.
+Reglas por mensaje + clasificador en una sola llamada vectorizada para los que
+las reglas no deciden. Lotes grandes se reparten en un pool de procesos.
+
+El pool es uno solo y dura lo que el servidor. Sus procesos se crean con "spawn" (no
+fork: la API ya tiene hilos vivos, cuyos locks un fork copiaría tomados). No heredan el
+gazetteer ni el modelo: cada versión se escribe una vez a un pickle temporal y cada
+bloque lleva (versión, archivo); el proceso lo carga solo cuando su versión cambió.
+"""
+
+import json
+import logging
+import os
+import pickle
+import tempfile
+import threading
+from collections import deque
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+from typing import Any, Deque, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from config import NLU_BATCH_POOL_MIN, NLU_BATCH_WORKERS
+from nlu import (
+    INTENT_DUDA_GENERAL,
+    MessageAnalysis,
+    accept_prediction,
+    detect_intent_rules,
+    get_gazetteer,
+    get_intent_model,
+    set_gazetteer,
+    set_intent_model,
+)
+
+logger = logging.getLogger("chatbot-api")
+
+# Mensajes por tarea del pool (amortiza el envío entre procesos)
+CHUNK = 250
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+# (gazetteer, modelo, versión, archivo) publicados para los procesos del pool
+_publicado: Tuple[Any, Any, int, str] = (None, None, 0, "")
+# Archivos de versiones publicadas; se guardan las dos últimas (puede haber bloques en curso con la anterior)
+_archivos: Deque[str] = deque()
+# En cada proceso del pool: versión del estado cargado
+_version_local = 0
+
+
+def analizar(items: Sequence[Tuple[int, str, Optional[Dict[str, Any]]]]) -> List[Dict[str, Any]]:
+    """[(i, mensaje, contexto)] -> [{i, intent, fuente, entities}] en el proceso actual."""
+    # Análisis propio (no el memoizado): miles de textos distintos vaciarían la caché del chat
+    analisis = [MessageAnalysis(msg) for _, msg, _ in items]
+    out: List[Dict[str, Any]] = []
+    pendientes: List[int] = []
+    for k, ((i, _, ctx), a) in enumerate(zip(items, analisis)):
+        intent = detect_intent_rules(a, ctx)
+        out.append({"i": i, "intent": intent, "fuente": "reglas", "entities": a.entities()})
+        if intent is None:
+            pendientes.append(k)
+
+    model = get_intent_model()
+    if pendientes and model is not None:
+        preds = model.predict_batch([analisis[k] for k in pendientes])
+        for k, (label, prob) in zip(pendientes, preds):
+            intent = accept_prediction(label, prob, items[k][2] or {}, model.min_prob)
+            out[k]["intent"] = intent
+            out[k]["fuente"] = "modelo" if intent != INTENT_DUDA_GENERAL else "reglas"
+            out[k]["confianza"] = round(prob, 4)
+    for row in out:
+        if row["intent"] is None:
+            row["intent"] = INTENT_DUDA_GENERAL
+    return out
+
+
+def _analizar_en_proceso(version: int, archivo: str, items: Sequence[Tuple[int, str, Optional[Dict[str, Any]]]]) -> List[Dict[str, Any]]:
+    """analizar() dentro de un proceso del pool, con el gazetteer y el modelo de esa versión."""
+    global _version_local
+    if _version_local != version:
+        with open(archivo, "rb") as f:
+            gazetteer, modelo = pickle.load(f)
+        set_gazetteer(gazetteer)
+        set_intent_model(modelo)
+        _version_local = version
+    return analizar(items)
+
+
+def _borrar(archivo: str) -> None:
+    try:
+        os.remove(archivo)
+    except OSError:
+        pass
+
+
+def _estado_publicado() -> Tuple[int, str]:
+    """(versión, archivo) del gazetteer y modelo actuales; se escriben solo si cambiaron."""
+    global _publicado
+    gazetteer, modelo = get_gazetteer(), get_intent_model()
+    with _pool_lock:
+        g, m, version, archivo = _publicado
+        if not version or g is not gazetteer or m is not modelo:
+            version += 1
+            fd, archivo = tempfile.mkstemp(prefix=f"nlu_batch_{os.getpid()}_{version}_", suffix=".pkl")
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump((gazetteer, modelo), f, protocol=pickle.HIGHEST_PROTOCOL)
+            _archivos.append(archivo)
+            while len(_archivos) > 2:
+                _borrar(_archivos.popleft())
+            _publicado = (gazetteer, modelo, version, archivo)
+        return version, archivo
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=NLU_BATCH_WORKERS, mp_context=get_context("spawn"))
+        return _pool
+
+
+def stream_ndjson(items: Sequence[Tuple[int, str, Optional[Dict[str, Any]]]]) -> Iterator[bytes]:
+    """Una línea JSON por mensaje, a medida que se procesa cada bloque."""
+    chunks = [items[k:k + CHUNK] for k in range(0, len(items), CHUNK)]
+    if len(items) >= NLU_BATCH_POOL_MIN and NLU_BATCH_WORKERS > 1 and len(chunks) > 1:
+        version, archivo = _estado_publicado()
+        results = _get_pool().map(_analizar_en_proceso, repeat(version), repeat(archivo), chunks)
+    else:
+        results = map(analizar, chunks)
+    try:
+        for rows in results:
+            yield "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in rows).encode("utf-8")
+    except Exception as e:
+        if isinstance(e, BrokenProcessPool):
+            # Un proceso murió: el pool ya no sirve, el próximo lote crea otro
+            shutdown()
+        # La respuesta ya empezó (200): el error va como última línea
+        logger.exception("Error en /nlu/batch: %s", e)
+        yield (json.dumps({"error": "Error procesando el lote"}) + "\n").encode("utf-8")
+
+
+def shutdown() -> None:
+    global _pool, _publicado
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+        while _archivos:
+            _borrar(_archivos.popleft())
+        _publicado = (None, None, _publicado[2], "")
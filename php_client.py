@@ -1,31 +1,240 @@
 # php_client.py - Llamadas a APIs PHP (horarios, procesar cita)
-"""Reutiliza lógica existente en PHP. No duplica validaciones ni emails."""
+"""
+Reutiliza lógica existente en PHP. No duplica validaciones ni emails.
+Un solo cliente HTTP compartido (conexiones keep-alive a PHP_BASE_URL); las llamadas
+corren en el bulkhead "php" (PHP_MAX_CONCURRENCY hilos): si ninguno se libera en
+PHP_QUEUE_WAIT_SEC, la llamada falla enseguida en vez de seguir esperando. Los GET se
+reintentan con espera aleatoria ante errores de red o 502/503/504; procesar_cita lleva
+un idempotency_key y solo se reintenta cuando es seguro (ver _reintentable).
+Los horarios de cada fecha se recuerdan HORARIOS_PHP_TTL_SEC segundos; una cita
+agendada vacía los de su fecha.
+"""
 
-from typing import Any, Dict, List, Optional
+import logging
+import random
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Deque, Dict, List, Optional, Tuple
 
 import httpx
 
-from config import PHP_BASE_URL
+import bulkheads
+from bulkheads import Saturado
+from config import (
+    HORARIOS_PHP_TTL_SEC,
+    PHP_BASE_URL,
+    PHP_IDEMPOTENCIA,
+    PHP_MAX_CONNECTIONS,
+    PHP_QUEUE_WAIT_SEC,
+    PHP_RETRIES,
+    PHP_RETRY_BACKOFF_SEC,
+)
 
+logger = logging.getLogger("chatbot-api")
 
-def _url(path: str) -> str:
-    return f"{PHP_BASE_URL.rstrip('/')}{path}"
+# fecha -> (expira, horas)
+_horarios: Dict[str, Tuple[float, List[str]]] = {}
+_horarios_lock = threading.Lock()
 
+_client: Optional[httpx.Client] = None
+_client_lock = threading.Lock()
 
-def horarios_disponibles(fecha: str) -> List[str]:
+# Respuestas del PHP que suelen ser pasajeras (proxy/servidor reiniciando)
+_STATUS_REINTENTO = (502, 503, 504)
+# Latencias recientes por endpoint para p50/p95
+_MUESTRAS = 200
+_stats: Dict[str, Dict[str, Any]] = {}
+_stats_lock = threading.Lock()
+
+
+def client() -> httpx.Client:
+    """Cliente compartido (se crea al primer uso; thread-safe)."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = httpx.Client(
+                    base_url=PHP_BASE_URL.rstrip("/"),
+                    limits=httpx.Limits(
+                        max_connections=PHP_MAX_CONNECTIONS,
+                        max_keepalive_connections=PHP_MAX_CONNECTIONS,
+                        keepalive_expiry=30.0,
+                    ),
+                )
+    return _client
+
+
+def close() -> None:
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+
+
+def _stat(endpoint: str) -> Dict[str, Any]:
+    """Contadores del endpoint (llamar con _stats_lock tomado)."""
+    s = _stats.get(endpoint)
+    if s is None:
+        ms: Deque[float] = deque(maxlen=_MUESTRAS)
+        s = _stats[endpoint] = {"llamadas": 0, "errores": 0, "reintentos": 0, "saturado": 0, "ms": ms}
+    return s
+
+
+def _registrar(endpoint: str, ms: float, ok: bool, reintentos: int) -> None:
+    with _stats_lock:
+        s = _stat(endpoint)
+        s["llamadas"] += 1
+        s["reintentos"] += reintentos
+        if not ok:
+            s["errores"] += 1
+        s["ms"].append(ms)
+
+
+def _reintentable(e: Exception, idempotente: bool) -> bool:
     """
-    GET api/horarios-disponibles.php?fecha=YYYY-MM-DD
-    Devuelve lista de horas ['08:30', '09:30', ...] o [].
+    Errores de conexión: la petición no llegó, siempre se puede repetir. Timeouts de
+    lectura y 502/503/504: el PHP pudo haberla procesado; solo se repite si es idempotente
+    (GET, o POST con idempotency_key que el PHP respeta: PHP_IDEMPOTENCIA=1).
     """
+    if isinstance(e, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)):
+        return True
+    if isinstance(e, httpx.HTTPStatusError):
+        return idempotente and e.response.status_code in _STATUS_REINTENTO
+    return idempotente and isinstance(e, httpx.TransportError)
+
+
+def _request(method: str, path: str, endpoint: str, idempotente: bool, timeout: float, **kwargs: Any) -> httpx.Response:
+    """Petición al PHP en el bulkhead "php", con reintentos con jitter y métricas. Lanza si falla."""
+    try:
+        return bulkheads.php.run(_llamar, method, path, endpoint, idempotente, timeout, kwargs, espera=PHP_QUEUE_WAIT_SEC)
+    except Saturado:
+        with _stats_lock:
+            _stat(endpoint)["saturado"] += 1
+        raise
+
+
+def _llamar(method: str, path: str, endpoint: str, idempotente: bool, timeout: float, kwargs: Dict[str, Any]) -> httpx.Response:
+    t0 = time.perf_counter()
+    intento = 0
+    while True:
+        try:
+            r = client().request(method, path, timeout=timeout, **kwargs)
+            r.raise_for_status()
+            _registrar(endpoint, (time.perf_counter() - t0) * 1000, True, intento)
+            return r
+        except Exception as e:
+            if intento >= PHP_RETRIES or not _reintentable(e, idempotente):
+                _registrar(endpoint, (time.perf_counter() - t0) * 1000, False, intento)
+                raise
+            # Espera exponencial con jitter completo: los reintentos no llegan todos juntos
+            espera = random.uniform(0, PHP_RETRY_BACKOFF_SEC * (2 ** intento))
+            logger.info("PHP %s falló (%s), reintento %d en %.2fs", endpoint, e.__class__.__name__, intento + 1, espera)
+            intento += 1
+            time.sleep(espera)
+
+
+def _percentil(ms: List[float], p: float) -> Optional[float]:
+    if not ms:
+        return None
+    ms = sorted(ms)
+    return round(ms[min(len(ms) - 1, int(p * len(ms)))], 1)
+
+
+def stats() -> Dict[str, Any]:
+    with _stats_lock:
+        out: Dict[str, Any] = {}
+        for endpoint, s in _stats.items():
+            ms = list(s["ms"])
+            out[endpoint] = {
+                **{k: v for k, v in s.items() if k != "ms"},
+                "p50_ms": _percentil(ms, 0.5),
+                "p95_ms": _percentil(ms, 0.95),
+            }
+        return out
+
+
+def _horarios_recordados(fecha: str) -> Optional[List[str]]:
+    hit = _horarios.get(fecha)
+    return hit[1] if hit is not None and hit[0] > time.monotonic() else None
+
+
+def _horarios_de(fecha: str, r: httpx.Response) -> Optional[List[str]]:
+    """Horas de la respuesta de horarios-disponibles.php (y se recuerdan); None si no es válida."""
     try:
-        r = httpx.get(_url("/api/horarios-disponibles.php"), params={"fecha": fecha}, timeout=10.0)
-        r.raise_for_status()
         data = r.json()
-        if isinstance(data, dict) and data.get("success") and "horarios" in data:
-            return list(data["horarios"]) if isinstance(data["horarios"], (list, tuple)) else []
-        return []
     except Exception:
-        return []
+        return None
+    if isinstance(data, dict) and data.get("success") and "horarios" in data:
+        horas = list(data["horarios"]) if isinstance(data["horarios"], (list, tuple)) else []
+    elif isinstance(data, dict) and "success" in data:
+        horas = []
+    else:
+        return None
+    if HORARIOS_PHP_TTL_SEC > 0:
+        with _horarios_lock:
+            ahora = time.monotonic()
+            for f in [f for f, (exp, _) in _horarios.items() if exp <= ahora]:
+                del _horarios[f]
+            _horarios[fecha] = (ahora + HORARIOS_PHP_TTL_SEC, horas)
+    return horas
+
+
+def consultar_horarios(fecha: str) -> Optional[List[str]]:
+    """
+    GET api/horarios-disponibles.php?fecha=YYYY-MM-DD
+    Devuelve lista de horas ['08:30', '09:30', ...]; None si el PHP no respondió bien
+    (distinto de [] = ese día no hay horarios).
+    """
+    horas = _horarios_recordados(fecha)
+    if horas is not None:
+        return horas
+    try:
+        r = _request("GET", "/api/horarios-disponibles.php", "horarios", True, 10.0, params={"fecha": fecha})
+    except Exception:
+        return None
+    return _horarios_de(fecha, r)
+
+
+def consultar_horarios_async(fecha: str) -> Future:
+    """
+    consultar_horarios sin esperar: la petición ocupa un hilo del bulkhead "php" y el
+    Future se resuelve con las horas (o None). Lanza Saturado si el bulkhead está lleno.
+    """
+
+    def tarea() -> Optional[List[str]]:
+        horas = _horarios_recordados(fecha)
+        if horas is not None:
+            return horas
+        try:
+            r = _llamar("GET", "/api/horarios-disponibles.php", "horarios", True, 10.0, {"params": {"fecha": fecha}})
+        except Exception:
+            return None
+        return _horarios_de(fecha, r)
+
+    try:
+        return bulkheads.php.submit(tarea)
+    except Saturado:
+        with _stats_lock:
+            _stat("horarios")["saturado"] += 1
+        raise
+
+
+def invalidar_horarios(fecha: Optional[str] = None) -> None:
+    """Olvida los horarios recordados de una fecha (None = todas)."""
+    with _horarios_lock:
+        if fecha is None:
+            _horarios.clear()
+        else:
+            _horarios.pop(fecha, None)
+
+
+def horarios_disponibles(fecha: str) -> List[str]:
+    """Como consultar_horarios, pero [] también si hubo error."""
+    return consultar_horarios(fecha) or []
 
 
 def procesar_cita(
@@ -36,10 +245,14 @@ def procesar_cita(
     fecha: str,
     hora: str,
     email: Optional[str] = None,
+    idempotency_key: Optional[str] = None,
 ) -> Dict[str, Any]:
     """
     POST procesar-cita.php (form).
     Devuelve {success, message, cita_id?, agente?}.
+    idempotency_key: el mismo para todos los intentos de agendar la misma cita (va como
+    campo y como header Idempotency-Key); procesar-cita.php debe devolver la cita ya creada
+    si lo recibe repetido.
     """
     payload: Dict[str, Any] = {
         "nombre": nombre.strip(),
@@ -51,16 +264,25 @@ def procesar_cita(
     }
     if email and email.strip():
         payload["email"] = email.strip()
+    idempotency_key = idempotency_key or uuid.uuid4().hex
+    payload["idempotency_key"] = idempotency_key
 
     try:
-        r = httpx.post(_url("/procesar-cita.php"), data=payload, timeout=15.0)
-        r.raise_for_status()
-        return r.json() if r.content else {"success": False, "message": "Respuesta vacía"}
+        r = _request(
+            "POST", "/procesar-cita.php", "procesar_cita", PHP_IDEMPOTENCIA, 15.0,
+            data=payload, headers={"Idempotency-Key": idempotency_key},
+        )
+        resp = r.json() if r.content else {"success": False, "message": "Respuesta vacía"}
+        if resp.get("success"):
+            invalidar_horarios(fecha)
+        return resp
     except httpx.HTTPStatusError as e:
         try:
             body = e.response.json()
         except Exception:
             body = {"message": e.response.text or str(e)}
         return {"success": False, "message": body.get("message", "Error al procesar la cita")}
-    except Exception as e:
+    except Saturado:
+        return {"success": False, "message": "Estamos con muchas solicitudes en este momento. Intenta de nuevo en unos segundos."}
+    except Exception:
         return {"success": False, "message": "No se pudo conectar con el servidor. Intenta más tarde."}
@@ -0,0 +1,148 @@
+# ranking.py - Ranking de alternativas por cercanía a lo pedido (catálogo en memoria)
+"""
+Cuando no hay coincidencia exacta, en vez de probar filtros relajados uno tras otro se
+puntúa todo el catálogo activo de una vez (NumPy): cada criterio no cumplido suma una
+penalización según cuánto se aleja (habitaciones de menos, % sobre el presupuesto,
+otro tipo, otra zona). Se devuelven las N más cercanas con lo que se tuvo que relajar,
+para que reasoning.py lo explique sin inventar.
+Las filas devueltas son las del catálogo: no deben modificarse.
+"""
+
+import re
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from nlu import fold
+
+# Penalización por criterio. Unidades: 1 habitación de menos = 1; cada 20% fuera del
+# presupuesto = 1 (la antigua relajación: 1 hab menos y +20% => 2 = CERCA)
+PESO_HABITACIONES = 1.0
+PESO_PRECIO = 1.0 / 0.2
+PESO_UBICACION = 1.5
+PESO_TIPO = 3.0
+# Dato faltante en la propiedad (sin precio / sin habitaciones) cuando el usuario lo pidió
+PESO_FALTANTE = 1.0
+
+# Hasta aquí es una "alternativa cercana"; más lejos es solo "otras opciones"
+CERCA = 2.0
+
+
+class Candidato:
+    """Propiedad del catálogo, su distancia a lo pedido y los criterios relajados (en orden)."""
+
+    __slots__ = ("prop", "score", "relajado")
+
+    def __init__(self, prop: Dict[str, Any], score: float, relajado: Tuple[str, ...]):
+        self.prop = prop
+        self.score = score
+        self.relajado = relajado
+
+    @property
+    def cercano(self) -> bool:
+        return self.score <= CERCA
+
+
+def _texto(v: Optional[str]) -> str:
+    return fold(" ".join((v or "").lower().split()))
+
+
+def _float(v: Any) -> float:
+    try:
+        return float(v) if v is not None else np.nan
+    except (TypeError, ValueError):
+        return np.nan
+
+
+class RankingIndex:
+    """Columnas del catálogo activo como arrays (en el orden del catálogo: destacado, orden, id)."""
+
+    def __init__(self, propiedades: Sequence[Dict[str, Any]]):
+        self.props = list(propiedades)
+        self.ids = np.asarray([int(p["id"]) for p in self.props], dtype=np.int64)
+        self.precio = np.asarray([_float(p.get("precio")) for p in self.props], dtype=np.float64)
+        self.habitaciones = np.asarray([_float(p.get("habitaciones")) for p in self.props], dtype=np.float64)
+        tipos = [(p.get("tipo") or "").lower() for p in self.props]
+        self._tipos = {t: i for i, t in enumerate(sorted(set(tipos)))}
+        self.tipo = np.asarray([self._tipos[t] for t in tipos], dtype=np.int16)
+        # Desempate: orden del catálogo (destacadas primero); no altera diferencias reales
+        self._desempate = np.arange(len(self.props)) * 1e-9
+        # Para el LIKE de ubicación/título cuando el gazetteer no resuelve el lugar: un solo
+        # texto "ubicación | título" por línea; una búsqueda en C en vez de una por fila
+        lineas = [f"{_texto(p.get('ubicacion'))}\x01{_texto(p.get('titulo'))}" for p in self.props]
+        self._texto = "\n".join(lineas)
+        self._inicios = np.cumsum([0] + [len(l) + 1 for l in lineas[:-1]])
+
+    def __len__(self) -> int:
+        return len(self.props)
+
+    def _en_lugar(self, ids: Optional[Iterable[int]], texto: Optional[str]) -> Optional[np.ndarray]:
+        """Máscara de las que están en el lugar pedido (None = no se pidió lugar)."""
+        if ids is not None:
+            return np.isin(self.ids, np.fromiter((int(i) for i in ids), dtype=np.int64))
+        texto = _texto(texto)
+        if not texto:
+            return None
+        mask = np.zeros(len(self.props), dtype=bool)
+        pos = [m.start() for m in re.finditer(re.escape(texto), self._texto)]
+        if pos:
+            mask[np.searchsorted(self._inicios, pos, side="right") - 1] = True
+        return mask
+
+    def rank(
+        self,
+        tipo: Optional[str] = None,
+        precio_min: Optional[float] = None,
+        precio_max: Optional[float] = None,
+        habitaciones: Optional[int] = None,
+        ids: Optional[Iterable[int]] = None,
+        texto: Optional[str] = None,
+        n: int = 6,
+        excluir: Iterable[int] = (),
+    ) -> List[Candidato]:
+        """
+        Las n propiedades más cercanas a lo pedido, de menor a mayor penalización (a igual
+        penalización, orden del catálogo). ids/texto: lugar resuelto por el gazetteer o término LIKE.
+        """
+        total = len(self.props)
+        if not total or n <= 0:
+            return []
+        # (criterio, penalización por propiedad) en el orden en que se explican
+        partes: List[Tuple[str, np.ndarray]] = []
+        if habitaciones is not None:
+            falta = np.maximum(habitaciones - self.habitaciones, 0.0) * PESO_HABITACIONES
+            partes.append(("habitaciones", np.where(np.isnan(self.habitaciones), PESO_FALTANTE, falta)))
+        if precio_max is not None or precio_min is not None:
+            fuera = np.zeros(total)
+            if precio_max is not None and precio_max > 0:
+                fuera = np.maximum(fuera, self.precio / precio_max - 1.0)
+            if precio_min is not None and precio_min > 0:
+                fuera = np.maximum(fuera, 1.0 - self.precio / precio_min)
+            partes.append(("precio", np.where(np.isnan(self.precio), PESO_FALTANTE, fuera * PESO_PRECIO)))
+        en_lugar = self._en_lugar(ids, texto)
+        if en_lugar is not None:
+            partes.append(("ubicacion", np.where(en_lugar, 0.0, PESO_UBICACION)))
+        if tipo:
+            partes.append(("tipo", np.where(self.tipo == self._tipos.get(tipo.lower(), -1), 0.0, PESO_TIPO)))
+
+        score = np.zeros(total)
+        for _, p in partes:
+            score += p
+        excluir = list(excluir)
+        if excluir:
+            score[np.isin(self.ids, excluir)] = np.inf
+        n = min(n, total)
+        clave = score + self._desempate
+        top = np.argpartition(clave, n - 1)[:n] if n < total else np.arange(total)
+        top = top[np.argsort(clave[top])]
+        out: List[Candidato] = []
+        for i in top:
+            if not np.isfinite(score[i]):
+                break
+            relajado = tuple(nombre for nombre, p in partes if p[i] > 0)
+            out.append(Candidato(self.props[i], float(score[i]), relajado))
+        return out
+
+
+def build(propiedades: Sequence[Dict[str, Any]]) -> RankingIndex:
+    return RankingIndex(propiedades)
@@ -0,0 +1,210 @@
+# ratelimit.py - Límite de mensajes por IP y por session_id (token bucket)
+"""
+Cada IP y cada session_id tiene una cubeta de RAFAGA fichas que se rellena a
+POR_MIN fichas por minuto; cada mensaje a /chat gasta una de cada cubeta, y solo si
+las dos tienen (un mensaje rechazado no gasta nada: una sesión limitada no vacía la
+cubeta de su IP, compartida con otras detrás del mismo NAT). Sin fichas se responde 429
+con Retry-After, antes de crear la conversación, consultar la BD o llamar a Gemini.
+En memoria (LRU de RATE_LIMIT_MAX_CLAVES cubetas; una consulta es un dict y unas
+sumas). Con RATE_LIMIT_SQLITE_PATH las cubetas se comparten entre workers por un
+SQLite local (WAL); si falla, se sigue en memoria. Con SQLite la consulta escribe en
+disco: desde código async usar revisar_async (no bloquea el event loop).
+Los límites se pueden cambiar desde chatbot_config (rate_limit_ip_por_min,
+rate_limit_ip_rafaga, rate_limit_sesion_por_min, rate_limit_sesion_rafaga; 0 = sin
+límite) y se releen cuando el detector de cambios ve la tabla modificada.
+"""
+
+import asyncio
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import changes
+from config import (
+    RATE_LIMIT_IP_POR_MIN,
+    RATE_LIMIT_IP_RAFAGA,
+    RATE_LIMIT_MAX_CLAVES,
+    RATE_LIMIT_SESION_POR_MIN,
+    RATE_LIMIT_SESION_RAFAGA,
+    RATE_LIMIT_SQLITE_PATH,
+)
+from db import config_get
+
+logger = logging.getLogger("chatbot-api")
+
+# Filas del SQLite sin uso más de esto se borran (una cubeta así ya está llena)
+_SQLITE_PURGA_SEC = 3600
+_SQLITE_PURGA_CADA = 1000
+
+
+class _Cubeta:
+    __slots__ = ("fichas", "t")
+
+    def __init__(self, fichas: float, t: float) -> None:
+        self.fichas = fichas
+        self.t = t
+
+
+def _rellenar(fichas: float, t: float, ahora: float, por_min: float, rafaga: float) -> float:
+    """Fichas de la cubeta en ahora (se rellena a por_min por minuto hasta rafaga)."""
+    return min(rafaga, fichas + max(ahora - t, 0.0) * por_min / 60.0)
+
+
+def _espera(fichas: float, por_min: float) -> float:
+    """Segundos hasta tener una ficha (0 = ya la hay)."""
+    return 0.0 if fichas >= 1.0 else (1.0 - fichas) / (por_min / 60.0)
+
+
+# (tipo, clave, fichas por minuto, ráfaga) de cada cubeta que decide un mensaje
+Cubetas = List[Tuple[str, str, float, float]]
+
+
+class Limitador:
+    def __init__(self, max_claves: int, sqlite_path: str = "") -> None:
+        self.max_claves = max_claves
+        # tipo -> (fichas por minuto, ráfaga); los de entorno quedan si chatbot_config no los trae
+        self._entorno: Dict[str, Tuple[float, float]] = {
+            "ip": (RATE_LIMIT_IP_POR_MIN, RATE_LIMIT_IP_RAFAGA),
+            "sesion": (RATE_LIMIT_SESION_POR_MIN, RATE_LIMIT_SESION_RAFAGA),
+        }
+        self.limites = dict(self._entorno)
+        self._lock = threading.Lock()
+        self._cubetas: "OrderedDict[str, _Cubeta]" = OrderedDict()
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        self._escrituras = 0
+        self._stats = {"permitidas": 0, "limitadas_ip": 0, "limitadas_sesion": 0, "errores_sqlite": 0}
+        if sqlite_path:
+            try:
+                self._db = sqlite3.connect(sqlite_path, check_same_thread=False, isolation_level=None, timeout=0.05)
+                self._db.execute("PRAGMA journal_mode=WAL")
+                self._db.execute("CREATE TABLE IF NOT EXISTS cubetas (clave TEXT PRIMARY KEY, fichas REAL, t REAL)")
+            except Exception as e:
+                logger.warning("SQLite de límites no disponible (%s); solo memoria: %s", sqlite_path, e)
+                self._db = None
+
+    def cargar(self, _tablas: Iterable[str] = ()) -> None:
+        """Lee los límites de chatbot_config (los que no estén quedan como en las variables de entorno)."""
+        nuevos = dict(self._entorno)
+        for tipo, (por_min, rafaga) in self._entorno.items():
+            try:
+                v_min = config_get(f"rate_limit_{tipo}_por_min")
+                v_raf = config_get(f"rate_limit_{tipo}_rafaga")
+                nuevos[tipo] = (
+                    float(v_min) if v_min not in (None, "") else por_min,
+                    float(v_raf) if v_raf not in (None, "") else rafaga,
+                )
+            except Exception as e:
+                nuevos[tipo] = self.limites[tipo]
+                logger.warning("No se pudieron leer los límites (%s) de chatbot_config: %s", tipo, e)
+        if nuevos != self.limites:
+            logger.info("Límites de mensajes: %s", nuevos)
+        self.limites = nuevos
+
+    def _memoria(self, cubetas: Cubetas) -> Tuple[float, Optional[str]]:
+        ahora = time.monotonic()
+        with self._lock:
+            actuales = []
+            for _, clave, por_min, rafaga in cubetas:
+                c = self._cubetas.get(clave)
+                if c is None:
+                    c = self._cubetas[clave] = _Cubeta(rafaga, ahora)
+                else:
+                    self._cubetas.move_to_end(clave)
+                c.fichas, c.t = _rellenar(c.fichas, c.t, ahora, por_min, rafaga), ahora
+                actuales.append(c.fichas)
+            espera, tipo = self._decidir(cubetas, actuales)
+            if not espera:
+                for _, clave, _, _ in cubetas:
+                    self._cubetas[clave].fichas -= 1.0
+            while len(self._cubetas) > self.max_claves:
+                self._cubetas.popitem(last=False)
+            return espera, tipo
+
+    def _sqlite(self, cubetas: Cubetas) -> Tuple[float, Optional[str]]:
+        # Hora de pared: la cubeta la comparten procesos distintos
+        ahora = time.time()
+        with self._db_lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                actuales = []
+                for _, clave, por_min, rafaga in cubetas:
+                    row = self._db.execute("SELECT fichas, t FROM cubetas WHERE clave = ?", (clave,)).fetchone()
+                    fichas, t = row if row else (rafaga, ahora)
+                    actuales.append(_rellenar(fichas, t, ahora, por_min, rafaga))
+                espera, tipo = self._decidir(cubetas, actuales)
+                gasto = 0.0 if espera else 1.0
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO cubetas (clave, fichas, t) VALUES (?, ?, ?)",
+                    [(clave, fichas - gasto, ahora) for (_, clave, _, _), fichas in zip(cubetas, actuales)],
+                )
+                self._escrituras += 1
+                if self._escrituras % _SQLITE_PURGA_CADA == 0:
+                    self._db.execute("DELETE FROM cubetas WHERE t < ?", (ahora - _SQLITE_PURGA_SEC,))
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        return espera, tipo
+
+    @staticmethod
+    def _decidir(cubetas: Cubetas, fichas: List[float]) -> Tuple[float, Optional[str]]:
+        """(mayor espera, tipo de la primera cubeta sin fichas); (0, None) = todas tienen."""
+        espera, tipo = 0.0, None
+        for (t, _, por_min, _), f in zip(cubetas, fichas):
+            e = _espera(f, por_min)
+            if e and tipo is None:
+                tipo = t
+            espera = max(espera, e)
+        return espera, tipo
+
+    def revisar(self, ip: Optional[str], session_id: Optional[str]) -> float:
+        """
+        Gasta una ficha de la IP y otra de la sesión si las dos tienen. 0 = permitido;
+        si no, segundos para reintentar (y no se gasta ninguna).
+        """
+        cubetas: Cubetas = []
+        for tipo, valor in (("ip", ip), ("sesion", session_id)):
+            por_min, rafaga = self.limites[tipo]
+            if valor and por_min > 0 and rafaga > 0:
+                cubetas.append((tipo, f"{tipo}:{valor}", por_min, rafaga))
+        espera, tipo = 0.0, None
+        if cubetas:
+            if self._db is not None:
+                try:
+                    espera, tipo = self._sqlite(cubetas)
+                except Exception as e:
+                    self._db_fallo(e)
+                    espera, tipo = self._memoria(cubetas)
+            else:
+                espera, tipo = self._memoria(cubetas)
+        if espera:
+            self._stats[f"limitadas_{tipo}"] += 1
+            return espera
+        self._stats["permitidas"] += 1
+        return 0.0
+
+    async def revisar_async(self, ip: Optional[str], session_id: Optional[str]) -> float:
+        """revisar() para endpoints async: con SQLite la escritura corre en un hilo aparte."""
+        if self._db is None:
+            return self.revisar(ip, session_id)
+        return await asyncio.to_thread(self.revisar, ip, session_id)
+
+    def _db_fallo(self, e: Exception) -> None:
+        self._stats["errores_sqlite"] += 1
+        logger.warning("Límite de mensajes en SQLite falló (se usa memoria): %s", e)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self._stats,
+            "claves": len(self._cubetas),
+            "sqlite": self._db is not None,
+            "limites": {t: {"por_min": m, "rafaga": r} for t, (m, r) in self.limites.items()},
+        }
+
+
+limitador = Limitador(RATE_LIMIT_MAX_CLAVES, RATE_LIMIT_SQLITE_PATH)
+changes.subscribe(("chatbot_config",), limitador.cargar)
@@ -5,11 +5,13 @@ Flujo: ENTENDER → CONSULTAR → RAZONAR → PERSUADIR.
 - Consulta la base de datos real (nunca inventa).
 - Si hay coincidencia exacta → la muestra.
 - Si NO hay coincidencia exacta → explica la situación, ofrece la mejor alternativa
+  (la más cercana a lo pedido según ranking.py, diciendo qué criterio se relajó)
   y resalta beneficios reales (orientado a conversión).
 """
 
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
 
+from catalog import alternativas, filtro_propiedades, filtro_proyectos
 from db import buscar_propiedades, buscar_proyectos
 
 
@@ -48,6 +50,16 @@ def _beneficios_cortos(prop: Dict[str, Any]) -> List[str]:
     return beneficios[:3]
 
 
+def _priorizar(
+    filas: List[Any], preferidas: Sequence[int], fila: Callable[[Any], Dict[str, Any]] = lambda r: r
+) -> List[Any]:
+    """Las de preferidas primero, en ese orden; el resto conserva el suyo."""
+    if not preferidas:
+        return filas
+    rango = {i: k for k, i in enumerate(preferidas)}
+    return sorted(filas, key=lambda r: rango.get(fila(r)["id"], len(rango)))
+
+
 def run_reasoning(
     tipo: Optional[str] = None,
     precio_min: Optional[float] = None,
@@ -55,9 +67,12 @@ def run_reasoning(
     habitaciones: Optional[int] = None,
     ubicacion: Optional[str] = None,
     pide_proyectos: bool = False,
+    preferidas: Sequence[int] = (),
 ) -> Tuple[str, List[Dict], List[Dict], str]:
     """
     Motor de razonamiento: consulta BD, razona y genera texto persuasivo.
+    preferidas: ids de propiedades (de proyectos si pide_proyectos) que van primero, ej. las
+    que mejor encajan con la descripción; el texto se escribe sobre ese orden.
 
     Returns:
         (match_type, properties, projects, reasoning_text)
@@ -65,13 +80,17 @@ def run_reasoning(
         - reasoning_text: párrafo en español para el bot (nunca "no hay" sin alternativa)
     """
     ubic = ubicacion.strip() if ubicacion else None
-    # Buscar por nombre de proyecto/propiedad o ubicación: mismo término en titulo y ubicacion
-    titulo_term = ubic  # así "busco Ibiza" encuentra por nombre (titulo) y por ubicación
+    # Buscar por nombre de proyecto/propiedad o ubicación: el gazetteer del catálogo lo resuelve
+    # a ids ("busco Ibiza" encuentra por nombre y por ubicación); si no lo conoce, LIKE en titulo/ubicacion
+    lugar_props = filtro_propiedades(ubic)
+    lugar_proys = filtro_proyectos(ubic)
 
     # --- 1. CONSULTAR: coincidencia exacta ---
-    proyectos_exact = buscar_proyectos(ubicacion=ubic, limite=6 if pide_proyectos else 3)
+    proyectos_exact = buscar_proyectos(limite=6 if pide_proyectos else 3, **lugar_proys)
     if precio_max is not None and proyectos_exact:
         proyectos_exact = [p for p in proyectos_exact if (p.get("precio_desde") or 0) <= precio_max]
+    if pide_proyectos:
+        proyectos_exact = _priorizar(proyectos_exact, preferidas)
 
     # Si el usuario pidió explícitamente "proyectos", priorizar proyectos sobre propiedades
     if pide_proyectos and proyectos_exact:
@@ -91,10 +110,10 @@ def run_reasoning(
         precio_min=precio_min,
         precio_max=precio_max,
         habitaciones=habitaciones,
-        ubicacion=ubic,
-        titulo=titulo_term,
         limite=6,
+        **lugar_props,
     )
+    props_exact = _priorizar(props_exact, preferidas)
 
     if props_exact:
         # Coincidencia exacta: mensaje cercano y humano ("Sí, claro. Tengo...")
@@ -107,7 +126,117 @@ def run_reasoning(
         reasoning = f"En proyectos encontré {count} opción(es) que encajan. ¿Quieres que te cuente más o agendamos una visita? 📅"
         return MATCH_EXACT, [], proyectos_exact, reasoning
 
-    # --- 2. RAZONAR: no hay exacto → buscar mejor alternativa ---
+    # --- 2. RAZONAR: no hay exacto → las más cercanas a lo pedido (todo el catálogo puntuado) ---
+    candidatos = alternativas(
+        tipo=tipo,
+        precio_min=precio_min,
+        precio_max=precio_max,
+        habitaciones=habitaciones,
+        ubicacion=ubic,
+        n=6,
+    )
+    if candidatos is None:
+        # Sin ranking en memoria: filtros relajados en BD
+        return _alternativas_bd(tipo, precio_min, precio_max, habitaciones, lugar_props, lugar_proys, preferidas)
+
+    cercanos = _priorizar([c for c in candidatos if c.cercano], preferidas, lambda c: c.prop)
+    if cercanos:
+        reasoning = _texto_alternativa(cercanos[0], tipo, precio_max, habitaciones, ubic)
+        return MATCH_ALTERNATIVES, [c.prop for c in cercanos], [], reasoning
+
+    # --- 3. Sin alternativas cercanas: búsqueda amplia (mismo tipo y lugar, sin precio ni habitaciones) ---
+    amplia = alternativas(tipo=tipo, ubicacion=ubic, n=4) or []
+    props_general = _priorizar([c.prop for c in amplia if not c.relajado], preferidas)
+    return _sin_cercanas(props_general, buscar_proyectos(limite=3, **lugar_proys), precio_max)
+
+
+def _unir(partes: List[str]) -> str:
+    return partes[0] if len(partes) == 1 else ", ".join(partes[:-1]) + " y " + partes[-1]
+
+
+def _texto_alternativa(
+    c: Any,
+    tipo: Optional[str],
+    precio_max: Optional[float],
+    habitaciones: Optional[int],
+    ubicacion: Optional[str],
+) -> str:
+    """Texto persuasivo para la alternativa más cercana: qué cambia respecto a lo pedido (datos reales)."""
+    prop = c.prop
+    beneficio_texto = ", ".join(_beneficios_cortos(prop))
+    titulo = (prop.get("titulo") or "").strip() or "esta propiedad"
+    hab_alt = prop.get("habitaciones")
+    precio = float(prop["precio"]) if prop.get("precio") else None
+    prec_alt = _format_precio(precio)
+
+    diferencias = []
+    for criterio in c.relajado:
+        if criterio == "habitaciones":
+            diferencias.append(
+                f"tiene {hab_alt} habitación(es) en lugar de {habitaciones}"
+                if hab_alt is not None else "no tiene publicado el número de habitaciones"
+            )
+        elif criterio == "precio":
+            if precio is None:
+                diferencias.append("no tiene precio publicado (un asesor te lo confirma)")
+            elif precio_max and precio > precio_max:
+                diferencias.append(f"cuesta {prec_alt}, un {round((precio / precio_max - 1) * 100)}% más que tu presupuesto")
+            else:
+                diferencias.append(f"cuesta {prec_alt}, algo menos de lo que tenías pensado")
+        elif criterio == "ubicacion":
+            diferencias.append(f"está en {prop.get('ubicacion') or 'otra zona'} y no en {ubicacion}")
+        elif criterio == "tipo":
+            diferencias.append(f"es para {prop.get('tipo') or 'otro tipo de negocio'} y no para {tipo}")
+
+    if not diferencias:
+        return (
+            f"Sí, claro. Tengo **{titulo}**, que es {beneficio_texto}. "
+            f"¿Te gustaría ver más detalles o agendar una visita para conocerla? 🏡"
+        )
+    precio_txt = f" Precio {prec_alt}." if prec_alt and "precio" not in c.relajado else ""
+    return (
+        f"No encontré exactamente lo que buscas, pero tengo una opción muy cercana: **{titulo}**, "
+        f"que {_unir(diferencias)}. Es {beneficio_texto}.{precio_txt} "
+        f"¿Te gustaría que te la muestre o agendamos una visita para verla? 🏡✨"
+    )
+
+
+def _sin_cercanas(
+    props_general: List[Dict], proyectos_general: List[Dict], precio_max: Optional[float]
+) -> Tuple[str, List[Dict], List[Dict], str]:
+    """Nada cercano: otras opciones si las hay; si no, mensaje honesto orientado a acción."""
+    if props_general or proyectos_general:
+        reasoning = (
+            "Por ahora no tengo justo lo que buscas con esos criterios, "
+            "pero sí otras opciones que podrían interesarte. "
+            "¿Quieres que te las muestre o prefieres que agendemos una visita y un asesor te ayude a encontrar lo ideal? 📅"
+        )
+        return MATCH_ALTERNATIVES, props_general, proyectos_general, reasoning
+
+    # --- 4. Nada en BD: mensaje honesto pero orientado a acción ---
+    if precio_max:
+        reasoning = (
+            "En este momento no tengo propiedades dentro de ese presupuesto. "
+            "¿Te gustaría que te muestre opciones un poco más altas o que agendemos una visita para que un asesor te comente alternativas? 🙂"
+        )
+    else:
+        reasoning = (
+            "Por ahora no tengo propiedades con esas características. "
+            "¿Quieres que ajustemos criterios (habitaciones, zona, tipo) o agendamos una visita y te ayudamos a encontrar algo? 📅"
+        )
+    return MATCH_NONE, [], [], reasoning
+
+
+def _alternativas_bd(
+    tipo: Optional[str],
+    precio_min: Optional[float],
+    precio_max: Optional[float],
+    habitaciones: Optional[int],
+    lugar_props: Dict[str, Any],
+    lugar_proys: Dict[str, Any],
+    preferidas: Sequence[int] = (),
+) -> Tuple[str, List[Dict], List[Dict], str]:
+    """Sin ranking en memoria: una relajación fija (1 hab menos, +20% presupuesto) y si no, búsqueda amplia."""
     hab_relajado = (habitaciones - 1) if habitaciones and habitaciones > 1 else None
     precio_max_relajado = (precio_max * 1.2) if precio_max else None
 
@@ -116,10 +245,10 @@ def run_reasoning(
         precio_min=precio_min,
         precio_max=precio_max_relajado,
         habitaciones=hab_relajado,
-        ubicacion=ubic,
-        titulo=titulo_term,
         limite=6,
+        **lugar_props,
     )
+    props_alt = _priorizar(props_alt, preferidas)
 
     if props_alt:
         # Hay alternativas: explicar situación y resaltar beneficios reales
@@ -156,27 +285,7 @@ def run_reasoning(
             )
         return MATCH_ALTERNATIVES, props_alt, [], reasoning
 
-    # --- 3. Sin alternativas cercanas: búsqueda muy amplia ---
-    props_general = buscar_propiedades(tipo=tipo, ubicacion=ubic, limite=4)
-    proyectos_general = buscar_proyectos(ubicacion=ubic, limite=3)
-
-    if props_general or proyectos_general:
-        reasoning = (
-            "Por ahora no tengo justo lo que buscas con esos criterios, "
-            "pero sí otras opciones que podrían interesarte. "
-            "¿Quieres que te las muestre o prefieres que agendemos una visita y un asesor te ayude a encontrar lo ideal? 📅"
-        )
-        return MATCH_ALTERNATIVES, props_general, proyectos_general, reasoning
-
-    # --- 4. Nada en BD: mensaje honesto pero orientado a acción ---
-    if precio_max:
-        reasoning = (
-            "En este momento no tengo propiedades dentro de ese presupuesto. "
-            "¿Te gustaría que te muestre opciones un poco más altas o que agendemos una visita para que un asesor te comente alternativas? 🙂"
-        )
-    else:
-        reasoning = (
-            "Por ahora no tengo propiedades con esas características. "
-            "¿Quieres que ajustemos criterios (habitaciones, zona, tipo) o agendamos una visita y te ayudamos a encontrar algo? 📅"
-        )
-    return MATCH_NONE, [], [], reasoning
+    # Sin alternativas cercanas: búsqueda muy amplia
+    props_general = _priorizar(buscar_propiedades(tipo=tipo, limite=4, **lugar_props), preferidas)
+    proyectos_general = buscar_proyectos(limite=3, **lugar_proys)
+    return _sin_cercanas(props_general, proyectos_general, precio_max)
@@ -0,0 +1,171 @@
+# semantic.py - Búsqueda por descripción (TF-IDF con hashing, local y sin red)
+"""
+Índice de las descripciones (más título y ubicación) de propiedades y proyectos activos
+para mensajes como "casa iluminada con parqueadero cerca al centro". Cada texto se
+reduce a raíces (iluminada/iluminado/iluminadas -> iluminad), unigramas y bigramas van
+a DIM columnas por hashing y se pesan con TF-IDF; la consulta es un coseno
+matriz-vector. La matriz se guarda por columnas (solo las celdas no nulas): una
+consulta toca únicamente las columnas de sus términos.
+Al refrescar el catálogo solo se vuelven a tokenizar los textos que cambiaron; el IDF
+y las normas se recalculan con operaciones vectoriales sobre lo ya tokenizado.
+"""
+
+import math
+import threading
+import zlib
+from collections import Counter
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from gazetteer import GENERICAS, STOPWORDS
+from nlu import RE_TOKEN, fold
+
+DIM = 1 << 16
+
+# Palabras de la conversación que no describen la propiedad
+_VACIAS = STOPWORDS | frozenset((
+    "busco", "buscando", "quiero", "necesito", "tienes", "tienen", "hay", "algo", "alguna", "alguno",
+    "me", "mi", "que", "muy", "mas", "como", "tenga", "tengan", "donde", "este", "esta", "estos",
+    "o", "lo", "le", "es", "son", "se", "ya", "tambien", "porfa", "favor", "hola",
+))
+
+# Solo con estas (tipo de inmueble, negocio) el mensaje no describe nada: "busco casa en venta"
+_GENERICAS = frozenset(GENERICAS | {"busqueda", "inmueble", "inmuebles", "opcion", "opciones"})
+
+# Coseno mínimo para considerar que una descripción responde a lo pedido
+MINIMO = 0.12
+
+Doc = Tuple[str, np.ndarray, np.ndarray]  # (texto, columnas, tf)
+
+
+def _raiz(t: str) -> str:
+    """Raíz ligera para español: sin plural ni vocal final (casas/casa -> cas)."""
+    if len(t) > 4 and t.endswith("es"):
+        t = t[:-2]
+    elif len(t) > 3 and t.endswith("s"):
+        t = t[:-1]
+    if len(t) > 3 and t[-1] in "aeo":
+        t = t[:-1]
+    return t
+
+
+def terminos(texto: Optional[str]) -> List[str]:
+    """Raíces de las palabras con contenido + bigramas entre ellas."""
+    raices = [_raiz(t) for t in RE_TOKEN.findall(fold((texto or "").lower())) if t not in _VACIAS and not t.isdigit()]
+    return raices + [a + " " + b for a, b in zip(raices, raices[1:])]
+
+
+def describe(texto: Optional[str]) -> bool:
+    """El texto trae algo que buscar en descripciones (no solo tipo de inmueble o negocio)."""
+    return any(
+        t not in _VACIAS and t not in _GENERICAS and not t.isdigit()
+        for t in RE_TOKEN.findall(fold((texto or "").lower()))
+    )
+
+
+def _vectorizar(texto: str) -> Tuple[np.ndarray, np.ndarray]:
+    """Columnas (hash crc32, estable entre procesos) y tf sublineal de un texto."""
+    cuenta = Counter(zlib.crc32(t.encode()) & (DIM - 1) for t in terminos(texto))
+    cols = np.fromiter(cuenta.keys(), dtype=np.int64, count=len(cuenta))
+    tf = np.fromiter((1.0 + math.log(c) for c in cuenta.values()), dtype=np.float32, count=len(cuenta))
+    return cols, tf
+
+
+def _texto(tipo: str, row: Dict[str, Any]) -> str:
+    nombre = row.get("titulo") if tipo == "propiedad" else row.get("nombre")
+    return " ".join(str(v) for v in (nombre, row.get("ubicacion"), row.get("descripcion")) if v)
+
+
+class _Matriz:
+    """Matriz TF-IDF (documentos x DIM) por columnas: ptr[c]:ptr[c+1] son las filas de la columna c."""
+
+    __slots__ = ("claves", "rows", "tipos", "ptr", "filas", "pesos", "idf")
+
+    def __init__(self, claves, rows, tipos, ptr, filas, pesos, idf):
+        self.claves = claves
+        self.rows = rows
+        self.tipos = tipos
+        self.ptr = ptr
+        self.filas = filas
+        self.pesos = pesos
+        self.idf = idf
+
+
+class SemanticIndex:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        # (tipo, id) -> (fila, doc); tipo = "propiedad" | "proyecto"
+        self._docs: Dict[Tuple[str, int], Tuple[Dict[str, Any], Doc]] = {}
+        self._m: Optional[_Matriz] = None
+        self._stats = {"tokenizados": 0, "reutilizados": 0, "consultas": 0}
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def update(self, tipo: str, rows: Sequence[Dict[str, Any]]) -> None:
+        """Reemplaza los documentos de un tipo por estas filas; solo tokeniza los textos nuevos o cambiados."""
+        with self._lock:
+            docs = {k: v for k, v in self._docs.items() if k[0] != tipo}
+            for row in rows:
+                key = (tipo, int(row["id"]))
+                texto = _texto(tipo, row)
+                anterior = self._docs.get(key)
+                if anterior is not None and anterior[1][0] == texto:
+                    doc = anterior[1]
+                    self._stats["reutilizados"] += 1
+                else:
+                    doc = (texto, *_vectorizar(texto))
+                    self._stats["tokenizados"] += 1
+                docs[key] = (row, doc)
+            self._docs = docs
+            self._m = self._armar(docs)
+
+    @staticmethod
+    def _armar(docs: Dict[Tuple[str, int], Tuple[Dict[str, Any], Doc]]) -> Optional[_Matriz]:
+        if not docs:
+            return None
+        claves = list(docs)
+        n = len(claves)
+        cols = [docs[k][1][1] for k in claves]
+        largos = np.fromiter((len(c) for c in cols), dtype=np.int64, count=n)
+        col = np.concatenate(cols)
+        tf = np.concatenate([docs[k][1][2] for k in claves])
+        fila = np.repeat(np.arange(n, dtype=np.int32), largos)
+        # Cada columna aparece una vez por documento: bincount = frecuencia de documento
+        idf = (np.log((1.0 + n) / (1.0 + np.bincount(col, minlength=DIM))) + 1.0).astype(np.float32)
+        w = tf * idf[col]
+        norma = np.sqrt(np.bincount(fila, weights=w * w, minlength=n)).astype(np.float32)
+        w /= np.where(norma > 0, norma, 1.0)[fila]
+        orden = np.argsort(col, kind="stable")
+        ptr = np.searchsorted(col[orden], np.arange(DIM + 1))
+        tipos = np.asarray([k[0] == "proyecto" for k in claves], dtype=bool)
+        return _Matriz(claves, [docs[k][0] for k in claves], tipos, ptr, fila[orden], w[orden], idf)
+
+    def search(self, texto: str, tipo: str = "propiedad", k: int = 6, minimo: float = MINIMO) -> List[Tuple[Dict[str, Any], float]]:
+        """(fila, coseno) de los k documentos del tipo más parecidos al texto, con coseno >= minimo."""
+        m = self._m
+        self._stats["consultas"] += 1
+        if m is None or k <= 0 or not describe(texto):
+            return []
+        q_cols, q_tf = _vectorizar(texto)
+        if not len(q_cols):
+            return []
+        q = q_tf * m.idf[q_cols]
+        q /= float(np.linalg.norm(q)) or 1.0
+        scores = np.zeros(len(m.claves), dtype=np.float32)
+        for c, qw in zip(q_cols, q):
+            s, e = m.ptr[c], m.ptr[c + 1]
+            if s < e:
+                scores[m.filas[s:e]] += qw * m.pesos[s:e]
+        scores[m.tipos != (tipo == "proyecto")] = 0.0
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k] if k < len(scores) else np.arange(len(scores))
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(m.rows[i], float(scores[i])) for i in top if scores[i] >= minimo]
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self._stats, "documentos": len(self._docs)}
+
+
+indice = SemanticIndex()
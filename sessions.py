@@ -0,0 +1,181 @@
+# sessions.py - Estado de conversación en el servidor (por session_id)
+"""
+LRU en memoria con TTL + persistencia opcional en SQLite (SESSION_SQLITE_PATH).
+Cada sesión guarda el último contexto y un buffer circular de los turnos recientes,
+así el cliente solo envía message + session_id y la IA recibe el intercambio anterior.
+También recuerda qué cards ya recibió el cliente (modo compacto: se reenvían solo ids).
+"""
+
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, Iterable, Optional, Set, Tuple
+
+from config import SESSION_MAX, SESSION_SQLITE_PATH, SESSION_TTL_SEC, SESSION_TURNS
+
+logger = logging.getLogger("chatbot-api")
+
+# Claves que se rellenan desde el historial en cada turno (no forman parte del estado)
+HISTORY_KEYS = ("last_user_message", "last_bot_message")
+
+# Longitud máxima guardada por mensaje (lo mismo que usa el prompt de la IA)
+MAX_USER_CHARS = 300
+MAX_BOT_CHARS = 400
+
+# Cards ya enviadas que se recuerdan por sesión ("propiedad:12")
+MAX_CARDS_VISTAS = 300
+
+
+class Session:
+    __slots__ = ("contexto", "turnos", "expira", "cards_vistas")
+
+    def __init__(
+        self,
+        contexto: Dict[str, Any],
+        turnos: Deque[Tuple[str, str]],
+        expira: float,
+        cards_vistas: Optional[Set[str]] = None,
+    ):
+        self.contexto = contexto
+        self.turnos = turnos
+        self.expira = expira
+        self.cards_vistas = cards_vistas if cards_vistas is not None else set()
+
+
+class SessionStore:
+    def __init__(self, max_items: int, ttl: int, turns: int, sqlite_path: str = ""):
+        self.max_items = max_items
+        self.ttl = ttl
+        self.turns = turns
+        self._items: "OrderedDict[str, Session]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self._writes = 0
+        self.hits = self.misses = 0
+        if sqlite_path:
+            try:
+                self._db = sqlite3.connect(sqlite_path, check_same_thread=False, isolation_level=None)
+                self._db.execute("PRAGMA journal_mode=WAL")
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS sesiones (id TEXT PRIMARY KEY, contexto TEXT, turnos TEXT, expira REAL, cards TEXT)"
+                )
+                cols = {r[1] for r in self._db.execute("PRAGMA table_info(sesiones)")}
+                if "cards" not in cols:
+                    self._db.execute("ALTER TABLE sesiones ADD COLUMN cards TEXT")
+            except Exception as e:
+                logger.warning("SQLite de sesiones no disponible (%s); solo memoria: %s", sqlite_path, e)
+                self._db = None
+
+    def _load_sqlite(self, sid: str, now: float) -> Optional[Session]:
+        row = self._db.execute("SELECT contexto, turnos, expira, cards FROM sesiones WHERE id = ?", (sid,)).fetchone()
+        if not row or row[2] < now:
+            return None
+        turnos = deque((tuple(t) for t in json.loads(row[1] or "[]")), maxlen=self.turns)
+        return Session(json.loads(row[0] or "{}"), turnos, row[2], set(json.loads(row[3] or "[]")))
+
+    def get(self, sid: Optional[str]) -> Optional[Session]:
+        if not sid:
+            return None
+        now = time.time()
+        with self._lock:
+            s = self._items.get(sid)
+            if s is not None and s.expira < now:
+                del self._items[sid]
+                s = None
+            if s is None and self._db is not None:
+                try:
+                    s = self._load_sqlite(sid, now)
+                except Exception as e:
+                    logger.warning("Error leyendo sesión %s de SQLite: %s", sid, e)
+                if s is not None:
+                    self._put(sid, s)
+            if s is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(sid)
+            self.hits += 1
+            return s
+
+    def _put(self, sid: str, s: Session) -> None:
+        self._items[sid] = s
+        self._items.move_to_end(sid)
+        while len(self._items) > self.max_items:
+            self._items.popitem(last=False)
+
+    def save_turn(
+        self,
+        sid: str,
+        contexto: Dict[str, Any],
+        user_msg: str,
+        bot_msg: str,
+        cards_enviadas: Iterable[str] = (),
+    ) -> None:
+        """Guarda el contexto resultante del turno, lo añade al buffer de turnos y anota las cards enviadas."""
+        now = time.time()
+        estado = {k: v for k, v in (contexto or {}).items() if k not in HISTORY_KEYS}
+        with self._lock:
+            s = self._items.get(sid)
+            if s is None or s.expira < now:
+                s = Session({}, deque(maxlen=self.turns), now)
+            s.contexto = estado
+            s.turnos.append(((user_msg or "")[:MAX_USER_CHARS], (bot_msg or "")[:MAX_BOT_CHARS]))
+            s.cards_vistas.update(cards_enviadas)
+            if len(s.cards_vistas) > MAX_CARDS_VISTAS:
+                # Se olvidan todas: como mucho se reenvían completas una vez más
+                s.cards_vistas = set(cards_enviadas)
+            s.expira = now + self.ttl
+            self._put(sid, s)
+            if self._db is not None:
+                try:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO sesiones (id, contexto, turnos, expira, cards) VALUES (?, ?, ?, ?, ?)",
+                        (
+                            sid,
+                            json.dumps(estado, default=str),
+                            json.dumps(list(s.turnos)),
+                            s.expira,
+                            json.dumps(sorted(s.cards_vistas)),
+                        ),
+                    )
+                    self._writes += 1
+                    if self._writes % 500 == 0:
+                        self._db.execute("DELETE FROM sesiones WHERE expira < ?", (now,))
+                except Exception as e:
+                    logger.warning("Error guardando sesión %s en SQLite: %s", sid, e)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "sesiones": len(self._items),
+            "hits": self.hits,
+            "misses": self.misses,
+            "sqlite": self._db is not None,
+        }
+
+
+store = SessionStore(SESSION_MAX, SESSION_TTL_SEC, SESSION_TURNS, SESSION_SQLITE_PATH)
+
+
+def contexto_para_turno(sid: Optional[str], contexto_cliente: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Contexto con el que se despacha el turno: el que envía el cliente (compatibilidad) o,
+    si no envía ninguno, el guardado en servidor. Rellena last_user/last_bot desde el buffer.
+    """
+    s = store.get(sid)
+    if contexto_cliente is not None:
+        contexto = dict(contexto_cliente)
+    else:
+        contexto = dict(s.contexto) if s is not None else {}
+    if s is not None and s.turnos:
+        last_user, last_bot = s.turnos[-1]
+        contexto.setdefault("last_user_message", last_user)
+        contexto.setdefault("last_bot_message", last_bot)
+    return contexto
+
+
+def cards_vistas(sid: Optional[str]) -> Set[str]:
+    """Cards ("tipo:id") que la sesión ya recibió completas."""
+    s = store.get(sid)
+    return set(s.cards_vistas) if s is not None else set()
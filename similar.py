@@ -0,0 +1,145 @@
+# similar.py - Índice de propiedades parecidas (vecinos más cercanos precalculados)
+"""
+Por propiedad activa: precio (log), habitaciones, baños y área normalizados, tipo,
+ubicación y n-gramas de la descripción (hashing). La similitud es una suma ponderada
+(cercanía numérica, mismo tipo, coseno de ubicación y de descripción) calculada en
+NumPy por bloques; para cada propiedad se guardan sus TOP_K vecinas. Se reconstruye
+junto con el catálogo; "muéstrame otra parecida" es una búsqueda en memoria.
+"""
+
+import math
+import zlib
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from config import SIMILAR_TOP_K
+from nlu import RE_TOKEN, fold
+
+# Dimensión del bloque de texto (ubicación + descripción) con hashing
+TEXT_DIM = 1 << 11
+
+# Peso de cada componente en la similitud (cada uno vale entre 0 y 1)
+PESOS = {"numeros": 1.0, "tipo": 0.8, "ubicacion": 0.9, "descripcion": 0.5}
+
+# Filas por bloque al multiplicar (n x n completo no cabe con catálogos grandes)
+BLOQUE = 1024
+
+
+def _float(v: Any) -> Optional[float]:
+    try:
+        return float(v) if v is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _tokens(texto: Optional[str]) -> List[str]:
+    return [t for t in RE_TOKEN.findall(fold((texto or "").lower())) if len(t) > 2]
+
+
+def _hash_bloque(filas: Sequence[Sequence[str]], dim: int) -> np.ndarray:
+    """Bolsa de términos con hashing (crc32, estable entre procesos), filas con norma 1."""
+    m = np.zeros((len(filas), dim), dtype=np.float32)
+    mask = dim - 1
+    for i, terms in enumerate(filas):
+        for t in terms:
+            m[i, zlib.crc32(t.encode()) & mask] += 1.0
+    return _normalizar_filas(m)
+
+
+def _normalizar_filas(m: np.ndarray) -> np.ndarray:
+    norm = np.linalg.norm(m, axis=1, keepdims=True)
+    return m / np.where(norm > 0, norm, 1.0)
+
+
+def _numeros(props: Sequence[Dict[str, Any]]) -> np.ndarray:
+    """Precio (log), habitaciones, baños, área (log): z-score; un dato faltante queda en la media."""
+    cols = []
+    for p in props:
+        precio = _float(p.get("precio"))
+        area = _float(p.get("area_construida")) or _float(p.get("area_total"))
+        cols.append([
+            math.log1p(precio) if precio else np.nan,
+            _float(p.get("habitaciones")),
+            _float(p.get("banos")),
+            math.log1p(area) if area else np.nan,
+        ])
+    m = np.asarray(cols, dtype=np.float64).reshape(len(props), 4)
+    presentes = ~np.isnan(m)
+    cuenta = presentes.sum(axis=0)
+    media = np.where(presentes, m, 0.0).sum(axis=0) / np.maximum(cuenta, 1)
+    m = np.where(presentes, m, media)
+    std = m.std(axis=0)
+    return ((m - m.mean(axis=0)) / np.where(std > 0, std, 1.0)).astype(np.float32)
+
+
+class SimilarityIndex:
+    """ids + matriz (n x k) de posiciones de las vecinas más parecidas, de mayor a menor."""
+
+    def __init__(self, ids: np.ndarray, vecinos: np.ndarray, scores: np.ndarray):
+        self.ids = ids
+        self.vecinos = vecinos
+        self.scores = scores
+        self._pos = {int(pid): i for i, pid in enumerate(ids)}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def similares(self, prop_id: int, k: int = 4, excluir: Sequence[int] = ()) -> List[int]:
+        """Ids de las k propiedades más parecidas a prop_id (sin las excluidas). [] si no está."""
+        i = self._pos.get(int(prop_id))
+        if i is None:
+            return []
+        excl = set(excluir)
+        out: List[int] = []
+        for j in self.vecinos[i]:
+            pid = int(self.ids[j])
+            if pid not in excl:
+                out.append(pid)
+                if len(out) >= k:
+                    break
+        return out
+
+
+def build(propiedades: Sequence[Dict[str, Any]], top_k: int = SIMILAR_TOP_K) -> SimilarityIndex:
+    n = len(propiedades)
+    ids = np.asarray([int(p["id"]) for p in propiedades], dtype=np.int64)
+    if n < 2:
+        return SimilarityIndex(ids, np.zeros((n, 0), dtype=np.int32), np.zeros((n, 0), dtype=np.float32))
+
+    tipos = sorted({(p.get("tipo") or "").lower() for p in propiedades})
+    tipo_m = np.zeros((n, len(tipos)), dtype=np.float32)
+    for i, p in enumerate(propiedades):
+        tipo_m[i, tipos.index((p.get("tipo") or "").lower())] = 1.0
+
+    ubic = _hash_bloque([_tokens(p.get("ubicacion")) for p in propiedades], TEXT_DIM)
+    desc_terms = []
+    for p in propiedades:
+        toks = _tokens(p.get("descripcion"))
+        desc_terms.append(toks + [a + " " + b for a, b in zip(toks, toks[1:])])
+    desc = _hash_bloque(desc_terms, TEXT_DIM)
+
+    Z = _numeros(propiedades)
+    sq = (Z * Z).sum(axis=1)
+    total = sum(PESOS.values())
+
+    k = min(top_k, n - 1)
+    vecinos = np.empty((n, k), dtype=np.int32)
+    scores = np.empty((n, k), dtype=np.float32)
+    for s in range(0, n, BLOQUE):
+        e = min(s + BLOQUE, n)
+        # Distancia euclídea al cuadrado entre z-scores -> cercanía en (0, 1]
+        d2 = np.maximum(sq[s:e, None] + sq[None, :] - 2.0 * (Z[s:e] @ Z.T), 0.0)
+        sim = PESOS["numeros"] * np.exp(-d2 / (2.0 * Z.shape[1]))
+        sim += PESOS["tipo"] * (tipo_m[s:e] @ tipo_m.T)
+        sim += PESOS["ubicacion"] * (ubic[s:e] @ ubic.T)
+        sim += PESOS["descripcion"] * (desc[s:e] @ desc.T)
+        sim /= total
+        filas = np.arange(e - s)
+        sim[filas, filas + s] = -np.inf  # una propiedad no es vecina de sí misma
+        top = np.argpartition(-sim, k - 1, axis=1)[:, :k]
+        orden = np.argsort(-sim[filas[:, None], top], axis=1, kind="stable")
+        top = top[filas[:, None], orden]
+        vecinos[s:e] = top
+        scores[s:e] = sim[filas[:, None], top]
+    return SimilarityIndex(ids, vecinos, scores)
@@ -0,0 +1,125 @@
+# singleflight.py - Coalescencia de llamadas idénticas concurrentes
+"""
+Si llegan varias llamadas con la misma clave mientras la primera está en curso,
+solo la primera ejecuta; las demás esperan y reciben el mismo resultado (o la
+misma excepción). Opcionalmente el resultado se recuerda `ttl` segundos.
+Los resultados se comparten entre llamadores: no deben modificarse.
+"""
+
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+
+class _Call:
+    __slots__ = ("event", "value", "error", "waiters")
+
+    def __init__(self) -> None:
+        self.event = threading.Event()
+        self.value: Any = None
+        self.error: Optional[BaseException] = None
+        # Futures de asyncio de los que esperan con do_async
+        self.waiters: List["asyncio.Future[None]"] = []
+
+    def result(self) -> Any:
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+
+class SingleFlight:
+    def __init__(self, ttl: float = 0.0, max_items: int = 10000) -> None:
+        self.ttl = ttl
+        self.max_items = max_items
+        self._lock = threading.Lock()
+        self._inflight: Dict[Hashable, _Call] = {}
+        self._memo: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._stats = {"calls": 0, "executed": 0, "coalesced": 0, "memo_hits": 0, "errors": 0}
+
+    def _entrar(self, key: Hashable) -> Tuple[Optional[Tuple[Any]], _Call, bool]:
+        """(resultado memorizado o None, llamada en curso, si esta llamada la ejecuta). Con self._lock tomado."""
+        self._stats["calls"] += 1
+        if self.ttl > 0:
+            hit = self._memo.get(key)
+            if hit is not None:
+                if hit[0] > time.monotonic():
+                    self._stats["memo_hits"] += 1
+                    return (hit[1],), None, False
+                del self._memo[key]
+        call = self._inflight.get(key)
+        leader = call is None
+        if leader:
+            call = self._inflight[key] = _Call()
+            self._stats["executed"] += 1
+        else:
+            self._stats["coalesced"] += 1
+        return None, call, leader
+
+    def _terminar(self, key: Hashable, call: _Call) -> None:
+        with self._lock:
+            if call.error is not None:
+                self._stats["errors"] += 1
+            self._inflight.pop(key, None)
+            if call.error is None and self.ttl > 0:
+                self._memo[key] = (time.monotonic() + self.ttl, call.value)
+                while len(self._memo) > self.max_items:
+                    self._memo.popitem(last=False)
+        call.event.set()
+        with self._lock:
+            waiters, call.waiters = call.waiters, []
+        for w in waiters:
+            w.get_loop().call_soon_threadsafe(lambda w=w: w.done() or w.set_result(None))
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            memo, call, leader = self._entrar(key)
+        if memo is not None:
+            return memo[0]
+        if not leader:
+            call.event.wait()
+            return call.result()
+
+        try:
+            call.value = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            self._terminar(key, call)
+        return call.value
+
+    async def do_async(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """do() para corrutinas: los duplicados esperan en el event loop, sin ocupar un hilo."""
+        with self._lock:
+            memo, call, leader = self._entrar(key)
+            if not leader and memo is None and not call.event.is_set():
+                espera: "Optional[asyncio.Future[None]]" = asyncio.get_running_loop().create_future()
+                call.waiters.append(espera)
+            else:
+                espera = None
+        if memo is not None:
+            return memo[0]
+        if not leader:
+            if espera is not None:
+                await espera
+            return call.result()
+
+        try:
+            call.value = await fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            self._terminar(key, call)
+        return call.value
+
+    def clear(self) -> None:
+        """Olvida los resultados memorizados (las llamadas en curso siguen)."""
+        with self._lock:
+            self._memo.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self._stats, "inflight": len(self._inflight), "memo": len(self._memo)}
@@ -0,0 +1,88 @@
+# db._consulta_compartida: búsquedas idénticas simultáneas hacen una sola consulta
+import threading
+from contextlib import contextmanager
+
+import pytest
+
+import db
+from cache import ResultCache
+from singleflight import SingleFlight
+
+
+@pytest.fixture
+def bd(monkeypatch):
+    """cursor_dict falso: cuenta las consultas y bloquea hasta que el test suelta."""
+    estado = {"ejecutadas": 0, "entro": threading.Event(), "soltar": threading.Event()}
+    estado["soltar"].set()
+
+    class Cursor:
+        def execute(self, q, params):
+            estado["ejecutadas"] += 1
+            estado["entro"].set()
+            estado["soltar"].wait(5)
+
+        def fetchall(self):
+            return [{"id": 1}, {"id": 2}]
+
+    @contextmanager
+    def cursor_dict():
+        yield Cursor()
+
+    monkeypatch.setattr(db, "cursor_dict", cursor_dict)
+    monkeypatch.setattr(db, "_search_flight", SingleFlight())
+    monkeypatch.setattr(db, "result_cache", ResultCache(False))
+    return estado
+
+
+def test_simultaneas_una_consulta(bd):
+    bd["soltar"].clear()
+    resultados = []
+
+    def buscar():
+        resultados.append(db._consulta_compartida("propiedades", "SELECT 1", ["casa"]))
+
+    lider = threading.Thread(target=buscar)
+    lider.start()
+    assert bd["entro"].wait(5)
+    otros = [threading.Thread(target=buscar) for _ in range(3)]
+    for t in otros:
+        t.start()
+    while db._search_flight.stats()["coalesced"] < 3:
+        threading.Event().wait(0.01)
+    bd["soltar"].set()
+    for t in [lider, *otros]:
+        t.join(5)
+
+    assert bd["ejecutadas"] == 1
+    assert all(r == [{"id": 1}, {"id": 2}] for r in resultados)
+    # Cada llamador recibe su propia lista
+    assert len({id(r) for r in resultados}) == 4
+
+
+def test_parametros_distintos_no_se_juntan(bd):
+    db._consulta_compartida("propiedades", "SELECT 1", ["casa"])
+    db._consulta_compartida("propiedades", "SELECT 1", ["lote"])
+    assert bd["ejecutadas"] == 2
+
+
+def test_lista_devuelta_es_copia(bd, monkeypatch):
+    monkeypatch.setattr(db, "result_cache", ResultCache(True))
+    primera = db._consulta_compartida("propiedades", "SELECT 1", [])
+    primera.clear()
+    assert db._consulta_compartida("propiedades", "SELECT 1", []) == [{"id": 1}, {"id": 2}]
+    assert bd["ejecutadas"] == 1
+
+
+def test_invalidar_vuelve_a_consultar(bd, monkeypatch):
+    monkeypatch.setattr(db, "result_cache", ResultCache(True))
+    db._consulta_compartida("propiedades", "SELECT 1", [])
+    db._consulta_compartida("propiedades", "SELECT 1", [])
+    assert bd["ejecutadas"] == 1
+    db.result_cache.invalidate(["propiedades"])
+    db._consulta_compartida("propiedades", "SELECT 1", [])
+    assert bd["ejecutadas"] == 2
+
+
+def test_termino_like_normalizado():
+    assert db._norm_like("  Casa   CAMPESTRE ") == db._norm_like("casa campestre")
+    assert db._norm_like("   ") is None
@@ -0,0 +1,109 @@
+# ResultCache (generaciones por ámbito, invalidación) y Snapshot
+import threading
+
+import pytest
+
+import cache
+from cache import MISS, ResultCache, Snapshot
+
+
+@pytest.fixture
+def reloj(monkeypatch):
+    ahora = [500.0]
+    monkeypatch.setattr(cache.time, "monotonic", lambda: ahora[0])
+    return ahora
+
+
+def test_put_y_get():
+    c = ResultCache(True)
+    assert c.get("propiedades", "k") is MISS
+    c.put("propiedades", "k", c.generation("propiedades"), [1, 2])
+    assert c.get("propiedades", "k") == [1, 2]
+    # None es un resultado válido, distinto de MISS
+    c.put("propiedades", "nada", c.generation("propiedades"), None)
+    assert c.get("propiedades", "nada") is None
+    assert c.stats()["hits"] == 2 and c.stats()["misses"] == 1
+
+
+def test_deshabilitada_no_guarda():
+    c = ResultCache(False)
+    c.put("propiedades", "k", 0, [1])
+    assert c.get("propiedades", "k") is MISS
+    assert c.stats()["items"] == 0
+
+
+def test_invalidar_vacia_solo_su_ambito():
+    c = ResultCache(True)
+    c.put("propiedades", "k", 0, "p")
+    c.put("proyectos", "k", 0, "py")
+    assert c.invalidate(["propiedades", "desconocido"]) == ["propiedades"]
+    assert c.get("propiedades", "k") is MISS
+    assert c.get("proyectos", "k") == "py"
+    assert c.stats()["generaciones"] == {"propiedades": 1, "proyectos": 0}
+
+
+def test_put_con_generacion_vieja_se_descarta():
+    """Una consulta que empezó antes de invalidar no guarda su resultado (ya viejo)."""
+    c = ResultCache(True)
+    gen = c.generation("propiedades")
+    c.invalidate(["propiedades"])
+    c.put("propiedades", "k", gen, "viejo")
+    assert c.get("propiedades", "k") is MISS
+    assert c.stats()["stale_puts"] == 1
+    c.put("propiedades", "k", c.generation("propiedades"), "nuevo")
+    assert c.get("propiedades", "k") == "nuevo"
+
+
+def test_ttl(reloj):
+    c = ResultCache(True, ttl=30)
+    c.put("proyectos", "k", 0, "v")
+    reloj[0] += 29
+    assert c.get("proyectos", "k") == "v"
+    reloj[0] += 2
+    assert c.get("proyectos", "k") is MISS
+
+
+def test_tope_lru():
+    c = ResultCache(True, max_items=2)
+    c.put("propiedades", "a", 0, 1)
+    c.put("propiedades", "b", 0, 2)
+    c.get("propiedades", "a")
+    c.put("propiedades", "c", 0, 3)
+    # b era la menos usada
+    assert c.get("propiedades", "b") is MISS
+    assert c.get("propiedades", "a") == 1 and c.get("propiedades", "c") == 3
+
+
+def test_snapshot_carga_una_vez():
+    cargas = []
+    s = Snapshot(lambda: cargas.append(1) or len(cargas))
+    assert s.get() == 1 and s.get() == 1
+    assert s.loads == 1
+    s.invalidate({"chatbot_faqs"})
+    assert s.get() == 2
+    assert s.loads == 2
+
+
+def test_snapshot_aviso_durante_la_carga():
+    """Si llega un aviso mientras se carga, el valor se usa esa vez pero no se guarda."""
+    entro = threading.Event()
+    soltar = threading.Event()
+    valores = iter(["viejo", "nuevo"])
+
+    def loader():
+        entro.set()
+        soltar.wait(5)
+        return next(valores)
+
+    s = Snapshot(loader)
+    resultado = []
+    hilo = threading.Thread(target=lambda: resultado.append(s.get()))
+    hilo.start()
+    assert entro.wait(5)
+    s.invalidate()
+    soltar.set()
+    hilo.join(5)
+
+    assert resultado == ["viejo"]
+    assert s.get() == "nuevo"
+    assert s.loads == 2
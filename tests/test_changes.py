@@ -0,0 +1,137 @@
+# Detector de cambios: ámbitos del panel -> tablas, firmas por sondeo y aviso a suscriptores
+import pytest
+from starlette.testclient import TestClient
+
+import changes
+import db
+import main
+from changes import TABLAS, ChangeDetector, tablas_de_scope
+
+
+@pytest.mark.parametrize("scope, tablas", [
+    ("all", TABLAS),
+    ("propiedad:12", ("propiedades",)),
+    ("PROYECTO:3", ("proyectos",)),
+    (" faqs ", ("chatbot_faqs",)),
+    ("config", ("chatbot_config",)),
+])
+def test_tablas_de_scope(scope, tablas):
+    assert tablas_de_scope(scope) == tablas
+
+
+@pytest.mark.parametrize("scope", ["", "propiedad", "propiedad:abc", "faqs:1", "all:1", "usuarios"])
+def test_tablas_de_scope_invalido(scope):
+    with pytest.raises(ValueError):
+        tablas_de_scope(scope)
+
+
+@pytest.fixture
+def firmas(monkeypatch):
+    """db.firmas_tablas falso: el test cambia las firmas a mano; registra si el sondeo fue completo."""
+    estado = {t: [(1, 1, None), 1] for t in TABLAS}
+    estado["_completas"] = []
+
+    def firmas_tablas(completa=False):
+        estado["_completas"].append(completa)
+        return {t: (tuple(estado[t][0]), estado[t][1] if completa else None) for t in TABLAS}
+
+    monkeypatch.setattr(db, "firmas_tablas", firmas_tablas)
+    return estado
+
+
+def _detector(firmas, **kw):
+    det = ChangeDetector(0, **kw)
+    avisos = []
+    det.subscribe(("propiedades", "proyectos"), lambda t: avisos.append(("busquedas", t)))
+    det.subscribe(("chatbot_faqs",), lambda t: avisos.append(("faqs", t)))
+    return det, avisos
+
+
+def test_primer_sondeo_publica_todo(firmas):
+    det, avisos = _detector(firmas)
+    assert det.poll() == frozenset(TABLAS)
+    assert avisos == [
+        ("busquedas", frozenset({"propiedades", "proyectos"})),
+        ("faqs", frozenset({"chatbot_faqs"})),
+    ]
+
+
+def test_solo_avisa_a_quien_le_toca(firmas):
+    det, avisos = _detector(firmas)
+    det.poll()
+    avisos.clear()
+    assert det.poll() == frozenset()
+    assert avisos == []
+
+    firmas["proyectos"][0] = (2, 7, None)
+    assert det.poll() == frozenset({"proyectos"})
+    assert avisos == [("busquedas", frozenset({"proyectos"}))]
+    assert det.stats()["eventos"]["proyectos"] == 2
+
+
+def test_forzar_publica_sin_cambio_de_firma(firmas):
+    det, avisos = _detector(firmas)
+    det.poll()
+    avisos.clear()
+    assert det.poll(forzar={"chatbot_faqs"}, origen="panel") == frozenset({"chatbot_faqs"})
+    assert avisos == [("faqs", frozenset({"chatbot_faqs"}))]
+
+
+def test_texto_largo_solo_en_sondeo_completo(firmas, monkeypatch):
+    ahora = [0.0]
+    monkeypatch.setattr(changes.time, "monotonic", lambda: ahora[0])
+    det, avisos = _detector(firmas, intervalo_completo=60)
+    det.poll()
+    avisos.clear()
+
+    # Solo cambia la descripción: el sondeo ligero no la ve
+    firmas["chatbot_faqs"][1] = 2
+    ahora[0] = 10
+    assert det.poll() == frozenset()
+    ahora[0] = 61
+    assert det.poll() == frozenset({"chatbot_faqs"})
+    assert firmas["_completas"] == [True, False, True]
+    assert avisos == [("faqs", frozenset({"chatbot_faqs"}))]
+
+
+def test_error_de_bd_publica_lo_forzado(monkeypatch):
+    def caida(completa=False):
+        raise ConnectionError("mysql")
+
+    monkeypatch.setattr(db, "firmas_tablas", caida)
+    det = ChangeDetector(0)
+    avisos = []
+    det.subscribe(("propiedades",), avisos.append)
+    assert det.poll(forzar={"propiedades"}) == frozenset({"propiedades"})
+    assert avisos == [frozenset({"propiedades"})]
+    assert det.stats()["errores"] == 1
+
+
+def test_suscriptor_que_falla_no_corta_a_los_demas(firmas):
+    det = ChangeDetector(0)
+    avisos = []
+
+    def falla(t):
+        raise RuntimeError("recarga")
+
+    det.subscribe(("propiedades",), falla)
+    det.subscribe(("propiedades",), avisos.append)
+    det.poll()
+    assert avisos == [frozenset({"propiedades"})]
+
+
+def test_cache_invalidate_endpoint(monkeypatch):
+    forzadas = []
+    monkeypatch.setattr(main, "CACHE_INVALIDATE_TOKEN", "secreto")
+    monkeypatch.setattr(main.changes.detector, "poll", lambda forzar=(), origen="": forzadas.append(forzar) or forzar)
+    cliente = TestClient(main.app)
+
+    r = cliente.post("/cache/invalidate", json={"scopes": ["propiedad:5", "faqs"]})
+    assert r.status_code == 401
+    auth = {"Authorization": "Bearer secreto"}
+    r = cliente.post("/cache/invalidate", json={"scopes": ["usuarios"]}, headers=auth)
+    assert r.status_code == 400
+    r = cliente.post("/cache/invalidate", json={"scopes": ["propiedad:5", "faqs"]}, headers=auth)
+    assert r.status_code == 200
+    assert r.json()["tablas"] == ["chatbot_faqs", "propiedades"]
+    assert forzadas == [{"propiedades", "chatbot_faqs"}]
@@ -0,0 +1,92 @@
+# cors.py: qué orígenes pasan y qué headers lleva cada respuesta
+import pytest
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from cors import CORSMiddleware, allow_origin, origen_permitido
+
+LISTA = ["https://panel.example.com"]
+
+
+@pytest.mark.parametrize(
+    "origin",
+    [
+        "https://ctrbienesraices.com",
+        "https://www.ctrbienesraices.com",
+        "http://ctrbienesraices.com",
+        "https://admin.ctrbienesraices.com",
+        "https://CTRBienesRaices.com",
+        "https://ctrbienesraices.com:8443",
+        "https://ctrbienesraices.com/",
+        "https://panel.example.com",
+    ],
+)
+def test_origenes_permitidos(origin):
+    assert origen_permitido(origin, LISTA)
+
+
+@pytest.mark.parametrize(
+    "origin",
+    [
+        "",
+        "null",
+        "https://ctrbienesraices.com.evil.io",
+        "https://evilctrbienesraices.com",
+        "https://evil.io/ctrbienesraices.com",
+        "https://evil.io?ctrbienesraices.com",
+        "https://ctrbienesraices.com@evil.io",
+        "ftp://ctrbienesraices.com",
+        "https://panel.example.com.evil.io",
+        "https://[::1",
+    ],
+)
+def test_origenes_rechazados(origin):
+    assert not origen_permitido(origin, LISTA)
+
+
+def test_comodin():
+    assert origen_permitido("https://cualquiera.io", ["*"])
+
+
+def test_allow_origin_no_permitido_devuelve_el_primero():
+    assert allow_origin("https://ctrbienesraices.com.evil.io", LISTA) == LISTA[0]
+    assert allow_origin("https://admin.ctrbienesraices.com/", LISTA) == "https://admin.ctrbienesraices.com"
+
+
+def _cliente():
+    async def hola(request):
+        return JSONResponse({"ok": True}, headers={"Vary": "Accept-Encoding"})
+
+    app = Starlette(routes=[Route("/hola", hola, methods=["GET", "POST"])])
+    return TestClient(CORSMiddleware(app, LISTA))
+
+
+def test_respuesta_con_headers_cors():
+    r = _cliente().get("/hola", headers={"Origin": "https://www.ctrbienesraices.com"})
+    assert r.status_code == 200
+    assert r.headers["access-control-allow-origin"] == "https://www.ctrbienesraices.com"
+    assert r.headers["access-control-allow-credentials"] == "true"
+    assert r.headers["vary"] == "Accept-Encoding, Origin"
+
+
+def test_subdominio_falso_no_se_refleja():
+    r = _cliente().get("/hola", headers={"Origin": "https://ctrbienesraices.com.evil.io"})
+    assert r.headers["access-control-allow-origin"] == LISTA[0]
+
+
+def test_preflight_sin_entrar_en_la_app():
+    r = _cliente().options(
+        "/hola",
+        headers={
+            "Origin": "https://ctrbienesraices.com",
+            "Access-Control-Request-Method": "POST",
+            "Access-Control-Request-Headers": "X-Custom, Content-Type",
+        },
+    )
+    assert r.status_code == 200
+    assert r.json() == {}
+    assert r.headers["access-control-allow-origin"] == "https://ctrbienesraices.com"
+    assert r.headers["access-control-allow-headers"] == "X-Custom, Content-Type"
+    assert r.headers["access-control-max-age"] == "86400"
@@ -0,0 +1,121 @@
+# Cursor de "qué otra tienes": paginar de a una en el orden del catálogo (BD y copia en memoria)
+import sqlite3
+from contextlib import contextmanager
+
+import pytest
+
+import catalog
+import db
+import handlers
+from cache import ResultCache
+from singleflight import SingleFlight
+
+# destacado y orden con NULL intercalados: el cursor debe seguir el mismo orden que MySQL
+FILAS = [
+    (1, 1, 2), (2, 0, None), (3, None, 1), (4, 1, None), (5, 0, 1), (6, 1, 2),
+    (7, None, None), (8, 0, 1), (9, 1, 1), (10, None, 1), (11, 0, 3), (12, 1, None),
+]
+
+
+def _propiedad(pid, destacado, orden):
+    return {
+        "id": pid, "titulo": f"Casa {pid}", "slug": f"casa-{pid}", "tipo": "casa", "ubicacion": "Centro",
+        "precio": 100_000_000 + pid, "habitaciones": 3, "banos": 2, "area_construida": None,
+        "area_total": None, "imagen_principal": None, "descripcion": "", "destacado": destacado, "orden": orden,
+    }
+
+
+@pytest.fixture
+def bd(monkeypatch):
+    """MySQL reemplazado por SQLite (mismo orden de NULL: primero en ASC, al final en DESC)."""
+    conn = sqlite3.connect(":memory:", check_same_thread=False)
+    conn.row_factory = lambda cur, row: {c[0]: v for c, v in zip(cur.description, row)}
+    conn.execute(
+        "CREATE TABLE propiedades (id INTEGER PRIMARY KEY, titulo, slug, tipo, ubicacion, precio, habitaciones,"
+        " banos, area_construida, area_total, imagen_principal, descripcion, destacado, orden,"
+        " activo DEFAULT 1, estado DEFAULT 'disponible')"
+    )
+    for f in FILAS:
+        p = _propiedad(*f)
+        conn.execute(f"INSERT INTO propiedades ({', '.join(p)}) VALUES ({', '.join('?' * len(p))})", list(p.values()))
+
+    class Cursor:
+        def execute(self, q, params):
+            self._cur = conn.execute(q.replace("%s", "?"), params)
+
+        def fetchall(self):
+            return self._cur.fetchall()
+
+    @contextmanager
+    def cursor_dict():
+        yield Cursor()
+
+    monkeypatch.setattr(db, "cursor_dict", cursor_dict)
+    monkeypatch.setattr(db, "_search_flight", SingleFlight())
+    monkeypatch.setattr(db, "result_cache", ResultCache(False))
+    monkeypatch.setattr(db.admision, "solo_cache", lambda: False)
+    return conn
+
+
+def _orden_catalogo(bd):
+    return [r["id"] for r in db.buscar_propiedades(limite=100)]
+
+
+def _paginar(buscar, **kw):
+    vistos, cursor = [], None
+    while True:
+        filas = buscar(limite=1, despues=cursor, **kw)
+        if not filas:
+            return vistos
+        vistos.append(filas[0]["id"])
+        cursor = db.cursor_de(filas[0])
+        assert len(vistos) <= len(FILAS)
+
+
+def test_cursor_en_bd_recorre_todo_en_orden(bd):
+    esperado = _orden_catalogo(bd)
+    assert sorted(esperado) == [f[0] for f in FILAS]
+    assert _paginar(db.buscar_propiedades) == esperado
+
+
+def test_cursor_en_bd_con_excluidas(bd):
+    esperado = [i for i in _orden_catalogo(bd) if i not in (4, 7)]
+    assert _paginar(db.buscar_propiedades, exclude_ids=[4, 7]) == esperado
+
+
+def test_cursor_en_memoria_igual_que_bd(bd, monkeypatch):
+    esperado = _orden_catalogo(bd)
+    props = db.buscar_propiedades(limite=100)
+    monkeypatch.setitem(catalog._state, "version", 1)
+    monkeypatch.setitem(catalog._state, "propiedades", props)
+    assert _paginar(catalog.propiedades_en_memoria) == esperado
+    assert _paginar(catalog.propiedades_en_memoria, exclude_ids=[4, 7]) == [i for i in esperado if i not in (4, 7)]
+
+
+def test_otra_y_parecida_nunca_repiten(monkeypatch):
+    """Alternar "otra" (cursor) y "una parecida" (vecinas) no repite ninguna ya mostrada."""
+    cat = [_propiedad(i, 0, i) for i in range(1, 30)]
+
+    def buscar(**kw):
+        excluir = set(kw.get("exclude_ids") or ())
+        tras = kw.get("despues")
+        filas = [p for p in cat if p["id"] not in excluir and (tras is None or p["id"] > tras[2])]
+        return filas[:kw["limite"]]
+
+    def similares(ref_id, n, excluir=()):
+        return [p for p in cat if p["id"] not in set(excluir)][:n]
+
+    monkeypatch.setattr(handlers, "buscar_propiedades", buscar)
+    monkeypatch.setattr(handlers, "propiedades_similares", similares)
+    monkeypatch.setattr(handlers, "pide_similar", lambda t: "parecida" in t)
+    monkeypatch.setattr(handlers, "_cfg", lambda k, d=None: d)
+
+    ctx = {"propiedades_mostradas_ids": [20, 21, 22, 23], "referencia_id": 20, "tipo_referencia": "propiedad"}
+    vistas = [20, 21, 22, 23]
+    for texto in ["otra", "otra", "una parecida", "otra", "una parecida", "una parecida"] * 3:
+        r = handlers.handle_pedir_otra_opcion(texto, ctx, None, "https://x")
+        ctx = r["context"]
+        assert "cards" in r
+        assert ctx["referencia_id"] not in vistas, texto
+        vistas.append(ctx["referencia_id"])
+    assert len(vistas) == 4 + 18
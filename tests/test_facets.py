@@ -0,0 +1,107 @@
+# Facetas: conteos disjuntivos contra un conteo a mano, histograma, ETag y filtros no finitos
+import json
+
+import pytest
+from starlette.testclient import TestClient
+
+import facets
+import main
+
+PROPS = [
+    {"id": 1, "tipo": "venta", "ubicacion": "Zuñiga", "habitaciones": 3, "precio": 450_000_000},
+    {"id": 2, "tipo": "venta", "ubicacion": "zuniga ", "habitaciones": 2, "precio": 300_000_000},
+    {"id": 3, "tipo": "renta", "ubicacion": "Zuñiga", "habitaciones": 1, "precio": 2_500_000},
+    {"id": 4, "tipo": "renta", "ubicacion": "El Poblado", "habitaciones": 6, "precio": 4_000_000},
+    {"id": 5, "tipo": "venta", "ubicacion": "El Poblado", "habitaciones": None, "precio": 900_000_000},
+    {"id": 6, "tipo": "Venta", "ubicacion": "Envigado", "habitaciones": 5, "precio": None},
+    {"id": 7, "tipo": "lote", "ubicacion": "", "habitaciones": None, "precio": 120_000_000},
+]
+
+
+def _pasa(p, tipo=None, zona=None, habitaciones=None, precio_min=None, precio_max=None, sin=None):
+    """Conteo a mano: ¿la propiedad cumple todos los filtros salvo el de la faceta `sin`?"""
+    if sin != "tipo" and tipo and (p["tipo"] or "").lower() != tipo:
+        return False
+    if sin != "zona" and zona and facets._clave_zona(p["ubicacion"]) != facets._clave_zona(zona):
+        return False
+    if sin != "habitaciones" and habitaciones is not None and (p["habitaciones"] or 0) < habitaciones:
+        return False
+    if sin != "precio" and (precio_min is not None or precio_max is not None):
+        if p["precio"] is None:
+            return False
+        if precio_min is not None and p["precio"] < precio_min or precio_max is not None and p["precio"] > precio_max:
+            return False
+    return True
+
+
+@pytest.mark.parametrize("filtros", [
+    {},
+    {"tipo": "venta"},
+    {"zona": "ZUNIGA"},
+    {"habitaciones": 2},
+    {"precio_min": 100_000_000, "precio_max": 500_000_000},
+    {"tipo": "renta", "zona": "el poblado", "habitaciones": 1},
+    {"tipo": "casa"},
+])
+def test_conteos_disjuntivos(filtros):
+    r = json.loads(facets.build(PROPS).respuesta(**filtros)[1])
+    assert r["total"] == sum(_pasa(p, **filtros) for p in PROPS)
+
+    por_tipo = {t["valor"]: t["count"] for t in r["tipo"]}
+    for t in ("venta", "renta", "lote"):
+        esperado = sum(_pasa(p, **{**filtros, "tipo": t}) for p in PROPS)
+        assert por_tipo.get(t, 0) == esperado
+
+    por_zona = {z["valor"]: z["count"] for z in r["zona"]}
+    for z in ("Zuñiga", "El Poblado", "Envigado"):
+        assert por_zona.get(z, 0) == sum(_pasa(p, **{**filtros, "zona": z}) for p in PROPS)
+
+    por_hab = {h["minimo"]: h["count"] for h in r["habitaciones"]}
+    for n in range(1, facets.HAB_MAX + 1):
+        exactas = [p for p in PROPS if _pasa(p, **filtros, sin="habitaciones") and p["habitaciones"] is not None]
+        esperado = sum(min(p["habitaciones"], facets.HAB_MAX) == n for p in exactas)
+        assert por_hab.get(n, 0) == esperado
+
+    con_precio = [p for p in PROPS if _pasa(p, **filtros, sin="precio") and p["precio"] is not None]
+    assert sum(b["count"] for b in r["precio"]) == len(con_precio)
+
+
+def test_zona_muestra_la_escritura_mas_frecuente():
+    r = json.loads(facets.build(PROPS).respuesta(zona="zuniga")[1])
+    assert r["filtros"]["zona"] == "Zuñiga"
+    assert {"valor": "Zuñiga", "count": 3} in r["zona"]
+
+
+def test_histograma_cubre_todos_los_precios():
+    bins = facets._histograma(facets.np.asarray([1.0, 5.0, 99.0, 100.0, facets.np.nan]))
+    assert len(bins) <= facets.MAX_BINS + 1
+    assert bins[0]["desde"] <= 1.0 and bins[-1]["hasta"] >= 100.0
+    assert sum(b["count"] for b in bins) == 4
+    assert facets._histograma(facets.np.asarray([7.0, 7.0]))[0]["count"] == 2
+
+
+def test_respuesta_memorizada():
+    f = facets.build(PROPS)
+    assert f.respuesta(tipo="Venta")[1] is f.respuesta(tipo="venta")[1]
+
+
+@pytest.fixture
+def cliente(monkeypatch):
+    f = facets.build(PROPS)
+    monkeypatch.setattr(main, "catalog_ensure_fresh", lambda: None)
+    monkeypatch.setattr(main, "get_facetas", lambda: f)
+    return TestClient(main.app)
+
+
+def test_endpoint_etag(cliente):
+    r = cliente.get("/catalog/facets", params={"tipo": "renta"})
+    assert r.status_code == 200 and r.json()["total"] == 2
+    etag = r.headers["etag"]
+    r = cliente.get("/catalog/facets", params={"tipo": "renta"}, headers={"If-None-Match": f"W/{etag}"})
+    assert r.status_code == 304 and not r.content
+
+
+@pytest.mark.parametrize("valor", ["inf", "-inf", "nan"])
+def test_endpoint_precio_no_finito(cliente, valor):
+    assert cliente.get("/catalog/facets", params={"precio_min": valor}).status_code == 422
+    assert cliente.get("/catalog/facets", params={"precio_max": valor}).status_code == 422
@@ -0,0 +1,74 @@
+# Corrección difusa (borrados simétricos) de nombres del catálogo mal escritos
+import pytest
+
+import fuzzy
+import gazetteer
+import nlu
+from fuzzy import FuzzyIndex
+
+VOCAB = {"ibiza": 3, "pereira": 5, "cerritos": 2, "alamos": 1, "dosquebradas": 1}
+
+
+@pytest.fixture
+def idx():
+    return FuzzyIndex(VOCAB, known={"casa", "visita", "precio"})
+
+
+@pytest.mark.parametrize("token, esperado", [
+    ("ibisa", "ibiza"),       # sustitución
+    ("pereria", "pereira"),   # transposición
+    ("pereir", "pereira"),    # borrado
+    ("cerrritos", "cerritos"),  # inserción
+    ("dosqebrada", "dosquebradas"),  # dos errores en palabra larga
+])
+def test_corrige(idx, token, esperado):
+    assert idx.correct(token) == esperado
+
+
+@pytest.mark.parametrize("token", [
+    "ibiza",     # ya está en el vocabulario
+    "casa",      # palabra conocida del bot
+    "ibz",       # muy corta
+    "2024",      # número
+    "xbiza",     # la primera letra no se corrige
+    "perxxxa",   # demasiado lejos
+])
+def test_no_corrige(idx, token):
+    assert idx.correct(token) is None
+
+
+def test_empate_gana_la_mas_frecuente():
+    idx = FuzzyIndex({"lomas": 1, "lamas": 4})
+    assert idx.correct("lemas") == "lamas"
+
+
+def test_distancia_con_transposicion():
+    assert fuzzy._distance("pereria", "pereira", 2) == 1
+    assert fuzzy._distance("abcdef", "uvwxyz", 2) == 3
+
+
+def test_correct_tokens_deja_los_demas(idx):
+    assert idx.correct_tokens(["casa", "en", "ibisa"]) == ("casa", "en", "ibiza")
+
+
+def test_gazetteer_resuelve_con_correccion(monkeypatch):
+    g = gazetteer.build(
+        [{"id": 1, "titulo": "Casa bonita", "ubicacion": "Zuñiga"}],
+        [{"id": 10, "nombre": "Ibiza", "ubicacion": "Pereira"}],
+        version=1,
+        faqs=[{"pregunta": "¿Cuál es el horario?", "palabras_clave": "horario atencion"}],
+    )
+    assert g.find(nlu.analyze("quiero ver ibisa").tokens).proyecto_ids == [10]
+    assert g.resolve("zuniga").propiedad_ids == [1]
+    assert g.resolve("zunigaa").propiedad_ids == [1]
+    # Vocabulario de las FAQs: nunca se corrige hacia un nombre del catálogo
+    assert g.fuzzy.correct("horario") is None
+    monkeypatch.setattr(nlu, "_gazetteer", g)
+    assert nlu.analyze("busco algo en pereria").entities()["proyecto_ids"] == [10]
+
+
+def test_stats():
+    antes = fuzzy.stats()["lookups"]
+    FuzzyIndex({"ibiza": 1}).correct("ibisa")
+    s = fuzzy.stats()
+    assert s["lookups"] == antes + 1 and 0 < s["hit_rate"] <= 1
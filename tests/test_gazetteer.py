@@ -0,0 +1,81 @@
+# Gazetteer: menciones del mensaje -> ids del catálogo (trie de frases sin tildes)
+import pytest
+
+import gazetteer
+import nlu
+
+PROPIEDADES = [
+    {"id": 1, "titulo": "Casa campestre Vista Norte", "ubicacion": "Zuñiga, Pereira"},
+    {"id": 2, "titulo": "Apartamento moderno", "ubicacion": "Pereira"},
+    {"id": 3, "titulo": "Lote en Cerritos", "ubicacion": "Cerritos - Pereira"},
+    {"id": 4, "titulo": "Casa moderna", "ubicacion": "Dosquebradas"},
+]
+PROYECTOS = [
+    {"id": 10, "nombre": "Ibiza", "ubicacion": "Pereira"},
+    {"id": 11, "nombre": "Torres de Álamos", "ubicacion": "Álamos"},
+]
+
+
+@pytest.fixture
+def g():
+    return gazetteer.build(PROPIEDADES, PROYECTOS, version=3)
+
+
+def _tokens(texto):
+    return nlu.analyze(texto).tokens
+
+
+def test_lugar_agrupa_propiedades_y_proyectos(g):
+    m = g.find(_tokens("casas en pereira"))
+    assert m.label == "Pereira"
+    assert m.propiedad_ids == [1, 2, 3] and m.proyecto_ids == [10]
+    assert not m.de_titulo
+
+
+def test_sin_tildes_y_mencion_mas_larga(g):
+    m = g.find(_tokens("algo en zuniga"))
+    assert m.label == "Zuñiga" and m.propiedad_ids == [1]
+    m = g.find(_tokens("info de torres de alamos"))
+    assert m.label == "Torres de Álamos" and m.proyecto_ids == [11]
+
+
+def test_palabra_suelta_del_titulo_no_es_lugar(g):
+    # "moderno"/"campestre" solos acotarían la búsqueda a un par de propiedades
+    assert g.find(_tokens("algo moderno")) is None
+    assert g.find(_tokens("casa campestre")) is None
+    m = g.find(_tokens("me gusta vista norte"))
+    assert m.propiedad_ids == [1] and m.de_titulo
+
+
+def test_frases_genericas_no_tapan_el_lugar(g):
+    m = g.find(_tokens("lote en cerritos"))
+    assert m.label == "Cerritos" and m.propiedad_ids == [3]
+
+
+def test_find_all_sin_solapes(g):
+    menciones = g.find_all(_tokens("ibiza o dosquebradas"))
+    assert [m.label for m in menciones] == ["Ibiza", "Dosquebradas"]
+
+
+def test_resolve_termino(g):
+    assert g.resolve("Dosquebradas").propiedad_ids == [4]
+    assert g.resolve("  ") is None
+    assert g.resolve("Medellín") is None
+    assert g.version == 3
+
+
+def test_entidades_usan_el_gazetteer(g, monkeypatch):
+    monkeypatch.setattr(nlu, "_gazetteer", g)
+    e = nlu.analyze("busco casa en Ibiza").entities()
+    assert e["ubicacion"] == "Ibiza" and e["proyecto_ids"] == [10]
+    # Una frase de título cede ante un lugar explícito
+    e = nlu.analyze("una casa moderna en Dosquebradas").entities()
+    assert e["ubicacion"] == "Dosquebradas" and e["propiedad_ids"] == [4]
+
+
+def test_entidades_se_recalculan_si_cambia_el_gazetteer(g, monkeypatch):
+    monkeypatch.setattr(nlu, "_gazetteer", None)
+    a = nlu.analyze("apartamento en Cerritos por favor")
+    assert "propiedad_ids" not in a.entities() or not a.entities().get("propiedad_ids")
+    monkeypatch.setattr(nlu, "_gazetteer", g)
+    assert a.entities()["propiedad_ids"] == [3]
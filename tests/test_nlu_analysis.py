@@ -0,0 +1,177 @@
+# MessageAnalysis: cada extractor da lo mismo que el nlu anterior (texto crudo por extractor)
+import pytest
+
+import nlu
+
+# Contextos de turno para detect_intent
+CONTEXTOS = [
+    None,
+    {"esperando": "nombre"},
+    {"esperando": "telefono"},
+    {"referencia_id": 4, "tipo_referencia": "propiedad"},
+]
+
+# (texto, intención por contexto, entidades, (nombre, teléfono, email, fecha, hora, hora natural, confirmación)),
+# generado con el nlu.py de antes de MessageAnalysis. Sin fechas relativas ("mañana"): dependen del día.
+BASE = [
+    (
+        "Hola, buenas tardes",
+        ["saludo", "confirmar_datos", "confirmar_datos", "saludo"],
+        (None, None, None, None, None),
+        (None, None, None, None, None, None, None),
+    ),
+    (
+        "Busco una casa en venta en Pereira de 3 habitaciones",
+        ["buscar_propiedad", "confirmar_datos", "confirmar_datos", "buscar_propiedad"],
+        (3000000.0, None, 3, "venta", "venta en pereira de"),
+        (None, None, None, None, None, None, None),
+    ),
+    (
+        "apartamento en renta hasta 2 millones",
+        ["buscar_propiedad", "confirmar_datos", "confirmar_datos", "buscar_propiedad"],
+        (2000000.0, 2000000.0, None, "renta", "renta hasta"),
+        (None, None, None, None, None, None, None),
+    ),
+    (
+        "Tienen lotes entre 100 y 200 millones?",
+        ["buscar_propiedad", "confirmar_datos", "confirmar_datos", "buscar_propiedad"],
+        (100000000.0, 100000000.0, None, "lote", "lotes entre"),
+        (None, None, None, None, None, None, None),
+    ),
+    (
+        "Me llamo Ana María Gómez",
+        ["duda_general", "confirmar_datos", "confirmar_datos", "duda_general"],
+        (None, None, None, None, None),
+        (None, None, None, None, None, None, None),
+    ),
+    (
+        "soy Pedro Pérez, mi cel es 3001234567",
+        ["duda_general", "confirmar_datos", "confirmar_datos", "duda_general"],
+        (3001234567.0, None, None, None, None),
+        (None, "3001234567", None, None, None, None, None),
+    ),
+    (
+        "mi correo es ana.gomez@example.com",
+        ["duda_general", "confirmar_datos", "confirmar_datos", "duda_general"],
+        (None, None, None, None, None),
+        (None, None, "ana.gomez@example.com", None, None, None, None),
+    ),
+    (
+        "quiero agendar una visita el 2026-11-05 a las 3 pm",
+        ["agendar_cita", "confirmar_datos", "confirmar_datos", "agendar_cita"],
+        (2026.0, None, None, None, "agendar"),
+        (None, "202611053", None, "2026-11-05", "15:00", "15:00", True),
+    ),
+    (
+        "el 5/11/2026 a las 10:30",
+        ["duda_general", "confirmar_datos", "confirmar_datos", "duda_general"],
+        (5000000.0, None, None, None, None),
+        (None, "51120261030", None, "2026-11-05", "10:30", "10:30", None),
+    ),
+    (
+        "sí, confirmo",
+        ["duda_general", "confirmar_datos", "confirmar_datos", "duda_general"],
+        (None, None, None, None, None),
+        ("sí, confirmo", None, None, None, None, None, True),
+    ),
+    (
+        "no gracias",
+        ["despedida", "confirmar_datos", "confirmar_datos", "despedida"],
+        (None, None, None, None, None),
+        (None, None, None, None, None, None, False),
+    ),
+    (
+        "información de la propiedad Vista Norte",
+        ["buscar_propiedad", "confirmar_datos", "confirmar_datos", "buscar_propiedad"],
+        (None, None, None, None, "la propiedad vista norte"),
+        (None, None, None, None, None, None, False),
+    ),
+    (
+        "¿Cuál es el horario de atención?",
+        ["agendar_cita", "confirmar_datos", "confirmar_datos", "agendar_cita"],
+        (None, None, None, None, "atención"),
+        (None, None, None, None, None, None, None),
+    ),
+    (
+        "gracias, adiós",
+        ["despedida", "confirmar_datos", "confirmar_datos", "despedida"],
+        (None, None, None, None, None),
+        (None, None, None, None, None, None, None),
+    ),
+    (
+        "casa con 2 baños y 4 alcobas en el centro",
+        ["buscar_propiedad", "confirmar_datos", "confirmar_datos", "buscar_propiedad"],
+        (2000000.0, None, 2, "venta", "el centro"),
+        (None, None, None, None, None, None, None),
+    ),
+    (
+        "+57 300 123 4567",
+        ["duda_general", "confirmar_datos", "confirmar_datos", "duda_general"],
+        (573001234567.0, None, None, None, None),
+        ("+57 300 123 4567", "573001234567", None, None, None, None, None),
+    ),
+    (
+        "qué otra tienes?",
+        ["pedir_informacion", "confirmar_datos", "confirmar_datos", "pedir_informacion"],
+        (None, None, None, None, None),
+        ("qué otra tienes?", None, None, None, None, None, None),
+    ),
+    (
+        "busco casas desde 200 hasta 400 millones",
+        ["buscar_propiedad", "confirmar_datos", "confirmar_datos", "buscar_propiedad"],
+        (200000000.0, 400000000.0, None, "venta", "casas"),
+        (None, None, None, None, None, None, None),
+    ),
+    (
+        "arriendo en bogota por 3.5 millones",
+        ["buscar_propiedad", "confirmar_datos", "confirmar_datos", "buscar_propiedad"],
+        (35000000.0, 35000000.0, None, "renta", "bogota por"),
+        (None, None, None, None, None, None, None),
+    ),
+    (
+        "",
+        ["duda_general", "duda_general", "duda_general", "duda_general"],
+        (None, None, None, None, None),
+        (None, None, None, None, None, None, None),
+    ),
+]
+
+
+@pytest.fixture(autouse=True)
+def sin_catalogo(monkeypatch):
+    """Como el nlu anterior: sin gazetteer ni modelo de intención."""
+    monkeypatch.setattr(nlu, "_gazetteer", None)
+    monkeypatch.setattr(nlu, "_intent_model", None)
+
+
+def _extraer(texto):
+    ent = nlu.extract_entities(texto)
+    return (
+        (ent["presupuesto_min"], ent["presupuesto_max"], ent["habitaciones"], ent["tipo"], ent["ubicacion"]),
+        (
+            nlu.extract_nombre(texto), nlu.extract_telefono(texto), nlu.extract_email(texto), nlu.extract_fecha(texto),
+            nlu.extract_hora(texto), nlu.extract_hora_natural(texto), nlu.extract_confirmacion(texto),
+        ),
+    )
+
+
+@pytest.mark.parametrize("texto, intenciones, entidades, datos", BASE, ids=[r[0][:30] or "vacio" for r in BASE])
+def test_igual_que_el_nlu_anterior(texto, intenciones, entidades, datos):
+    assert [nlu.detect_intent(texto, c) for c in CONTEXTOS] == intenciones
+    assert _extraer(texto) == (entidades, datos)
+    # Con el análisis ya hecho (como en un turno) el resultado es el mismo
+    a = nlu.analyze(texto)
+    assert [nlu.detect_intent(a, c) for c in CONTEXTOS] == intenciones
+    assert _extraer(a) == (entidades, datos)
+
+
+def test_analisis_memoizado():
+    a = nlu.analyze("Busco casa en Pereira")
+    assert nlu.analyze("Busco casa en Pereira") is a
+    assert nlu._as_analysis(a) is a
+    assert nlu._as_analysis(None) is nlu.analyze("")
+
+
+def test_entidades_se_calculan_una_vez():
+    a = nlu.MessageAnalysis("apartamento en renta hasta 2 millones")
+    assert a.entities() is a.entities()
@@ -0,0 +1,88 @@
+# Cubetas de ratelimit.Limitador: ráfaga, recarga, gasto atómico de las dos cubetas
+import asyncio
+
+import pytest
+
+import ratelimit
+from ratelimit import Limitador
+
+
+@pytest.fixture
+def reloj(monkeypatch):
+    """time.monotonic / time.time controlados por el test."""
+    ahora = [1000.0]
+    monkeypatch.setattr(ratelimit.time, "monotonic", lambda: ahora[0])
+    monkeypatch.setattr(ratelimit.time, "time", lambda: ahora[0])
+    return ahora
+
+
+def _limitador(ip=(60, 3), sesion=(60, 2), sqlite_path=""):
+    lim = Limitador(100, sqlite_path)
+    lim.limites = {"ip": ip, "sesion": sesion}
+    return lim
+
+
+def test_rafaga_y_luego_espera(reloj):
+    lim = _limitador(sesion=(0, 0))
+    assert [lim.revisar("1.1.1.1", None) for _ in range(3)] == [0.0, 0.0, 0.0]
+    espera = lim.revisar("1.1.1.1", None)
+    # 60 por minuto = una ficha por segundo
+    assert espera == pytest.approx(1.0)
+    assert lim.stats()["limitadas_ip"] == 1
+
+
+def test_recarga_con_el_tiempo(reloj):
+    lim = _limitador(sesion=(0, 0))
+    for _ in range(3):
+        lim.revisar("1.1.1.1", None)
+    assert lim.revisar("1.1.1.1", None) > 0
+    reloj[0] += 1.0
+    assert lim.revisar("1.1.1.1", None) == 0.0
+    assert lim.revisar("1.1.1.1", None) > 0
+
+
+def test_sesion_limitada_no_gasta_la_ip(reloj):
+    lim = _limitador(ip=(60, 3), sesion=(60, 1))
+    assert lim.revisar("1.1.1.1", "s1") == 0.0
+    # La sesión ya no tiene fichas: los rechazos no vacían la cubeta de la IP (NAT compartido)
+    for _ in range(5):
+        assert lim.revisar("1.1.1.1", "s1") > 0
+    assert lim.revisar("1.1.1.1", "s2") == 0.0
+    assert lim.revisar("1.1.1.1", "s3") == 0.0
+    assert lim.revisar("1.1.1.1", "s4") > 0
+    assert lim.stats()["limitadas_sesion"] == 5
+    assert lim.stats()["limitadas_ip"] == 1
+
+
+def test_cero_es_sin_limite(reloj):
+    lim = _limitador(ip=(0, 0), sesion=(0, 0))
+    assert all(lim.revisar("1.1.1.1", "s1") == 0.0 for _ in range(100))
+
+
+def test_lru_de_claves(reloj):
+    lim = _limitador(sesion=(0, 0))
+    lim.max_claves = 2
+    for ip in ("a", "b", "c"):
+        lim.revisar(ip, None)
+    assert lim.stats()["claves"] == 2
+
+
+def test_sqlite_compartido_entre_procesos(reloj, tmp_path):
+    ruta = str(tmp_path / "cubetas.db")
+    a = _limitador(sesion=(0, 0), sqlite_path=ruta)
+    b = _limitador(sesion=(0, 0), sqlite_path=ruta)
+    assert a.stats()["sqlite"]
+    assert a.revisar("1.1.1.1", None) == 0.0
+    assert b.revisar("1.1.1.1", None) == 0.0
+    assert a.revisar("1.1.1.1", None) == 0.0
+    assert b.revisar("1.1.1.1", None) > 0
+
+
+def test_revisar_async(reloj, tmp_path):
+    lim = _limitador(sesion=(0, 0), sqlite_path=str(tmp_path / "c.db"))
+    esperas = asyncio.run(_varias(lim, 4))
+    assert esperas[:3] == [0.0, 0.0, 0.0] and esperas[3] > 0
+
+
+async def _varias(lim, n):
+    return [await lim.revisar_async("1.1.1.1", None) for _ in range(n)]
@@ -0,0 +1,148 @@
+# SingleFlight: coalescencia de llamadas iguales en curso (hilos y corrutinas), memo con TTL y errores
+import asyncio
+import threading
+
+import pytest
+
+import singleflight
+from singleflight import SingleFlight
+
+
+def test_do_coalesce_hilos():
+    sf = SingleFlight()
+    entro = threading.Event()
+    soltar = threading.Event()
+    ejecuciones = []
+
+    def lento():
+        ejecuciones.append(1)
+        entro.set()
+        soltar.wait(5)
+        return {"ok": True}
+
+    resultados = []
+    lider = threading.Thread(target=lambda: resultados.append(sf.do("k", lento)))
+    lider.start()
+    assert entro.wait(5)
+    otros = [threading.Thread(target=lambda: resultados.append(sf.do("k", lento))) for _ in range(3)]
+    for t in otros:
+        t.start()
+    # Los duplicados ya están esperando a la primera llamada
+    while sf.stats()["coalesced"] < 3:
+        threading.Event().wait(0.01)
+    soltar.set()
+    for t in [lider, *otros]:
+        t.join(5)
+
+    assert len(ejecuciones) == 1
+    assert len(resultados) == 4 and all(r is resultados[0] for r in resultados)
+    assert sf.stats()["inflight"] == 0
+
+
+def test_do_claves_distintas_no_se_juntan():
+    sf = SingleFlight()
+    assert sf.do("a", lambda: 1) == 1
+    assert sf.do("b", lambda: 2) == 2
+    assert sf.stats()["executed"] == 2 and sf.stats()["coalesced"] == 0
+
+
+def test_do_error_se_propaga_y_no_se_memoriza():
+    sf = SingleFlight(ttl=60)
+
+    def falla():
+        raise RuntimeError("bd caída")
+
+    with pytest.raises(RuntimeError):
+        sf.do("k", falla)
+    # Tras el error se vuelve a ejecutar (no queda memorizado ni en curso)
+    assert sf.do("k", lambda: "ok") == "ok"
+    stats = sf.stats()
+    assert stats["errors"] == 1 and stats["executed"] == 2 and stats["inflight"] == 0
+
+
+def test_memo_ttl(monkeypatch):
+    ahora = [100.0]
+    monkeypatch.setattr(singleflight.time, "monotonic", lambda: ahora[0])
+    sf = SingleFlight(ttl=10)
+    llamadas = []
+
+    def fn():
+        llamadas.append(1)
+        return len(llamadas)
+
+    assert sf.do("k", fn) == 1
+    ahora[0] += 5
+    assert sf.do("k", fn) == 1
+    ahora[0] += 6
+    assert sf.do("k", fn) == 2
+    assert sf.stats()["memo_hits"] == 1
+
+    sf.clear()
+    assert sf.do("k", fn) == 3
+
+
+def test_memo_tope_de_entradas():
+    sf = SingleFlight(ttl=60, max_items=2)
+    for k in "abc":
+        sf.do(k, lambda: k)
+    assert sf.stats()["memo"] == 2
+
+
+def test_do_async_coalesce():
+    sf = SingleFlight()
+    ejecuciones = []
+
+    async def lento():
+        ejecuciones.append(1)
+        await asyncio.sleep(0.05)
+        return ["respuesta"]
+
+    async def correr():
+        return await asyncio.gather(*(sf.do_async("k", lento) for _ in range(5)))
+
+    resultados = asyncio.run(correr())
+    assert len(ejecuciones) == 1
+    assert all(r is resultados[0] for r in resultados)
+    assert sf.stats()["coalesced"] == 4 and sf.stats()["inflight"] == 0
+
+
+def test_do_async_error_llega_a_todos():
+    sf = SingleFlight()
+
+    async def falla():
+        await asyncio.sleep(0.01)
+        raise ValueError("gemini")
+
+    async def correr():
+        return await asyncio.gather(*(sf.do_async("k", falla) for _ in range(3)), return_exceptions=True)
+
+    errores = asyncio.run(correr())
+    assert all(isinstance(e, ValueError) for e in errores)
+    assert sf.stats()["executed"] == 1 and sf.stats()["errors"] == 1
+
+
+def test_do_async_espera_llamada_de_hilo():
+    """Una petición async duplica una llamada síncrona en curso en otro hilo."""
+    sf = SingleFlight()
+    entro = threading.Event()
+    soltar = threading.Event()
+
+    def lento():
+        entro.set()
+        soltar.wait(5)
+        return "hilo"
+
+    hilo = threading.Thread(target=lambda: sf.do("k", lento))
+    hilo.start()
+    assert entro.wait(5)
+
+    async def correr():
+        tarea = asyncio.ensure_future(sf.do_async("k", lambda: asyncio.sleep(0, "no debe ejecutarse")))
+        await asyncio.sleep(0.02)
+        assert not tarea.done()
+        soltar.set()
+        return await asyncio.wait_for(tarea, 5)
+
+    assert asyncio.run(correr()) == "hilo"
+    hilo.join(5)
+    assert sf.stats()["executed"] == 1
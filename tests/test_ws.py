@@ -0,0 +1,93 @@
+# /ws/chat: origen, frames de un turno y descarte de tokens de Gemini
+import time
+
+import pytest
+from starlette.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+import handlers
+import main
+
+
+@pytest.fixture
+def cliente(monkeypatch):
+    """App sin BD: sesión fija, nada se guarda, saludo con el texto por defecto."""
+    monkeypatch.setattr(main, "crear_conversacion", lambda origen="web": "sesion1")
+    monkeypatch.setattr(main, "guardar_mensaje", lambda *a, **k: None)
+    monkeypatch.setattr(main.sessions, "contexto_para_turno", lambda s, c: {})
+    monkeypatch.setattr(main.sessions.store, "save_turn", lambda *a, **k: None)
+    monkeypatch.setattr(main.sessions, "cards_vistas", lambda s: set())
+    monkeypatch.setattr(main.limitador, "limites", {"ip": (0, 0), "sesion": (0, 0)})
+    monkeypatch.setattr(handlers, "catalog_ensure_fresh", lambda: None)
+    monkeypatch.setattr(handlers, "entrenamiento_match", lambda *a: None)
+    monkeypatch.setattr(handlers, "_cfg", lambda k, d=None: d)
+    return TestClient(main.app)
+
+
+def _frames(ws):
+    out = []
+    while True:
+        m = ws.receive_json()
+        out.append(m)
+        if m["type"] in ("fin", "error"):
+            return out
+
+
+@pytest.mark.parametrize("origin", ["https://ctrbienesraices.com.evil.io", "https://evil.io"])
+def test_origen_ajeno_se_cierra(cliente, origin):
+    with pytest.raises(WebSocketDisconnect) as e:
+        with cliente.websocket_connect("/ws/chat", headers={"origin": origin}) as ws:
+            ws.receive_text()
+    assert e.value.code == 1008
+
+
+def test_turno_sin_gemini(cliente, monkeypatch):
+    monkeypatch.setattr(handlers, "llm_generate_reply", None)
+    with cliente.websocket_connect("/ws/chat", headers={"origin": "https://www.ctrbienesraices.com"}) as ws:
+        ws.send_text("hola")
+        frames = _frames(ws)
+    assert [f["type"] for f in frames] == ["reglas", "fin"]
+    assert frames[-1]["session_id"] == "sesion1"
+    assert frames[-1]["text"] == frames[0]["text"]
+
+
+def test_frame_no_valido(cliente):
+    with cliente.websocket_connect("/ws/chat") as ws:
+        ws.send_text('{"message": "hola", "referencia_tipo": "otro"}')
+        assert ws.receive_json()["type"] == "error"
+
+
+def test_tokens_y_reset_ante_reintento(cliente, monkeypatch):
+    def gemini(user_message, draft_reply, on_token=None, on_reset=None, **kw):
+        on_token("Hola ")
+        on_reset()
+        on_token("Buenas")
+        return "Buenas"
+
+    monkeypatch.setattr(handlers, "llm_generate_reply", gemini)
+    with cliente.websocket_connect("/ws/chat") as ws:
+        ws.send_text("hola")
+        frames = _frames(ws)
+    assert [f["type"] for f in frames] == ["reglas", "token", "reset", "token", "fin"]
+    assert frames[-1]["text"] == "Buenas" and frames[-1]["llm_used"] is True
+
+
+def test_timeout_descarta_y_no_reenvia(cliente, monkeypatch):
+    def lento(user_message, draft_reply, on_token=None, on_reset=None, **kw):
+        on_token("Hola ")
+        time.sleep(0.5)
+        on_token("tarde")
+        return "Hola tarde"
+
+    monkeypatch.setattr(handlers, "llm_generate_reply", lento)
+    monkeypatch.setattr(handlers, "LLM_ESPERA_SEC", 0.1)
+    with cliente.websocket_connect("/ws/chat") as ws:
+        ws.send_text("hola")
+        frames = _frames(ws)
+        time.sleep(0.6)
+        ws.send_text("hola")
+        siguiente = _frames(ws)
+    assert [f["type"] for f in frames] == ["reglas", "token", "reset", "fin"]
+    assert frames[-1]["text"] == frames[0]["text"]
+    # El hilo abandonado siguió generando: nada de eso llega al turno siguiente
+    assert all(f.get("text") != "tarde" for f in siguiente)